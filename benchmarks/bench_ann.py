@@ -0,0 +1,91 @@
+# benchmarks/bench_ann.py
+"""
+Recall / latency of the ANN backends against exact search.
+
+    python -m benchmarks.bench_ann --n 200000 --backend numpy --nprobe 1,4,16,64
+    python -m benchmarks.bench_ann --n 200000 --backend faiss --kind hnsw --ef 16,64,256
+"""
+import argparse
+import time
+import numpy as np
+
+from modules.gallery import GalleryIndex
+from modules.ann import NumpyIVFIndex, FaissIndex
+
+def synthetic_gallery(n, dim=512, n_clusters=1000, seed=0):
+    """Clustered unit vectors, roughly like face embeddings of many people."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, size=n)
+    vecs = centers[labels] + 0.8 * rng.standard_normal((n, dim)).astype(np.float32)
+    return GalleryIndex.normalize(vecs)
+
+def make_queries(gallery_vecs, n_queries=1000, noise=0.3, seed=1):
+    """Noisy copies of gallery members (a revisit of a known visitor)."""
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(gallery_vecs), size=n_queries, replace=False)
+    q = gallery_vecs[picks] + noise * rng.standard_normal(gallery_vecs[picks].shape).astype(np.float32) / np.sqrt(gallery_vecs.shape[1])
+    return GalleryIndex.normalize(q)
+
+def timed_search(index, queries, k):
+    t0 = time.perf_counter()
+    sims, ids = index.search(queries, k)
+    return sims, ids, (time.perf_counter() - t0) * 1000.0 / len(queries)
+
+def recall(found, truth):
+    """Fraction of true top-k ids present in the found top-k."""
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+def run(n, dim, backend, kind, nlist, params, n_queries, k):
+    vecs = synthetic_gallery(n, dim)
+    gallery = GalleryIndex(dim=dim, capacity=n)
+    gallery.add(np.arange(1, n + 1), vecs)
+    queries = make_queries(gallery.vectors, n_queries)
+
+    _, truth, exact_ms = timed_search(gallery, queries, k)
+    print(f"exact: {exact_ms:.3f} ms/query  (N={n}, D={dim})")
+
+    if backend == "numpy":
+        index = NumpyIVFIndex(path=None, nlist=nlist, min_train_size=0)
+    else:
+        index = FaissIndex(path=None, kind=kind, nlist=nlist, min_train_size=0)
+    t0 = time.perf_counter()
+    index.sync(gallery)
+    print(f"{backend}/{kind}: build {time.perf_counter() - t0:.1f} s")
+
+    results = []
+    for p in params:
+        if backend == "faiss" and kind == "hnsw":
+            index.ef_search = p
+        else:
+            index.nprobe = p
+        if backend == "faiss":
+            index._set_search_params()
+        _, ids, ms = timed_search(index, queries, k)
+        r1 = recall(ids[:, :1], truth[:, :1])
+        rk = recall(ids, truth)
+        results.append({"param": p, "recall@1": r1, f"recall@{k}": rk, "ms_per_query": ms})
+        name = "ef" if kind == "hnsw" and backend == "faiss" else "nprobe"
+        print(f"  {name}={p:<5} recall@1={r1:.4f} recall@{k}={rk:.4f} "
+              f"{ms:.3f} ms/query ({exact_ms / ms:.1f}x vs exact)")
+    return results
+
+def main():
+    ap = argparse.ArgumentParser(description="ANN recall/latency vs exact search")
+    ap.add_argument("--n", type=int, default=100000)
+    ap.add_argument("--dim", type=int, default=512)
+    ap.add_argument("--backend", choices=["numpy", "faiss"], default="numpy")
+    ap.add_argument("--kind", choices=["ivf", "hnsw"], default="ivf")
+    ap.add_argument("--nlist", type=int, default=1024)
+    ap.add_argument("--nprobe", default="1,4,16,64", help="comma-separated nprobe values (IVF)")
+    ap.add_argument("--ef", default="16,64,256", help="comma-separated efSearch values (HNSW)")
+    ap.add_argument("--queries", type=int, default=1000)
+    ap.add_argument("--k", type=int, default=10)
+    args = ap.parse_args()
+    raw = args.ef if args.backend == "faiss" and args.kind == "hnsw" else args.nprobe
+    params = [int(p) for p in raw.split(",")]
+    run(args.n, args.dim, args.backend, args.kind, args.nlist, params, args.queries, args.k)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# benchmarks/bench_detector.py
+"""
+Accuracy parity and throughput of the detector backends (PyTorch vs ONNX fp32 / INT8).
+
+    python -m benchmarks.bench_detector --video videos/sample.mp4 --frames 200
+    python -m benchmarks.bench_detector --video videos/sample.mp4 --batch 1,4 --threads 4
+
+The PyTorch detector is the reference: for every other backend the boxes are
+matched greedily by IoU and recall / precision / mean IoU / mean |conf delta|
+are reported, next to frames per second.
+"""
+import argparse
+import time
+import numpy as np
+import cv2
+
+from modules.detector import Detector, OnnxDetector
+from modules.utils import load_config, iou
+
+def read_frames(video, n_frames, stride=1):
+    cap = cv2.VideoCapture(video)
+    frames = []
+    idx = 0
+    while len(frames) < n_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if idx % stride == 0:
+            frames.append(frame)
+        idx += 1
+    cap.release()
+    return frames
+
+def run_backend(detector, frames, batch):
+    """Returns (per-frame (boxes, confs), frames/s)."""
+    detector.warmup((frames[0].shape[1], frames[0].shape[0]))
+    out = []
+    t0 = time.perf_counter()
+    for i in range(0, len(frames), batch):
+        out.extend(detector.detect_batch(frames[i:i + batch]))
+    return out, len(frames) / (time.perf_counter() - t0)
+
+def parity(reference, candidate, iou_threshold=0.5):
+    """Greedy IoU matching of candidate boxes to reference boxes over all frames."""
+    matched = ref_total = cand_total = 0
+    ious, conf_deltas = [], []
+    for (rb, rc), (cb, cc) in zip(reference, candidate):
+        ref_total += len(rb)
+        cand_total += len(cb)
+        used = set()
+        for i in np.argsort(-rc):
+            best, best_j = iou_threshold, None
+            for j in range(len(cb)):
+                if j not in used:
+                    v = iou(rb[i], cb[j])
+                    if v >= best:
+                        best, best_j = v, j
+            if best_j is not None:
+                used.add(best_j)
+                matched += 1
+                ious.append(best)
+                conf_deltas.append(abs(float(rc[i]) - float(cc[best_j])))
+    return {
+        "recall": matched / ref_total if ref_total else 1.0,
+        "precision": matched / cand_total if cand_total else 1.0,
+        "mean_iou": float(np.mean(ious)) if ious else None,
+        "mean_conf_delta": float(np.mean(conf_deltas)) if conf_deltas else None,
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description="Detector backend parity and throughput")
+    ap.add_argument("--video", required=True)
+    ap.add_argument("--frames", type=int, default=200)
+    ap.add_argument("--stride", type=int, default=1, help="take every n-th frame")
+    ap.add_argument("--batch", default="1", help="comma-separated batch sizes")
+    ap.add_argument("--threads", type=int, default=None, help="onnxruntime intra-op threads")
+    ap.add_argument("--no-int8", action="store_true")
+    args = ap.parse_args()
+
+    cfg = load_config()
+    if args.threads is not None:
+        cfg = dict(cfg, onnx_intra_threads=args.threads)
+    frames = read_frames(args.video, args.frames, args.stride)
+    if not frames:
+        raise SystemExit(f"❌ No frames read from {args.video}")
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}")
+
+    backends = [("torch", lambda: Detector(cfg=cfg)),
+                ("onnx-fp32", lambda: OnnxDetector(cfg=cfg, int8=False))]
+    if not args.no_int8:
+        backends.append(("onnx-int8", lambda: OnnxDetector(cfg=cfg, int8=True)))
+
+    reference = None
+    for name, make in backends:
+        detector = make()
+        for batch in [int(b) for b in args.batch.split(",")]:
+            dets, fps = run_backend(detector, frames, batch)
+            line = f"  {name:<10} batch={batch:<3} {fps:7.1f} frames/s"
+            if reference is None:
+                reference = dets
+                line += f"  ({sum(len(b) for b, _ in dets)} reference boxes)"
+            elif name != "torch":
+                p = parity(reference, dets)
+                line += (f"  recall={p['recall']:.3f} precision={p['precision']:.3f}"
+                         f" mean_iou={p['mean_iou'] or 0:.3f} conf_delta={p['mean_conf_delta'] or 0:.3f}")
+            print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# benchmarks/bench_tracker.py
+"""
+Tracker latency and identity stability with many simultaneous faces.
+
+    python -m benchmarks.bench_tracker --faces 60 --frames 300
+"""
+import argparse
+import time
+import numpy as np
+
+from modules.tracker import SimpleTracker, AssignmentTracker
+
+def simulate(n_faces, n_frames, size=60, speed=6.0, noise=2.0, miss_rate=0.05, seed=0,
+             width=1920, height=1080):
+    """
+    Faces moving with constant velocity (bouncing off the frame edges).
+    Yields (detections, true_ids) per frame; detections are shuffled and
+    some are dropped to mimic missed detections.
+    """
+    rng = np.random.default_rng(seed)
+    pos = rng.uniform([0, 0], [width - size, height - size], size=(n_faces, 2))
+    vel = rng.normal(0, speed, size=(n_faces, 2))
+    for _ in range(n_frames):
+        pos += vel
+        for axis, limit in ((0, width - size), (1, height - size)):
+            out = (pos[:, axis] < 0) | (pos[:, axis] > limit)
+            vel[out, axis] *= -1
+            pos[:, axis] = np.clip(pos[:, axis], 0, limit)
+        obs = pos + rng.normal(0, noise, size=pos.shape)
+        keep = rng.random(n_faces) > miss_rate
+        order = rng.permutation(np.flatnonzero(keep))
+        boxes = [[float(obs[i, 0]), float(obs[i, 1]), float(obs[i, 0] + size), float(obs[i, 1] + size)]
+                 for i in order]
+        yield boxes, order
+
+def run(tracker, frames):
+    """Returns (ms per update, id switches)."""
+    assigned = {}     # true id -> tracker id
+    switches = 0
+    total = 0.0
+    for boxes, true_ids in frames:
+        t0 = time.perf_counter()
+        objects, _ = tracker.update(boxes)
+        total += time.perf_counter() - t0
+        # map each detection back to the tracker id that now holds that exact box
+        by_box = {tuple(b): oid for oid, b in objects.items()}
+        for box, tid in zip(boxes, true_ids):
+            oid = by_box.get(tuple(box))
+            if oid is None:
+                continue
+            if tid in assigned and assigned[tid] != oid:
+                switches += 1
+            assigned[tid] = oid
+    return total * 1000.0 / len(frames), switches
+
+def main():
+    ap = argparse.ArgumentParser(description="Tracker benchmark")
+    ap.add_argument("--faces", type=int, default=60)
+    ap.add_argument("--frames", type=int, default=300)
+    ap.add_argument("--speed", type=float, default=6.0)
+    args = ap.parse_args()
+
+    frames = list(simulate(args.faces, args.frames, speed=args.speed))
+    trackers = {
+        "simple": lambda: SimpleTracker(max_disappeared=5, distance_threshold=80),
+        "assignment/centroid": lambda: AssignmentTracker(max_disappeared=5, distance_threshold=80),
+        "assignment/iou": lambda: AssignmentTracker(max_disappeared=5, metric="iou"),
+        "assignment/centroid+kalman": lambda: AssignmentTracker(max_disappeared=5, distance_threshold=80,
+                                                                kalman=True),
+    }
+    print(f"{args.faces} faces, {args.frames} frames")
+    for name, make in trackers.items():
+        try:
+            ms, switches = run(make(), frames)
+        except ImportError as e:
+            print(f"  {name:<28} skipped ({e})")
+            continue
+        print(f"  {name:<28} {ms:7.3f} ms/update  id switches={switches}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+# benchmarks/suite.py
+"""
+Offline benchmark suite: synthetic video + stub models + synthetic galleries.
+
+    python -m benchmarks.suite --out benchmarks/baseline.json
+    python -m benchmarks.suite --compare benchmarks/baseline.json --tolerance 0.15
+    python -m benchmarks.suite --quick --only find_match,tracker
+
+Everything runs inside a temporary working directory (its own config-less
+defaults, DB, logs and outputs), so the repository's data is never touched.
+With --compare, the run exits with status 1 if any metric regressed by more
+than the tolerance against the baseline.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import numpy as np
+
+from .bench_tracker import simulate
+
+def _median_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000.0)
+    return statistics.median(times)
+
+def _result(value, unit, better="lower"):
+    return {"value": value, "unit": unit, "better": better}
+
+# ---------------- Benchmarks ---------------- #
+def bench_find_match(sizes, n_queries=200, repeat=3):
+    from modules.database import Database
+    from .synthetic import fill_database
+    from .bench_ann import make_queries
+    results = {}
+    for n in sizes:
+        path = f"gallery_{n}.db"
+        fill_database(path, n)
+        db = Database(path)
+        queries = make_queries(db.gallery.vectors, min(n_queries, n))
+        ms = _median_ms(lambda: [db.find_match(q, 0.5) for q in queries], repeat) / len(queries)
+        results[f"find_match.n{n}.ms_per_query"] = _result(ms, "ms")
+        db.close()
+        os.remove(path)
+        print(f"  find_match N={n}: {ms:.3f} ms/query")
+    return results
+
+def bench_tracker(n_faces=30, n_frames=300, repeat=3):
+    from modules.tracker import SimpleTracker, AssignmentTracker
+    frames = [boxes for boxes, _ in simulate(n_faces, n_frames)]
+    results = {}
+    for name, make in (("simple", lambda: SimpleTracker(max_disappeared=10, distance_threshold=80)),
+                       ("assignment", lambda: AssignmentTracker(max_disappeared=10, distance_threshold=80))):
+        def run():
+            tracker = make()
+            for boxes in frames:
+                tracker.update(boxes)
+        ms = _median_ms(run, repeat) / n_frames
+        results[f"tracker.{name}.faces{n_faces}.ms_per_update"] = _result(ms, "ms")
+        print(f"  tracker {name} ({n_faces} faces): {ms:.3f} ms/update")
+    return results
+
+def bench_log_face_event(n_events=500):
+    from modules import logger
+    from modules.database import Database, init_db
+    init_db("events.db")
+    db = Database("events.db")
+    logger.set_database(db)
+    frame = np.full((480, 640, 3), 128, dtype=np.uint8)
+    bbox = [100, 100, 180, 200]
+    results = {}
+
+    t0 = time.perf_counter()
+    for i in range(n_events):
+        logger.log_face_event(i, "entry", bbox, frame)
+    ms = (time.perf_counter() - t0) * 1000.0 / n_events
+    results["log_face_event.sync.ms_per_event"] = _result(ms, "ms")
+    print(f"  log_face_event sync: {ms:.3f} ms/event")
+
+    logger.start_event_sink(db, {"logs_dir": "logs"})
+    t0 = time.perf_counter()
+    for i in range(n_events):
+        logger.log_face_event(i, "exit", bbox, frame)
+    submit_ms = (time.perf_counter() - t0) * 1000.0 / n_events
+    logger.flush_events()
+    total_ms = (time.perf_counter() - t0) * 1000.0 / n_events
+    logger.close()
+    results["log_face_event.sink.submit_ms_per_event"] = _result(submit_ms, "ms")
+    results["log_face_event.sink.total_ms_per_event"] = _result(total_ms, "ms")
+    print(f"  log_face_event sink: {submit_ms:.3f} ms/event submit, {total_ms:.3f} ms/event incl. flush")
+    logger.set_database(None)
+    db.close()
+    return results
+
+def bench_export_reports(n_visitors=10000, n_events=200000):
+    from outputs.report_generator import export_reports
+    from .synthetic import fill_database
+    fill_database("export.db", n_visitors, n_events)
+    results = {}
+    for fmt in ("csv", "csv.gz"):
+        t0 = time.perf_counter()
+        export_reports("export.db", f"reports_{fmt}", fmt=fmt)
+        s = time.perf_counter() - t0
+        results[f"export_reports.{fmt}.events{n_events}.seconds"] = _result(s, "s")
+        print(f"  export_reports {fmt} ({n_visitors} visitors, {n_events} events): {s:.2f} s")
+    return results
+
+def bench_process_video(n_frames=300, n_faces=4):
+    try:
+        import main
+    except ImportError as e:
+        print(f"  process_video skipped: {e}")
+        return {}
+    from modules.database import Database, init_db
+    from modules import logger
+    from modules.tracker import make_tracker
+    from modules.utils import load_config
+    from data.manager import DataManager
+    from .synthetic import make_video, StubDetector, StubRecognizer
+
+    video = make_video(os.path.join("videos", "synthetic.mp4"), n_frames=n_frames, n_faces=n_faces)
+    results = {}
+    for mode, extra in (("sequential", {}),
+                        ("pipeline", {"pipeline": True}),
+                        ("batched", {"detect_batch_size": 8})):
+        cfg = dict(load_config(), show_video=False, frame_skip=1, **extra)
+        db_path = f"video_{mode}.db"
+        init_db(db_path)
+        db = Database(db_path)
+        logger.set_database(db)
+        logger.start_event_sink(db, cfg)
+        t0 = time.perf_counter()
+        main.process_video(video, StubDetector(), StubRecognizer(), make_tracker(cfg), db,
+                           DataManager(base_dir=f"data_{mode}"), cfg)
+        fps = n_frames / (time.perf_counter() - t0)
+        logger.close()
+        logger.set_database(None)
+        visitors = db.get_unique_count()
+        db.close()
+        results[f"process_video.{mode}.fps"] = _result(fps, "frames/s", better="higher")
+        print(f"  process_video {mode}: {fps:.1f} frames/s ({visitors} visitors)")
+    return results
+
+BENCHMARKS = ("find_match", "tracker", "log_face_event", "export_reports", "process_video")
+
+def run_suite(only=None, quick=False, gallery_sizes=None):
+    gallery_sizes = gallery_sizes or ([1000, 10000] if quick else [1000, 10000, 100000])
+    plan = {
+        "find_match": lambda: bench_find_match(gallery_sizes),
+        "tracker": lambda: bench_tracker(n_frames=100 if quick else 300),
+        "log_face_event": lambda: bench_log_face_event(100 if quick else 500),
+        "export_reports": lambda: bench_export_reports(*((1000, 20000) if quick else (10000, 200000))),
+        "process_video": lambda: bench_process_video(n_frames=100 if quick else 300),
+    }
+    results = {}
+    for name in BENCHMARKS:
+        if only and name not in only:
+            continue
+        print(f"▶️ {name}")
+        results.update(plan[name]())
+    return results
+
+def compare(results, baseline, tolerance):
+    """Print old vs new per metric; returns the names of regressed metrics."""
+    regressions = []
+    for name, new in sorted(results.items()):
+        old = baseline.get(name)
+        if old is None:
+            print(f"  {name}: {new['value']:.4g} {new['unit']} (new)")
+            continue
+        ratio = new["value"] / old["value"] if old["value"] else float("inf")
+        if new["better"] == "lower":
+            regressed = ratio > 1 + tolerance
+        else:
+            regressed = ratio < 1 - tolerance
+        flag = "❌ REGRESSION" if regressed else "ok"
+        print(f"  {name}: {old['value']:.4g} -> {new['value']:.4g} {new['unit']} ({ratio:.2f}x) {flag}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline benchmark suite (synthetic data, stub models)")
+    ap.add_argument("--out", help="write results as a JSON baseline to this path")
+    ap.add_argument("--compare", metavar="BASELINE", help="compare against a baseline JSON")
+    ap.add_argument("--tolerance", type=float, default=0.15,
+                    help="allowed relative slowdown before a metric counts as a regression")
+    ap.add_argument("--only", help=f"comma-separated subset of {','.join(BENCHMARKS)}")
+    ap.add_argument("--quick", action="store_true", help="smaller sizes for a fast smoke run")
+    ap.add_argument("--gallery-sizes", help="comma-separated gallery sizes, e.g. 1000,100000,1000000")
+    args = ap.parse_args()
+
+    out = os.path.abspath(args.out) if args.out else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+    work = tempfile.mkdtemp(prefix="face_entry_bench_")
+    cwd = os.getcwd()
+    os.chdir(work)
+    try:
+        results = run_suite(
+            only=set(args.only.split(",")) if args.only else None,
+            quick=args.quick,
+            gallery_sizes=[int(n) for n in args.gallery_sizes.split(",")] if args.gallery_sizes else None,
+        )
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work, ignore_errors=True)
+
+    if out:
+        doc = {
+            "meta": {"created": datetime.datetime.now().replace(microsecond=0).isoformat(),
+                     "python": platform.python_version(), "platform": platform.platform(),
+                     "numpy": np.__version__, "quick": args.quick},
+            "results": results,
+        }
+        with open(out, "w") as f:
+            json.dump(doc, f, indent=2)
+        print(f"✅ Results written to {out}")
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)["results"]
+        print(f"📊 Comparison with {baseline_path} (tolerance {args.tolerance:.0%}):")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+        print("✅ No regressions")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# benchmarks/synthetic.py
+"""
+Offline stand-ins for footage and models, so benchmarks run on a plain CPU
+box without network access or model weights:
+  - make_video: moving face-like ellipses on a dark background
+  - StubDetector / StubRecognizer: deterministic boxes and embeddings with the
+    same interface as modules.detector.Detector / modules.recognizer.Recognizer
+  - fill_database: visitors / events tables of any size for DB-side benchmarks
+"""
+import os
+import sqlite3
+import numpy as np
+import cv2
+
+from modules.database import init_db, encode_embedding
+from .bench_ann import synthetic_gallery
+
+# face colours: blue channel marks "skin", green/red encode the identity
+_MARK = 230
+_LEVELS = (40, 100, 160, 220)
+PALETTE = [(_MARK, g, r) for g in _LEVELS for r in _LEVELS]
+
+def make_video(path, n_frames=300, width=640, height=480, n_faces=4, fps=25, face_size=80, seed=0):
+    """
+    Write an mp4 of `n_faces` ellipses bouncing around the frame; each face has
+    its own colour (identity). Returns the path.
+    """
+    rng = np.random.default_rng(seed)
+    n_faces = min(n_faces, len(PALETTE))
+    colors = [PALETTE[i] for i in rng.choice(len(PALETTE), size=n_faces, replace=False)]
+    pos = rng.uniform([0, 0], [width - face_size, height - face_size], size=(n_faces, 2))
+    vel = rng.normal(0, 4.0, size=(n_faces, 2))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    half = face_size // 2
+    for _ in range(n_frames):
+        frame = np.full((height, width, 3), 30, dtype=np.uint8)
+        pos += vel
+        for axis, limit in ((0, width - face_size), (1, height - face_size)):
+            out = (pos[:, axis] < 0) | (pos[:, axis] > limit)
+            vel[out, axis] *= -1
+            pos[:, axis] = np.clip(pos[:, axis], 0, limit)
+        for (x, y), color in zip(pos.astype(int), colors):
+            center = (x + half, y + half)
+            cv2.ellipse(frame, center, (half * 3 // 4, half), 0, 0, 360, color, -1)
+            for dx in (-half // 3, half // 3):
+                cv2.circle(frame, (center[0] + dx, center[1] - half // 4), max(2, half // 8), (20, 20, 20), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+class StubDetector:
+    """Finds the synthetic faces by their marker colour; same API as Detector."""
+    def __init__(self, min_area=100):
+        self.conf = 0.45
+        self.min_area = min_area
+
+    def detect(self, frame):
+        boxes, confs = self.detect_batch([frame])[0]
+        return [{'bbox': [float(b[0]), float(b[1]), float(b[2]), float(b[3])], 'conf': float(c), 'kps': None}
+                for b, c in zip(boxes, confs)]
+
+    def detect_batch(self, frames, keypoints=False):
+        """Marker blobs have no landmarks: with keypoints=True, kps is always None."""
+        out = []
+        for frame in frames:
+            mask = (frame[:, :, 0] > 180).astype(np.uint8)
+            n, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+            stats = stats[1:n]
+            stats = stats[stats[:, cv2.CC_STAT_AREA] >= self.min_area]
+            boxes = np.empty((len(stats), 4), dtype=np.float32)
+            boxes[:, 0] = stats[:, cv2.CC_STAT_LEFT]
+            boxes[:, 1] = stats[:, cv2.CC_STAT_TOP]
+            boxes[:, 2] = stats[:, cv2.CC_STAT_LEFT] + stats[:, cv2.CC_STAT_WIDTH]
+            boxes[:, 3] = stats[:, cv2.CC_STAT_TOP] + stats[:, cv2.CC_STAT_HEIGHT]
+            confs = np.full(len(stats), 0.9, dtype=np.float32)
+            out.append((boxes, confs, None) if keypoints else (boxes, confs))
+        return out
+
+class StubRecognizer:
+    """
+    Deterministic embeddings: the median colour of a crop selects a fixed random
+    unit vector, so every crop of the same synthetic face maps to the same identity.
+    """
+    def __init__(self, dim=512):
+        self.dim = dim
+        self.batch_size = 32
+        self._cache = {}
+
+    def _identity_vector(self, seed):
+        emb = self._cache.get(seed)
+        if emb is None:
+            rng = np.random.default_rng(seed)
+            emb = rng.standard_normal(self.dim).astype(np.float32)
+            emb /= np.linalg.norm(emb)
+            self._cache[seed] = emb
+        return emb
+
+    def _key(self, crop):
+        if crop.size == 0:
+            return None
+        skin = crop[crop[:, :, 0] > 180]
+        if len(skin) == 0:
+            return None
+        g, r = np.median(skin[:, 1]), np.median(skin[:, 2])
+        return int(round(g / 60.0)) * 100 + int(round(r / 60.0))
+
+    def get_embedding(self, face_img):
+        key = self._key(face_img)
+        return None if key is None else self._identity_vector(key).astype(float)
+
+    def get_embeddings(self, crops, batch_size=None, landmarks=None):
+        # same contract as Recognizer.get_embeddings: None for crops without a face
+        out = []
+        for crop in crops:
+            key = self._key(crop)
+            out.append(None if key is None else self._identity_vector(key))
+        return out
+
+def fill_database(db_path, n_visitors, n_events=0, dim=512, emb_dtype="float32", seed=0):
+    """Create a DB with `n_visitors` clustered embeddings and `n_events` entry/exit rows."""
+    init_db(db_path, emb_dtype=emb_dtype)
+    conn = sqlite3.connect(db_path)
+    chunk = 10000
+    for start in range(0, n_visitors, chunk):
+        vecs = synthetic_gallery(min(chunk, n_visitors - start), dim, seed=seed + start)
+        conn.executemany("INSERT INTO visitors (embedding, first_seen, image_path) VALUES (?, ?, ?)",
+                         [(encode_embedding(v, emb_dtype), "2024-01-01T00:00:00", f"face_{start + i}.jpg")
+                          for i, v in enumerate(vecs)])
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_events, chunk):
+        n = min(chunk, n_events - start)
+        faces = rng.integers(1, max(2, n_visitors + 1), size=n)
+        conn.executemany(
+            "INSERT INTO events (face_id, event_type, timestamp, image_path) VALUES (?, ?, ?, ?)",
+            [(int(f), "entry" if (start + i) % 2 == 0 else "exit",
+              f"2024-01-{1 + (start + i) % 28:02d}T{(start + i) % 24:02d}:00:00", "logs/x.jpg")
+             for i, f in enumerate(faces)])
+    conn.commit()
+    conn.close()
+    return db_path
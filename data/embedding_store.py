@@ -0,0 +1,287 @@
+# data/embedding_store.py
+import argparse
+import json
+import os
+import re
+import struct
+import threading
+import zlib
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: appends are only serialized within the process
+    fcntl = None
+
+# index record: face_id, row in the matrix file, crc32 of the row bytes
+_REC = struct.Struct('<qqI')
+_NPY_NAME = re.compile(r"^face_(\d+)\.npy$")
+
+class EmbeddingStore:
+    """
+    Append-only embedding store:
+      - vectors.f32: one float32 row per save, dim columns, no header
+      - index.bin:   fixed-size (face_id, row, crc32) records, one per row
+      - meta.json:   dim / dtype
+      - merges.json: {merged face_id: kept face_id} recorded by db.dedupe
+    Appends write the row first and the index record last (fsync-ed unless
+    fsync=False), so a crash leaves at most a torn tail, which is detected by
+    size / checksum and truncated on the next open. Re-saving a face_id appends a new row;
+    the latest row wins. Appends from several processes are serialized
+    with an flock on the index file. Merged ids keep their rows but are
+    hidden from ids() / latest(), and get() resolves them to the kept id.
+    """
+    def __init__(self, directory, dim=None, fsync=True):
+        self.directory = directory
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self.matrix_path = os.path.join(directory, "vectors.f32")
+        self.index_path = os.path.join(directory, "index.bin")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.merges_path = os.path.join(directory, "merges.json")
+        self.dim = self._load_meta(dim)
+        self._merged = self._load_merges()
+        self._lock = threading.Lock()
+        self._rows = {}      # face_id -> row
+        self._n = 0          # number of valid rows
+        self._mmap = None
+        if self.dim is not None:
+            self._recover()
+
+    # ---------------- Setup / recovery ---------------- #
+    def _load_meta(self, dim):
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                return json.load(f)["dim"]
+        if dim is not None:
+            self._write_meta(dim)
+        return dim
+
+    def _write_meta(self, dim):
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"dim": int(dim), "dtype": "float32", "version": 1}, f)
+        os.replace(tmp, self.meta_path)
+
+    def _load_merges(self):
+        if not os.path.exists(self.merges_path):
+            return {}
+        with open(self.merges_path) as f:
+            return {int(old): int(new) for old, new in json.load(f).items()}
+
+    @property
+    def row_bytes(self):
+        return self.dim * 4
+
+    def _recover(self):
+        """Drop a torn tail left by a crash in the middle of an append."""
+        with self._locked():
+            self._refresh(repair=True)
+
+    def _refresh(self, repair=False):
+        """
+        Pick up index records appended (possibly by other processes) since the
+        last refresh. With repair, also verify checksums and truncate both files
+        to the last complete row.
+        """
+        if not os.path.exists(self.index_path):
+            return
+        if self.dim is None:
+            # another process created the store after this one opened it
+            self.dim = self._load_meta(None)
+            if self.dim is None:
+                return
+        size = os.path.getsize(self.index_path)
+        n_records = size // _REC.size
+        if n_records == self._n and not repair:
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self._n * _REC.size)
+            data = f.read((n_records - self._n) * _REC.size)
+        matrix_size = os.path.getsize(self.matrix_path) if os.path.exists(self.matrix_path) else 0
+        matrix_rows = matrix_size // self.row_bytes
+        m = open(self.matrix_path, "rb") if repair and matrix_rows else None
+        valid = self._n
+        try:
+            for face_id, row, crc in _REC.iter_unpack(data):
+                if row != valid or row >= matrix_rows:
+                    break
+                if m is not None:
+                    m.seek(row * self.row_bytes)
+                    if zlib.crc32(m.read(self.row_bytes)) != crc:
+                        break
+                self._rows[face_id] = row
+                valid += 1
+        finally:
+            if m is not None:
+                m.close()
+        if repair:
+            if size != valid * _REC.size:
+                with open(self.index_path, "r+b") as f:
+                    f.truncate(valid * _REC.size)
+            if matrix_size != valid * self.row_bytes:
+                with open(self.matrix_path, "r+b") as f:
+                    f.truncate(valid * self.row_bytes)
+        if valid != self._n:
+            self._n = valid
+            self._mmap = None
+
+    def _locked(self):
+        store = self
+
+        class _Guard:
+            def __enter__(self):
+                store._lock.acquire()
+                self.fd = open(store.index_path, "ab")
+                if fcntl is not None:
+                    fcntl.flock(self.fd, fcntl.LOCK_EX)
+                return self.fd
+
+            def __exit__(self, *exc):
+                if fcntl is not None:
+                    fcntl.flock(self.fd, fcntl.LOCK_UN)
+                self.fd.close()
+                store._lock.release()
+                return False
+        return _Guard()
+
+    # ---------------- Writes ---------------- #
+    def append(self, face_ids, embeddings):
+        """Append one row per face_id (float32, shape (N, dim))."""
+        embs = self._check(embeddings)
+        with self._locked() as index_fd:
+            self._refresh()
+            self._append(index_fd, face_ids, embs)
+        return self.matrix_path
+
+    def merge(self, mapping):
+        """
+        Record {merged face_id: kept face_id} (db.dedupe). Earlier merges into an
+        id that is merged now are re-pointed too, so every entry maps to a live id.
+        """
+        with self._locked():
+            merged = self._load_merges()
+            merged.update((int(old), int(new)) for old, new in mapping.items())
+            for old, new in merged.items():
+                while new in merged:
+                    new = merged[new]
+                merged[old] = new
+            tmp = self.merges_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({str(old): new for old, new in sorted(merged.items())}, f)
+            os.replace(tmp, self.merges_path)
+            self._merged = merged
+
+    def _check(self, embeddings):
+        embs = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        if self.dim is None:
+            self.dim = embs.shape[1]
+            self._write_meta(self.dim)
+        if embs.shape[1] != self.dim:
+            raise ValueError(f"Embedding dim {embs.shape[1]} != store dim {self.dim}")
+        return embs
+
+    def _append(self, index_fd, face_ids, embs):
+        # caller holds the store lock and has refreshed
+        start = self._n
+        with open(self.matrix_path, "ab") as m:
+            m.truncate(start * self.row_bytes)  # drop a stray partial row, if any
+            m.write(embs.tobytes())
+            m.flush()
+            if self.fsync:
+                os.fsync(m.fileno())
+        records = b"".join(_REC.pack(int(fid), start + i, zlib.crc32(embs[i].tobytes()))
+                           for i, fid in enumerate(face_ids))
+        index_fd.write(records)
+        index_fd.flush()
+        if self.fsync:
+            os.fsync(index_fd.fileno())
+        for i, fid in enumerate(face_ids):
+            self._rows[int(fid)] = start + i
+        self._n = start + len(embs)
+        self._mmap = None
+
+    # ---------------- Reads ---------------- #
+    def _matrix(self):
+        # caller holds self._lock and has refreshed
+        if self._n == 0:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        if self._mmap is None:
+            self._mmap = np.memmap(self.matrix_path, dtype=np.float32, mode="r",
+                                   shape=(self._n, self.dim))
+        return self._mmap
+
+    def matrix(self):
+        """Zero-copy read-only (rows, dim) float32 memmap of every stored row."""
+        with self._lock:
+            self._refresh()
+            return self._matrix()
+
+    def ids(self):
+        """Sorted face ids (merged ids excluded)."""
+        with self._lock:
+            self._refresh()
+            return sorted(fid for fid in self._rows if fid not in self._merged)
+
+    def latest(self):
+        """
+        (face_ids, vectors) with the latest row per face id. Without re-saved ids
+        the vectors are the memmap itself (zero-copy), else a gather of its rows.
+        """
+        with self._lock:
+            self._refresh()
+            mat = self._matrix()
+            items = sorted((fid, row) for fid, row in self._rows.items() if fid not in self._merged)
+        ids = np.array([fid for fid, _ in items], dtype=np.int64)
+        rows = np.array([row for _, row in items], dtype=np.int64)
+        if np.array_equal(rows, np.arange(len(mat))):
+            return ids, mat
+        return ids, mat[rows]
+
+    def get(self, face_id):
+        with self._lock:
+            self._refresh()
+            face_id = self._merged.get(int(face_id), int(face_id))
+            row = self._rows.get(face_id)
+            return None if row is None else np.array(self._matrix()[row])
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return sum(1 for fid in self._rows if fid not in self._merged)
+
+    # ---------------- Import ---------------- #
+    def import_npy_dir(self, emb_dir, remove=False, chunk=10000):
+        """
+        One-time import of the legacy data/embeddings/face_<id>.npy layout.
+        Ids already in the store are skipped. The whole import holds the store
+        lock, so workers starting in parallel import each file once.
+        Returns the number imported.
+        """
+        names = sorted((int(m.group(1)), name) for name in os.listdir(emb_dir)
+                       for m in [_NPY_NAME.match(name)] if m)
+        with self._locked() as index_fd:
+            self._refresh()
+            todo = [(fid, name) for fid, name in names if fid not in self._rows]
+            for start in range(0, len(todo), chunk):
+                part = todo[start:start + chunk]
+                vecs = self._check(np.stack([np.load(os.path.join(emb_dir, name)).astype(np.float32).ravel()
+                                             for _, name in part]))
+                self._append(index_fd, [fid for fid, _ in part], vecs)
+        if remove:
+            for _, name in todo:
+                os.remove(os.path.join(emb_dir, name))
+        return len(todo)
+
+def main():
+    parser = argparse.ArgumentParser(description="Import per-face .npy embeddings into the consolidated store")
+    parser.add_argument("--emb-dir", default="data/embeddings", help="directory with face_<id>.npy files")
+    parser.add_argument("--store", default=None, help="store directory (default: same as --emb-dir)")
+    parser.add_argument("--remove", action="store_true", help="delete the .npy files after import")
+    args = parser.parse_args()
+    store = EmbeddingStore(args.store or args.emb_dir)
+    n = store.import_npy_dir(args.emb_dir, remove=args.remove)
+    print(f"✅ Imported {n} embeddings; store has {len(store)} faces (dim={store.dim})")
+
+if __name__ == "__main__":
+    main()
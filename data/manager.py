@@ -2,52 +2,68 @@
 import os
 import numpy as np
 import cv2
-from modules.utils import ensure_dir
+from modules.utils import ensure_dir, get_timestamp
+from .embedding_store import EmbeddingStore
 
 class DataManager:
     """
     Handles saving/loading of registered faces and embeddings.
     Stores:
-      - cropped face images in data/registered_faces
-      - embeddings in data/embeddings
+      - cropped face images in data/registered_faces, or in a CropStore
+        (kind "registered") when one is given
+      - embeddings in one append-only, memory-mapped EmbeddingStore in
+        data/embeddings (legacy face_<id>.npy files are imported once)
+    Matching uses the embeddings in the visitors table (Database), so the
+    store is a secondary copy for export / analysis; its appends are not
+    fsync-ed unless fsync=True (a torn tail is still repaired on open).
     """
 
-    def __init__(self, base_dir="data"):
+    def __init__(self, base_dir="data", fsync=False, crop_store=None):
         self.base_dir = base_dir
+        self.crop_store = crop_store
         self.face_dir = os.path.join(base_dir, "registered_faces")
         self.emb_dir = os.path.join(base_dir, "embeddings")
         ensure_dir(self.face_dir)
         ensure_dir(self.emb_dir)
+        self.embeddings = EmbeddingStore(self.emb_dir, fsync=fsync)
+        if len(self.embeddings) == 0:
+            # one-time import of the old one-file-per-face layout
+            n = self.embeddings.import_npy_dir(self.emb_dir)
+            if n:
+                print(f"📦 Imported {n} legacy embeddings into {self.embeddings.matrix_path}")
 
     def save_face(self, face_id, face_img):
         """
         Save a cropped face image for a new registered face.
+        Returns the file path, or the crop ref with a crop store.
         """
+        if self.crop_store is not None:
+            return self.crop_store.put("registered", face_id, face_img, get_timestamp())
         path = os.path.join(self.face_dir, f"face_{face_id}.jpg")
         cv2.imwrite(path, face_img)
         return path
 
     def save_embedding(self, face_id, embedding):
         """
-        Save embedding as .npy file.
+        Append embedding (float32) to the embedding store.
         """
-        path = os.path.join(self.emb_dir, f"face_{face_id}.npy")
-        np.save(path, np.array(embedding, dtype=float))
-        return path
+        return self.embeddings.append([face_id], np.asarray(embedding, dtype=np.float32).reshape(1, -1))
 
     def load_embedding(self, face_id):
         """
         Load embedding for a given face_id.
         """
-        path = os.path.join(self.emb_dir, f"face_{face_id}.npy")
-        if os.path.exists(path):
-            return np.load(path)
-        return None
+        return self.embeddings.get(face_id)
 
     def list_registered_faces(self):
         """
-        Return list of registered face IDs from embeddings directory.
+        Return list of registered face IDs from the embedding store index.
+        """
+        return self.embeddings.ids()
+
+    def embedding_matrix(self):
+        """
+        (face_ids, vectors): latest embedding per face, zero-copy np.memmap
+        when no face was re-saved; usable directly as a search gallery.
         """
-        files = [f for f in os.listdir(self.emb_dir) if f.endswith(".npy")]
-        ids = [int(f.split("_")[1].split(".")[0]) for f in files]
-        return sorted(ids)
+        return self.embeddings.latest()
@@ -0,0 +1,309 @@
+# db/dedupe.py
+"""
+Offline identity deduplication: merge visitor ids that belong to the same person.
+
+    python -m db.dedupe --dry-run                 # report the clusters only
+    python -m db.dedupe --threshold 0.8
+    python -m db.dedupe --data-dir data           # DataManager directory to update
+
+All visitor embeddings are normalized into a temporary memory-mapped matrix.
+Pairs with cosine similarity >= threshold are found block by block, so
+memory stays bounded at about block_size^2 floats plus two row blocks.
+--backend faiss uses a faiss range search instead; its flat index holds every
+vector in RAM (~2 GB for 1M x 512), so it is only for galleries that fit.
+The pairs are clustered with union-find. This is single linkage: A~B and
+B~C merge A and C even when A and C are not similar, so a loose threshold
+can chain different people into one id. The default dedupe_threshold (0.75)
+is therefore stricter than match_threshold; check --dry-run before lowering it. In each cluster, the lowest
+(earliest) id is kept and gets the earliest first_seen. In one
+transaction, events of the other ids are re-pointed to it, the face ids
+in resume checkpoints (processing_state) are remapped the same way, and
+those visitors are deleted. Then the merge is recorded in the data
+directory's EmbeddingStore (merges.json). The registered-face crops of
+the deleted ids are removed when they are plain files; crops packed in a
+CropStore stay in their pack and are only counted. Afterwards the ANN
+index files are removed, so the index is retrained on the next start,
+and the analytics rollups are rebuilt.
+Run it while nothing else is writing to the database: a running process
+would later save checkpoints that still hold its old ids.
+"""
+import json
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import numpy as np
+
+from data.embedding_store import EmbeddingStore
+from modules.database import decode_embedding
+from modules.ann import ann_index_path
+from modules.analytics import Analytics
+from modules.utils import load_config
+
+def _progress(label, done, total, extra=""):
+    pct = 100.0 * done / total if total else 100.0
+    sys.stdout.write(f"\r{label}: {done}/{total} ({pct:5.1f}%) {extra}")
+    sys.stdout.flush()
+    if done >= total:
+        sys.stdout.write("\n")
+
+def load_vectors(conn, path, chunk_size=10000):
+    """
+    Stream every decodable embedding into a normalized float32 .npy memmap at `path`.
+    Returns (ids, vectors); rows whose dim differs from the first one are skipped.
+    """
+    total = conn.execute("SELECT COUNT(*) FROM visitors").fetchone()[0]
+    cur = conn.execute("SELECT id, embedding FROM visitors ORDER BY id")
+    ids, vecs, dim, n = [], None, None, 0
+    seen = 0
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        block_ids, block = [], []
+        for rid, value in rows:
+            try:
+                emb = decode_embedding(value)
+            except Exception:
+                continue
+            if dim is None:
+                dim = emb.size
+                vecs = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(total, dim))
+            if emb.size != dim:
+                continue
+            block_ids.append(rid)
+            block.append(emb)
+        if block:
+            block = np.stack(block)
+            block /= np.linalg.norm(block, axis=1, keepdims=True) + 1e-10
+            vecs[n:n + len(block)] = block
+            ids.extend(block_ids)
+            n += len(block)
+        seen += len(rows)
+        _progress("📥 Loading embeddings", seen, total)
+    if vecs is None:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+    return np.array(ids, dtype=np.int64), vecs[:n]
+
+def similar_pairs(vecs, threshold, block_size=4096):
+    """
+    Yield (i, j) row-index arrays (i < j) of all pairs with dot product >= threshold,
+    comparing the upper triangle of the similarity matrix one block at a time.
+    """
+    n = len(vecs)
+    n_blocks = (n + block_size - 1) // block_size
+    found = 0
+    for bi, s in enumerate(range(0, n, block_size)):
+        rows = np.asarray(vecs[s:s + block_size])
+        for t in range(s, n, block_size):
+            cols = rows if t == s else np.asarray(vecs[t:t + block_size])
+            sims = rows @ cols.T
+            if t == s:
+                sims = np.triu(sims, k=1)   # each pair once, no self-pairs
+            i, j = np.nonzero(sims >= threshold)
+            if len(i):
+                found += len(i)
+                yield i + s, j + t
+        _progress("🔎 Comparing blocks", bi + 1, n_blocks, f"pairs={found}")
+
+def similar_pairs_faiss(vecs, threshold, block_size=4096):
+    """Same as similar_pairs with a faiss flat inner-product range search (holds all vectors)."""
+    try:
+        import faiss
+    except Exception as e:
+        raise ImportError("faiss is required for --backend faiss. pip install faiss-cpu") from e
+    n, dim = vecs.shape
+    index = faiss.IndexFlatIP(dim)
+    for s in range(0, n, block_size):
+        index.add(np.ascontiguousarray(vecs[s:s + block_size]))
+    n_blocks = (n + block_size - 1) // block_size
+    found = 0
+    for bi, s in enumerate(range(0, n, block_size)):
+        lims, _, labels = index.range_search(np.ascontiguousarray(vecs[s:s + block_size]), threshold)
+        i = np.repeat(np.arange(len(lims) - 1), np.diff(lims)) + s
+        keep = labels > i
+        if keep.any():
+            found += int(keep.sum())
+            yield i[keep], labels[keep]
+        _progress("🔎 Range search", bi + 1, n_blocks, f"pairs={found}")
+
+class UnionFind:
+    """Disjoint sets over 0..n-1; the root of every set is its smallest member."""
+    def __init__(self, n):
+        self.parent = np.arange(n, dtype=np.int64)
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]   # path halving
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            if ra < rb:
+                self.parent[rb] = ra
+            else:
+                self.parent[ra] = rb
+
+def find_duplicates(ids, vecs, threshold, block_size=4096, backend="numpy"):
+    """
+    Cluster visitors with union-find (single linkage) over similar pairs.
+    Returns {kept_id: [merged_id, ...]} for clusters of two or more ids.
+    """
+    pairs = (similar_pairs_faiss if backend == "faiss" else similar_pairs)(vecs, threshold, block_size)
+    uf = UnionFind(len(ids))
+    touched = set()
+    for i, j in pairs:
+        for a, b in zip(i.tolist(), j.tolist()):
+            uf.union(a, b)
+            touched.update((a, b))
+    clusters = {}
+    for row in sorted(touched):
+        root = uf.find(row)
+        if root != row:
+            # rows are in id order, so the root row holds the lowest id of the cluster
+            clusters.setdefault(int(ids[root]), []).append(int(ids[row]))
+    return clusters
+
+def remap_checkpoints(conn, mapping):
+    """
+    Rewrite the face ids of the tracker -> face id maps saved in processing_state
+    (see FrameHandler.get_state). Runs inside the caller's transaction.
+    Returns the number of checkpoints changed.
+    """
+    changed = 0
+    rows = conn.execute("SELECT video_key, state FROM processing_state WHERE state IS NOT NULL").fetchall()
+    for video_key, state in rows:
+        state = json.loads(state)
+        pairs = state.get("face_id_map", [])
+        if not any(fid in mapping for _, fid in pairs):
+            continue
+        state["face_id_map"] = [[tid, mapping.get(fid, fid)] for tid, fid in pairs]
+        conn.execute("UPDATE processing_state SET state = ? WHERE video_key = ?",
+                     (json.dumps(state), video_key))
+        changed += 1
+    return changed
+
+def apply_merges(conn, clusters):
+    """
+    Re-point events and checkpoints and delete merged visitors in one transaction.
+    Returns (visitors deleted, events re-pointed, checkpoints remapped,
+    registered-face image paths of the deleted visitors).
+    """
+    mapping = [(old, keep) for keep, olds in clusters.items() for old in olds]
+    with conn:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS merge_map (old_id INTEGER PRIMARY KEY, new_id INTEGER)")
+        conn.execute("DELETE FROM merge_map")
+        conn.executemany("INSERT INTO merge_map (old_id, new_id) VALUES (?, ?)", mapping)
+        events = conn.execute('''
+            UPDATE events SET face_id = (SELECT new_id FROM merge_map WHERE old_id = events.face_id)
+            WHERE face_id IN (SELECT old_id FROM merge_map)
+        ''').rowcount
+        # the kept visitor was first seen when any of its duplicates was
+        conn.execute('''
+            UPDATE visitors SET first_seen = MIN(first_seen, (
+                SELECT MIN(v.first_seen) FROM visitors v JOIN merge_map m ON v.id = m.old_id
+                WHERE m.new_id = visitors.id))
+            WHERE id IN (SELECT new_id FROM merge_map)
+        ''')
+        checkpoints = remap_checkpoints(conn, dict(mapping))
+        images = [path for (path,) in conn.execute(
+            "SELECT image_path FROM visitors WHERE id IN (SELECT old_id FROM merge_map) AND image_path IS NOT NULL")]
+        deleted = conn.execute("DELETE FROM visitors WHERE id IN (SELECT old_id FROM merge_map)").rowcount
+        conn.execute("DROP TABLE merge_map")
+    return deleted, events, checkpoints, images
+
+def remove_registered_crops(images):
+    """Delete plain-file registered crops; returns (removed, left in CropStore packs)."""
+    removed = packed = 0
+    for path in images:
+        if os.path.isfile(path):
+            os.remove(path)
+            removed += 1
+        elif not os.path.exists(path):
+            packed += 1  # a CropStore ref (or an already missing file)
+    return removed, packed
+
+def dedupe(db_path, threshold, block_size=4096, backend="numpy", dry_run=False, data_dir="data"):
+    """Run the whole job; returns a report dict."""
+    t0 = time.perf_counter()
+    conn = sqlite3.connect(db_path, timeout=30)
+    tmp_dir = tempfile.mkdtemp(prefix="dedupe-")
+    try:
+        ids, vecs = load_vectors(conn, os.path.join(tmp_dir, "vectors.npy"))
+        before = len(ids)
+        clusters = find_duplicates(ids, vecs, threshold, block_size, backend) if before > 1 else {}
+        merged = sum(len(v) for v in clusters.values())
+        report = {
+            "visitors_before": before,
+            "clusters": len(clusters),
+            "merged_ids": merged,
+            "visitors_after": before - merged,
+            "events_repointed": 0,
+            "checkpoints_remapped": 0,
+            "crops_removed": 0,
+            "crops_packed": 0,
+            "gallery_shrink_pct": 100.0 * merged / before if before else 0.0,
+            "gallery_bytes_saved": merged * (vecs.shape[1] * 4 if before else 0),
+        }
+        del vecs
+        if merged and not dry_run:
+            deleted, events, checkpoints, images = apply_merges(conn, clusters)
+            report["merged_ids"] = deleted
+            report["events_repointed"] = events
+            report["checkpoints_remapped"] = checkpoints
+            emb_dir = os.path.join(data_dir, "embeddings")
+            if os.path.isdir(emb_dir):
+                EmbeddingStore(emb_dir).merge({old: keep for keep, olds in clusters.items() for old in olds})
+            report["crops_removed"], report["crops_packed"] = remove_registered_crops(images)
+            faiss_path = ann_index_path(db_path, "faiss")
+            for path in (faiss_path, faiss_path + ".ids.npy", ann_index_path(db_path, "numpy")):
+                if os.path.exists(path):
+                    os.remove(path)
+        report["clusters_sample"] = dict(list(clusters.items())[:10])
+    finally:
+        conn.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    if merged and not dry_run:
+        analytics = Analytics(db_path)
+        analytics.rebuild()
+        analytics.close()
+    report["seconds"] = round(time.perf_counter() - t0, 2)
+    return report
+
+def main(argv=None):
+    cfg = load_config()
+    parser = argparse.ArgumentParser(description="Merge duplicate visitor identities")
+    parser.add_argument("--db", default=cfg.get("db_path", "db/visitors.db"))
+    parser.add_argument("--threshold", type=float,
+                        default=cfg.get("dedupe_threshold", 0.75),
+                        help="cosine similarity at or above which two visitors are the same person "
+                             "(merges chain, so keep it stricter than match_threshold)")
+    parser.add_argument("--block-size", type=int, default=4096, help="rows per similarity block")
+    parser.add_argument("--backend", choices=("numpy", "faiss"), default="numpy",
+                        help="faiss keeps every vector in RAM")
+    parser.add_argument("--dry-run", action="store_true", help="report clusters without changing the DB")
+    parser.add_argument("--data-dir", default="data",
+                        help="DataManager directory whose embedding store records the merges")
+    args = parser.parse_args(argv)
+
+    r = dedupe(args.db, args.threshold, args.block_size, args.backend, args.dry_run, args.data_dir)
+    for keep, olds in r["clusters_sample"].items():
+        print(f"  keep {keep} <- {olds}")
+    verb = "Would merge" if args.dry_run else "Merged"
+    print(f"✅ {verb} {r['merged_ids']} duplicate ids in {r['clusters']} clusters "
+          f"(threshold={args.threshold}, {r['seconds']}s)")
+    print(f"📉 Gallery: {r['visitors_before']} -> {r['visitors_after']} visitors "
+          f"(-{r['gallery_shrink_pct']:.1f}%, ~{r['gallery_bytes_saved'] / 1e6:.1f} MB of embeddings)")
+    if not args.dry_run:
+        print(f"🔁 Re-pointed {r['events_repointed']} events and {r['checkpoints_remapped']} resume checkpoints")
+        print(f"🗑️ Removed {r['crops_removed']} registered crops "
+              f"({r['crops_packed']} left in crop store packs)")
+
+if __name__ == "__main__":
+    main()
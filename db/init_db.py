@@ -1,10 +1,14 @@
 # db/init_db.py
-from modules.database import init_db
+from modules.database import init_db, SCHEMA_VERSION
+from modules.utils import load_config
 
 def main():
-    db_path = "db/visitors.db"
-    init_db(db_path)
-    print(f"Database initialized at {db_path}")
+    cfg = load_config()
+    db_path = cfg.get("db_path", "db/visitors.db")
+    converted = init_db(db_path, emb_dtype=cfg.get("embedding_dtype", "float32"))
+    if converted:
+        print(f"Migrated {converted} embeddings to binary format")
+    print(f"Database initialized at {db_path} (schema v{SCHEMA_VERSION})")
 
 if __name__ == "__main__":
     main()
@@ -1,8 +1,30 @@
 # logs/clean_logs.py
+"""
+Reset logs/ and event crop packs (run from the repo root):
+
+    python -m logs.clean_logs
+    python -m logs.clean_logs --crops-before 2026-10-01
+"""
+import argparse
 import os
 import shutil
 
+from modules.crop_store import CropStore
+
 BASE_DIR = "logs"
+CROPS_DIR = "data/crops"
+
+def clean_crops(before="9999-99-99", crops_dir=CROPS_DIR):
+    """Drop entry/exit crop packs dated before `before` (all by default); registered faces are kept."""
+    if not os.path.exists(os.path.join(crops_dir, "crops.db")):
+        return 0
+    store = CropStore(crops_dir, workers=1)
+    try:
+        removed = store.delete_before(before)
+    finally:
+        store.close()
+    print(f"Removed {removed} crop pack(s) from {crops_dir}")
+    return removed
 
 def clean_logs():
     if os.path.exists(BASE_DIR):
@@ -13,4 +35,13 @@ def clean_logs():
     print("Logs folder reset with new events.log")
 
 if __name__ == "__main__":
-    clean_logs()
+    parser = argparse.ArgumentParser(description="Reset logs/ and event crop packs")
+    parser.add_argument("--crops-before", default=None,
+                        help="only drop event crop packs older than this YYYY-MM-DD; keeps logs/")
+    parser.add_argument("--crops-dir", default=CROPS_DIR)
+    args = parser.parse_args()
+    if args.crops_before:
+        clean_crops(args.crops_before, args.crops_dir)
+    else:
+        clean_logs()
+        clean_crops(crops_dir=args.crops_dir)
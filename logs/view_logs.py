@@ -1,17 +1,63 @@
 # logs/view_logs.py
-import os
+"""
+Tail or search the event log (run from the repo root):
+
+    python -m logs.view_logs                     # last 20 records
+    python -m logs.view_logs -n 50
+    python -m logs.view_logs --since 2026-10-18T14:00 --until 2026-10-18T15
+    python -m logs.view_logs --since 2026-10-18 --grep ENTRY --face-id 3
+
+Uses the JSON-lines log when log_format is "jsonl" in config.json, else the
+plain text events.log (tail only).
+"""
+import argparse
+import json
+
+from modules.event_log import EventLog, tail_lines
+from modules.utils import load_config
 
 LOG_PATH = "events.log"
 
-def tail_log(n=20):
-    """Print last n lines from events.log."""
-    if not os.path.exists(LOG_PATH):
-        print("Log file not found:", LOG_PATH)
+def _show(rec):
+    extra = {k: v for k, v in rec.items() if k not in ("ts", "level", "msg")}
+    print(f"{rec.get('ts')} - {rec.get('level')} - {rec.get('msg')}"
+          + (f"  {json.dumps(extra)}" if extra else ""))
+
+def tail_log(n=20, cfg=None):
+    """Print the last n records, reading from the end of the log."""
+    cfg = cfg or load_config()
+    if cfg.get("log_format", "text") == "jsonl":
+        for rec in EventLog(cfg.get("json_log_path", "logs/events.jsonl")).tail(n):
+            _show(rec)
         return
-    with open(LOG_PATH, "r") as f:
-        lines = f.readlines()
-        for line in lines[-n:]:
-            print(line.strip())
+    path = cfg.get("log_path", LOG_PATH)
+    lines = tail_lines(path, n)
+    if not lines:
+        print("Log file not found or empty:", path)
+    for line in lines:
+        print(line.strip())
+
+def search_log(since=None, until=None, level=None, grep=None, face_id=None, cfg=None):
+    """Print records in [since, until], optionally filtered; returns the number printed."""
+    cfg = cfg or load_config()
+    fields = {} if face_id is None else {"face_id": face_id}
+    n = 0
+    for rec in EventLog(cfg.get("json_log_path", "logs/events.jsonl")).search(
+            since, until, level=level, contains=grep, **fields):
+        _show(rec)
+        n += 1
+    return n
 
 if __name__ == "__main__":
-    tail_log(20)
+    parser = argparse.ArgumentParser(description="Tail or search the event log")
+    parser.add_argument("-n", type=int, default=20, help="records to tail")
+    parser.add_argument("--since", help="ISO timestamp or prefix, e.g. 2026-10-18T14:00")
+    parser.add_argument("--until", help="ISO timestamp or prefix (inclusive)")
+    parser.add_argument("--level")
+    parser.add_argument("--grep", help="message substring")
+    parser.add_argument("--face-id", type=int)
+    args = parser.parse_args()
+    if args.since or args.until or args.level or args.grep or args.face_id is not None:
+        search_log(args.since, args.until, args.level, args.grep, args.face_id)
+    else:
+        tail_log(args.n)
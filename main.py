@@ -1,17 +1,27 @@
 # main.py
+import argparse
+import cProfile
 import cv2
 import os
-import sqlite3
-import csv
-import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
-from modules.detector import Detector
+from modules.detector import make_detector
 from modules.recognizer import Recognizer
-from modules.tracker import SimpleTracker
-from modules.logger import log_face_event, log_system
-from modules.database import Database, init_db
+from modules.tracker import make_tracker
+from modules.logger import configure as configure_logging, log_system, set_database, set_crop_store, start_event_sink, flush_events, close as close_event_log
+from modules.processing import FrameHandler
+from modules.pipeline import run_pipeline, run_sequential
+from modules.frame_source import FrameSampler, SampledSource, make_motion_gate
+from modules.frame_ring import ProcessDecoder
+from modules.live import run_live
+from modules import metrics
+from modules.database import Database, DatabaseManager, init_db
+from modules.crop_store import make_crop_store
+from modules.checkpoint import VideoProgress
 from data.manager import DataManager
-from modules.utils import load_config, crop_face, get_timestamp
+from modules.utils import load_config
+from outputs.report_generator import export_reports
+from modules.analytics import Analytics
 
 # ---------------- Video Writer ---------------- #
 class VideoWriter:
@@ -26,44 +36,15 @@ class VideoWriter:
     def release(self):
         self.writer.release()
 
-# ---------------- Report Generator ---------------- #
-def export_reports(db_path="db/visitors.db", out_dir="outputs/reports"):
-    os.makedirs(out_dir, exist_ok=True)
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-
-    # Export visitors
-    c.execute("SELECT * FROM visitors")
-    visitors = c.fetchall()
-    visitor_cols = [desc[0] for desc in c.description]
-    with open(os.path.join(out_dir, "visitors.csv"), "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(visitor_cols)
-        writer.writerows(visitors)
-
-    # Export events
-    c.execute("SELECT * FROM events")
-    events = c.fetchall()
-    event_cols = [desc[0] for desc in c.description]
-    with open(os.path.join(out_dir, "events.csv"), "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(event_cols)
-        writer.writerows(events)
-
-    # Export summary JSON
-    summary = {
-        "unique_visitors": len(visitors),
-        "total_events": len(events),
-    }
-    with open(os.path.join(out_dir, "summary.json"), "w") as f:
-        json.dump(summary, f, indent=2)
-
-    conn.close()
-    print(f"✅ Reports exported to {out_dir}")
-    print(f"📊 Unique visitors: {len(visitors)}, Total events: {len(events)}")
-
 # ---------------- Video Processing ---------------- #
 def process_video(video_path, detector, recognizer, tracker, db, dm, cfg):
+    # finished videos are skipped, interrupted ones resume from their last checkpoint
+    progress = VideoProgress(db, video_path, cfg) if cfg.get("resume", True) else None
+    if progress is not None and progress.done:
+        print(f"⏭️ Skipping {video_path} (already processed)")
+        log_system(f"Skipped already processed {video_path}")
+        return
+
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         print(f"❌ Error: Cannot open {video_path}")
@@ -79,105 +60,224 @@ def process_video(video_path, detector, recognizer, tracker, db, dm, cfg):
 
     print(f"▶️ Processing {video_path} ...")
     log_system(f"Started processing {video_path}")
+    run_name = os.path.splitext(basename)[0]
+    if cfg.get("metrics", False) or cfg.get("profile", False):
+        metrics.start_run(run_name)
+    profiler = cProfile.Profile() if cfg.get("profile", False) else None
+    if profiler:
+        profiler.enable()
 
-    frame_count = 0
-    face_id_map = {}  # tracker_id -> db_face_id
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frame_count += 1
-
-        # Skip frames for performance
-        if frame_count % cfg.get("frame_skip", 5) != 0:
-            continue
-
-        # Step 1: Detect faces
-        detections = detector.detect(frame)
-        bboxes = [d["bbox"] for d in detections]
-
-        # Step 2: Update tracker
-        tracked_objects, exited_ids = tracker.update(bboxes)
-
-        # Step 3: Handle exited objects
-        for tid in exited_ids:
-            if tid in face_id_map:
-                fid = face_id_map[tid]
-                log_face_event(fid, "exit", tracked_objects.get(tid, [0,0,1,1]), frame)
-                del face_id_map[tid]
-
-        # Step 4: Handle active tracked objects
-        for tid, bbox in tracked_objects.items():
-            face_img = crop_face(frame, bbox)
-            emb = recognizer.get_embedding(face_img)
-            if emb is None:
-                continue
-
-            if tid not in face_id_map:
-                match_id, sim = db.find_match(emb, threshold=cfg.get("match_threshold", 0.6))
-                if match_id:
-                    face_id_map[tid] = match_id
-                    log_system(f"Recognized existing face {match_id} (sim={sim:.2f})")
-                else:
-                    ts = get_timestamp()
-                    face_path = dm.save_face(db.get_unique_count() + 1, face_img)
-                    dm.save_embedding(db.get_unique_count() + 1, emb)
-                    new_id = db.register_face(emb, face_path, ts)
-                    face_id_map[tid] = new_id
-                    log_face_event(new_id, "entry", bbox, frame)
-                    log_system(f"Registered new face {new_id}")
-
-        # Draw and save to processed video
-        display = frame.copy()
-        for tid, bbox in tracked_objects.items():
-            x1, y1, x2, y2 = map(int, bbox)
-            fid = face_id_map.get(tid, -1)
-            cv2.rectangle(display, (x1,y1), (x2,y2), (0,255,0), 2)
-            cv2.putText(display, f"ID:{fid}", (x1, y1-10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,255,0), 2)
-        writer.write(display)
-
-        # Optional live view (press q to quit)
-        cv2.imshow("Face Tracker", display)
-        if cv2.waitKey(1) & 0xFF == ord("q"):
-            break
+    handler = FrameHandler(recognizer, tracker, db, dm, cfg, progress=progress)
+    sampler = FrameSampler(cap, frame_skip=cfg.get("frame_skip", 5),
+                           target_fps=cfg.get("target_detect_fps"))
+    start_frame = progress.resume(handler) if progress is not None else 0
+    if start_frame:
+        print(f"⏩ Resuming {video_path} after frame {start_frame}")
+        sampler.seek(start_frame)
+    gate = make_motion_gate(cfg)
+    if cfg.get("pipeline", False):
+        # threaded decode / inference / bookkeeping / encode stages; with
+        # decode_process the decoder runs in its own process and hands frames
+        # over through a shared-memory ring instead of pickling them
+        if cfg.get("decode_process", False):
+            source = ProcessDecoder(video_path, (h, w, 3), cfg, n_slots=cfg.get("frame_ring_slots", 32),
+                                    start_frame=start_frame)
+            # the gate runs in the decoder process; report its counters instead
+            gate = source.gate
+        else:
+            source = SampledSource(sampler, gate)
+        try:
+            depths = run_pipeline(source, handler, detector, recognizer, writer, cfg,
+                                  show=cfg.get("show_video", True))
+        finally:
+            source.close()
+        complete = source.eof
+        log_system(f"Pipeline queue depths for {video_path}: " +
+                   ", ".join(f"{k}(max={v['max']}, mean={v['mean']:.1f}/{v['capacity']})"
+                             for k, v in depths.items()))
+        for k, v in depths.items():
+            metrics.gauge(f"queue_{k}_max_depth", v['max'])
+    else:
+        run_sequential(sampler, gate, handler, detector, writer, cfg,
+                       show=cfg.get("show_video", True))
+        complete = sampler.eof
 
     cap.release()
     writer.release()
+    handler.finish(video_path)
+    flush_events()
+    if progress is not None:
+        if complete:
+            progress.finish(handler.frame_idx or start_frame)
+        else:
+            # stopped early (q pressed): resume from here next time
+            progress.save(handler.frame_idx, handler)
+    if gate is not None:
+        log_system(f"Motion gate skipped {gate.skipped}/{gate.checked} detector calls for {video_path}")
+        metrics.gauge("motion_gate_skipped", gate.skipped)
+    if profiler:
+        profiler.disable()
+        metrics_dir = cfg.get("metrics_dir", "outputs/metrics")
+        log_system(f"Profile for {video_path}: {metrics.dump_profile(profiler, metrics_dir, run_name)}")
+    export_metrics(db, cfg)
     log_system(f"Finished processing {video_path}")
     print(f"✅ Finished {video_path}")
 
+def export_metrics(db, cfg):
+    """Record DB/gallery sizes and write the active run's JSON + Prometheus files."""
+    if not metrics.enabled():
+        return
+    metrics.gauge("gallery_size", db.get_unique_count())
+    db_path = cfg.get("db_path", "db/visitors.db")
+    if os.path.exists(db_path):
+        metrics.gauge("db_bytes", os.path.getsize(db_path))
+    run = metrics.end_run()
+    path = run.export(cfg.get("metrics_dir", "outputs/metrics"))
+    log_system(f"Metrics for {run.name} written to {path}")
+
+def load_models(cfg):
+    """Create (and optionally warm up) the detector and recognizer."""
+    detector = make_detector(cfg)
+    recognizer = Recognizer(cfg=cfg)
+    if cfg.get("model_warmup", True):
+        detector.warmup()
+        recognizer.warmup()
+    return detector, recognizer
+
+# ---------------- Parallel Processing ---------------- #
+VIDEO_EXTS = (".mp4", ".avi", ".mov", ".mkv")
+
+_worker = {}  # per-process models, set up once by _init_worker
+
+def _init_worker(cfg, db):
+    """Process-pool initializer: load models once per worker process."""
+    _worker["cfg"] = cfg
+    _worker["db"] = db
+    configure_logging(cfg)
+    _worker["detector"], _worker["recognizer"] = load_models(cfg)
+    crops = make_crop_store(cfg)
+    _worker["dm"] = DataManager(crop_store=crops)
+    set_database(db)
+    set_crop_store(crops)
+    if cfg.get("event_sink", True):
+        start_event_sink(db, cfg)
+
+def _process_video_worker(video_path):
+    w = _worker
+    # fresh tracker per video so track ids / state never leak across files
+    process_video(video_path, w["detector"], w["recognizer"], make_tracker(w["cfg"]),
+                  w["db"], w["dm"], w["cfg"])
+    return video_path
+
+def process_videos_parallel(videos, cfg, workers):
+    """
+    Spread videos over a process pool. The Database lives in a separate
+    manager process and every worker talks to it through a proxy, so there
+    is exactly one SQLite writer.
+    """
+    db_path = cfg.get("db_path", "db/visitors.db")
+    cfg = dict(cfg, show_video=False)  # no GUI windows from worker processes
+    manager = DatabaseManager()
+    manager.start()
+    db = manager.Database(db_path, cfg.get("embedding_dtype", "float32"), cfg.get("ann"))
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(cfg, db)) as pool:
+            futures = {pool.submit(_process_video_worker, v): v for v in videos}
+            for fut in as_completed(futures):
+                try:
+                    fut.result()
+                except Exception as e:
+                    print(f"❌ Failed {futures[fut]}: {e}")
+                    log_system(f"Worker failed on {futures[fut]}: {e}")
+    finally:
+        db.close()
+        manager.shutdown()
+
 # ---------------- Main ---------------- #
-def main(video_folder="videos"):
+def main(video_folder="videos", workers=1, live=None, replay=False, profile=False):
+    # config is read once here and handed to every component
     cfg = load_config()
+    if profile:
+        # per-video cProfile output next to the stage metrics
+        cfg = dict(cfg, profile=True, metrics=True)
+    configure_logging(cfg)
     db_path = cfg.get("db_path", "db/visitors.db")
-    init_db(db_path)
-
-    # Init components
-    detector = Detector()
-    recognizer = Recognizer()
-    tracker = SimpleTracker(
-        max_disappeared=cfg.get("track_disappeared_frames", 30),
-        distance_threshold=cfg.get("distance_threshold", 80),
-    )
-    db = Database(db_path)
-    dm = DataManager()
-
-    if not os.path.exists(video_folder):
+    emb_dtype = cfg.get("embedding_dtype", "float32")
+    init_db(db_path, emb_dtype=emb_dtype)
+
+    if live is None and not os.path.exists(video_folder):
         print(f"❌ Folder not found: {video_folder}")
         return
 
-    # Loop through all video files
-    for file in os.listdir(video_folder):
-        if file.lower().endswith((".mp4", ".avi", ".mov", ".mkv")):
-            process_video(os.path.join(video_folder, file), detector, recognizer, tracker, db, dm, cfg)
+    if live is None and workers > 1:
+        videos = [os.path.join(video_folder, f) for f in sorted(os.listdir(video_folder))
+                  if f.lower().endswith(VIDEO_EXTS)]
+        process_videos_parallel(videos, cfg, workers)
+    else:
+        # Init components: models load and warm up on a background thread
+        # while the gallery / ANN index are loaded here
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-load") as loader:
+            models = loader.submit(load_models, cfg)
+            db = Database(db_path, emb_dtype=emb_dtype, ann_cfg=cfg.get("ann"))
+            crops = make_crop_store(cfg)
+            dm = DataManager(crop_store=crops)
+            set_database(db)
+            set_crop_store(crops)
+            if cfg.get("event_sink", True):
+                start_event_sink(db, cfg)
+            detector, recognizer = models.result()
+
+        if live is not None:
+            # camera / stream URL, or a local file replayed at wall-clock rate
+            if cfg.get("metrics", False):
+                metrics.start_run("live")
+            profiler = cProfile.Profile() if cfg.get("profile", False) else None
+            if profiler:
+                profiler.enable()
+            run_live(live, detector, recognizer, db, dm, cfg, replay=replay)
+            if profiler:
+                profiler.disable()
+                metrics.dump_profile(profiler, cfg.get("metrics_dir", "outputs/metrics"), "live")
+            export_metrics(db, cfg)
+        else:
+            # Loop through all video files
+            for file in sorted(os.listdir(video_folder)):
+                if file.lower().endswith(VIDEO_EXTS):
+                    process_video(os.path.join(video_folder, file), detector, recognizer,
+                                  make_tracker(cfg), db, dm, cfg)
+
+        cv2.destroyAllWindows()
+        close_event_log()
+        if crops is not None:
+            crops.close()
+        db.close()
 
-    cv2.destroyAllWindows()
+    # Fold new events into the analytics rollups
+    analytics = Analytics(db_path)
+    print(f"📈 Analytics rollups updated with {analytics.refresh()} new events")
+    analytics.close()
 
     # Export reports
-    export_reports(db_path=db_path, out_dir="outputs/reports")
+    export_reports(db_path=db_path, out_dir="outputs/reports",
+                   fmt=cfg.get("report_format", "csv"),
+                   incremental=cfg.get("report_incremental", False))
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Face entry/exit tracker")
     # Change "videos" to your folder containing videos
-    main(video_folder="videos")
\ No newline at end of file
+    parser.add_argument("video_folder", nargs="?", default="videos")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="process videos in parallel with N worker processes")
+    parser.add_argument("--live", metavar="SOURCE",
+                        help="process a live camera index or stream URL instead of a folder")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="replay a local video at wall-clock rate through the live mode")
+    parser.add_argument("--profile", action="store_true",
+                        help="record stage metrics and a cProfile dump per video under metrics_dir")
+    args = parser.parse_args()
+    if args.replay:
+        main(workers=1, live=args.replay, replay=True, profile=args.profile)
+    else:
+        main(video_folder=args.video_folder, workers=args.workers, live=args.live,
+             profile=args.profile)
@@ -0,0 +1,244 @@
+# modules/analytics.py
+import argparse
+import datetime
+import sqlite3
+
+EVENT_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_events_face_ts ON events(face_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_events_type_ts ON events(event_type, timestamp)",
+]
+
+ROLLUP_TABLES = [
+    '''CREATE TABLE IF NOT EXISTS rollup_daily (
+        day TEXT, event_type TEXT, count INTEGER,
+        PRIMARY KEY (day, event_type))''',
+    '''CREATE TABLE IF NOT EXISTS rollup_hourly (
+        hour TEXT, event_type TEXT, count INTEGER,
+        PRIMARY KEY (hour, event_type))''',
+    '''CREATE TABLE IF NOT EXISTS daily_visitors (
+        day TEXT, face_id INTEGER,
+        PRIMARY KEY (day, face_id))''',
+    '''CREATE TABLE IF NOT EXISTS dwell_daily (
+        day TEXT PRIMARY KEY, visits INTEGER, total_seconds REAL,
+        min_seconds REAL, max_seconds REAL)''',
+    '''CREATE TABLE IF NOT EXISTS open_visits (
+        face_id INTEGER PRIMARY KEY, entry_ts TEXT)''',
+    '''CREATE TABLE IF NOT EXISTS analytics_state (
+        key TEXT PRIMARY KEY, value INTEGER)''',
+]
+
+def create_event_indexes(conn):
+    for sql in EVENT_INDEXES:
+        conn.execute(sql)
+
+def ensure_schema(conn):
+    """Create the event indexes and rollup tables (idempotent)."""
+    create_event_indexes(conn)
+    for sql in ROLLUP_TABLES:
+        conn.execute(sql)
+    conn.commit()
+
+def _parse_ts(ts):
+    return datetime.datetime.fromisoformat(ts)
+
+class Analytics:
+    """
+    Incrementally maintained rollups over the events table.
+    - refresh() folds only events with id above the stored watermark into
+      per-day / per-hour counts, per-day distinct visitors and dwell aggregates
+    - dwell time pairs each exit with the open entry of the same face_id and is
+      attributed to the day of the entry
+    - query methods read the rollup tables, so their cost does not grow with events
+    """
+    def __init__(self, db_path='db/visitors.db'):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        ensure_schema(self.conn)
+
+    def close(self):
+        self.conn.close()
+
+    def watermark(self):
+        row = self.conn.execute(
+            "SELECT value FROM analytics_state WHERE key = 'last_event_id'").fetchone()
+        return row[0] if row else 0
+
+    def refresh(self, chunk_size=10000):
+        """Fold new events into the rollups in one transaction; returns events processed."""
+        conn = self.conn
+        since = self.watermark()
+        daily, hourly, visitors, dwell = {}, {}, set(), {}
+        open_visits = dict(conn.execute("SELECT face_id, entry_ts FROM open_visits"))
+        closed = set()
+        processed, last_id = 0, since
+
+        c = conn.cursor()
+        c.execute("SELECT id, face_id, event_type, timestamp FROM events WHERE id > ? ORDER BY id",
+                  (since,))
+        while True:
+            rows = c.fetchmany(chunk_size)
+            if not rows:
+                break
+            for event_id, face_id, event_type, ts in rows:
+                last_id = event_id
+                processed += 1
+                if not ts:
+                    continue
+                day, hour = ts[:10], ts[:13]
+                daily[(day, event_type)] = daily.get((day, event_type), 0) + 1
+                hourly[(hour, event_type)] = hourly.get((hour, event_type), 0) + 1
+                visitors.add((day, face_id))
+                if event_type == 'entry':
+                    open_visits[face_id] = ts
+                    closed.discard(face_id)
+                elif event_type == 'exit' and face_id in open_visits:
+                    entry_ts = open_visits.pop(face_id)
+                    closed.add(face_id)
+                    secs = max(0.0, (_parse_ts(ts) - _parse_ts(entry_ts)).total_seconds())
+                    visits, total, lo, hi = dwell.get(entry_ts[:10], (0, 0.0, secs, secs))
+                    dwell[entry_ts[:10]] = (visits + 1, total + secs, min(lo, secs), max(hi, secs))
+
+        if processed == 0:
+            return 0
+        with conn:
+            conn.executemany('''
+                INSERT INTO rollup_daily (day, event_type, count) VALUES (?, ?, ?)
+                ON CONFLICT(day, event_type) DO UPDATE SET count = count + excluded.count
+            ''', [(d, t, n) for (d, t), n in daily.items()])
+            conn.executemany('''
+                INSERT INTO rollup_hourly (hour, event_type, count) VALUES (?, ?, ?)
+                ON CONFLICT(hour, event_type) DO UPDATE SET count = count + excluded.count
+            ''', [(h, t, n) for (h, t), n in hourly.items()])
+            conn.executemany("INSERT OR IGNORE INTO daily_visitors (day, face_id) VALUES (?, ?)",
+                             list(visitors))
+            conn.executemany('''
+                INSERT INTO dwell_daily (day, visits, total_seconds, min_seconds, max_seconds)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(day) DO UPDATE SET
+                    visits = visits + excluded.visits,
+                    total_seconds = total_seconds + excluded.total_seconds,
+                    min_seconds = MIN(min_seconds, excluded.min_seconds),
+                    max_seconds = MAX(max_seconds, excluded.max_seconds)
+            ''', [(d,) + v for d, v in dwell.items()])
+            conn.executemany("DELETE FROM open_visits WHERE face_id = ?", [(f,) for f in closed])
+            conn.executemany("INSERT OR REPLACE INTO open_visits (face_id, entry_ts) VALUES (?, ?)",
+                             list(open_visits.items()))
+            conn.execute("INSERT OR REPLACE INTO analytics_state (key, value) VALUES ('last_event_id', ?)",
+                         (last_id,))
+        return processed
+
+    def rebuild(self):
+        """Drop all rollups and recompute them from the full events table."""
+        with self.conn:
+            for table in ("rollup_daily", "rollup_hourly", "daily_visitors", "dwell_daily",
+                          "open_visits", "analytics_state"):
+                self.conn.execute(f"DELETE FROM {table}")
+        return self.refresh()
+
+    # ---------------- Queries ---------------- #
+    def daily_counts(self, start=None, end=None):
+        """[{day, entries, exits, visitors}] for days in [start, end] (YYYY-MM-DD)."""
+        start, end = start or '0000-00-00', end or '9999-99-99'
+        rows = self.conn.execute('''
+            SELECT day,
+                   SUM(CASE WHEN event_type = 'entry' THEN count ELSE 0 END),
+                   SUM(CASE WHEN event_type = 'exit' THEN count ELSE 0 END)
+            FROM rollup_daily WHERE day BETWEEN ? AND ? GROUP BY day ORDER BY day
+        ''', (start, end)).fetchall()
+        visitors = dict(self.conn.execute('''
+            SELECT day, COUNT(*) FROM daily_visitors WHERE day BETWEEN ? AND ? GROUP BY day
+        ''', (start, end)))
+        return [{"day": d, "entries": e, "exits": x, "visitors": visitors.get(d, 0)}
+                for d, e, x in rows]
+
+    def hourly_counts(self, day):
+        """[{hour, entries, exits}] for one day (hour as 'YYYY-MM-DDTHH')."""
+        rows = self.conn.execute('''
+            SELECT hour,
+                   SUM(CASE WHEN event_type = 'entry' THEN count ELSE 0 END),
+                   SUM(CASE WHEN event_type = 'exit' THEN count ELSE 0 END)
+            FROM rollup_hourly WHERE hour BETWEEN ? AND ? GROUP BY hour ORDER BY hour
+        ''', (f"{day}T00", f"{day}T23")).fetchall()
+        return [{"hour": h, "entries": e, "exits": x} for h, e, x in rows]
+
+    def dwell_stats(self, start=None, end=None):
+        """[{day, visits, avg_seconds, min_seconds, max_seconds}] by entry day."""
+        rows = self.conn.execute('''
+            SELECT day, visits, total_seconds, min_seconds, max_seconds
+            FROM dwell_daily WHERE day BETWEEN ? AND ? ORDER BY day
+        ''', (start or '0000-00-00', end or '9999-99-99')).fetchall()
+        return [{"day": d, "visits": v, "avg_seconds": t / v if v else 0.0,
+                 "min_seconds": lo, "max_seconds": hi} for d, v, t, lo, hi in rows]
+
+    def repeat_visitors(self, start=None, end=None, min_days=2):
+        """[{face_id, days}] for faces seen on at least `min_days` distinct days."""
+        rows = self.conn.execute('''
+            SELECT face_id, COUNT(*) AS days FROM daily_visitors
+            WHERE day BETWEEN ? AND ? GROUP BY face_id HAVING days >= ?
+            ORDER BY days DESC, face_id
+        ''', (start or '0000-00-00', end or '9999-99-99', min_days)).fetchall()
+        return [{"face_id": f, "days": n} for f, n in rows]
+
+    def visitor_history(self, face_id, limit=100):
+        """Most recent events of one visitor (served by the (face_id, timestamp) index)."""
+        rows = self.conn.execute('''
+            SELECT id, event_type, timestamp, image_path FROM events
+            WHERE face_id = ? ORDER BY timestamp DESC LIMIT ?
+        ''', (face_id, limit)).fetchall()
+        return [{"id": i, "event_type": t, "timestamp": ts, "image_path": p}
+                for i, t, ts, p in rows]
+
+def _print_rows(rows):
+    if not rows:
+        print("(no rows)")
+        return
+    cols = list(rows[0].keys())
+    print(" | ".join(cols))
+    for r in rows:
+        print(" | ".join(f"{r[c]:.1f}" if isinstance(r[c], float) else str(r[c]) for c in cols))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Visitor analytics over materialized rollups")
+    parser.add_argument("--db", default="db/visitors.db")
+    parser.add_argument("--no-refresh", action="store_true",
+                        help="query the rollups as they are, without folding in new events")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("daily", "dwell", "repeat"):
+        p = sub.add_parser(name)
+        p.add_argument("--start")
+        p.add_argument("--end")
+        if name == "repeat":
+            p.add_argument("--min-days", type=int, default=2)
+    sub.add_parser("hourly").add_argument("day", help="YYYY-MM-DD")
+    p = sub.add_parser("history")
+    p.add_argument("face_id", type=int)
+    p.add_argument("--limit", type=int, default=100)
+    sub.add_parser("refresh")
+    sub.add_parser("rebuild")
+    args = parser.parse_args(argv)
+
+    analytics = Analytics(args.db)
+    try:
+        if args.command == "rebuild":
+            print(f"🔄 Rebuilt rollups from {analytics.rebuild()} events")
+            return
+        if not args.no_refresh:
+            n = analytics.refresh()
+            if args.command == "refresh":
+                print(f"🔄 Folded {n} new events into rollups (watermark {analytics.watermark()})")
+                return
+        if args.command == "daily":
+            _print_rows(analytics.daily_counts(args.start, args.end))
+        elif args.command == "hourly":
+            _print_rows(analytics.hourly_counts(args.day))
+        elif args.command == "dwell":
+            _print_rows(analytics.dwell_stats(args.start, args.end))
+        elif args.command == "repeat":
+            _print_rows(analytics.repeat_visitors(args.start, args.end, args.min_days))
+        elif args.command == "history":
+            _print_rows(analytics.visitor_history(args.face_id, args.limit))
+    finally:
+        analytics.close()
+
+if __name__ == "__main__":
+    main()
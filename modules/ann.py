@@ -0,0 +1,240 @@
+# modules/ann.py
+import importlib.util
+import os
+import numpy as np
+
+DEFAULT_ANN_CFG = {
+    "backend": "exact",      # exact | auto | faiss | numpy
+    "kind": "ivf",           # ivf | hnsw (hnsw needs faiss)
+    "nlist": 1024,
+    "nprobe": 16,
+    "hnsw_m": 32,
+    "ef_search": 64,
+    "min_train_size": 20000,
+}
+
+def ann_index_path(db_path, backend):
+    """Index file stored next to the SQLite DB (e.g. db/visitors.faiss)."""
+    base = os.path.splitext(db_path)[0]
+    return f"{base}.faiss" if backend == "faiss" else f"{base}.ivf.npz"
+
+def make_ann_index(ann_cfg, db_path):
+    """
+    Build the configured approximate index, or None for exact search.
+    'auto' picks faiss when it is installed and the NumPy IVF otherwise;
+    faiss itself is only imported when a FaissIndex is created.
+    """
+    cfg = dict(DEFAULT_ANN_CFG, **(ann_cfg or {}))
+    backend = cfg["backend"]
+    if backend == "exact":
+        return None
+    if backend == "auto":
+        backend = "faiss" if importlib.util.find_spec("faiss") is not None else "numpy"
+    path = ann_index_path(db_path, backend)
+    if backend == "faiss":
+        return FaissIndex(path, kind=cfg["kind"], nlist=cfg["nlist"], nprobe=cfg["nprobe"],
+                          hnsw_m=cfg["hnsw_m"], ef_search=cfg["ef_search"],
+                          min_train_size=cfg["min_train_size"])
+    if backend == "numpy":
+        return NumpyIVFIndex(path, nlist=cfg["nlist"], nprobe=cfg["nprobe"],
+                             min_train_size=cfg["min_train_size"])
+    raise ValueError(f"Unknown ANN backend: {backend}")
+
+def _kmeans(vecs, k, iters=10, seed=0, block=65536):
+    """Spherical k-means on normalized rows; returns (k, D) unit centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = vecs[rng.choice(len(vecs), size=k, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.empty(len(vecs), dtype=np.int64)
+        for s in range(0, len(vecs), block):
+            assign[s:s + block] = np.argmax(vecs[s:s + block] @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vecs)
+        empty = ~sums.any(axis=1)
+        if empty.any():
+            # re-seed empty clusters with random points
+            sums[empty] = vecs[rng.choice(len(vecs), size=int(empty.sum()), replace=False)]
+        centroids = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-10)
+    return centroids.astype(np.float32)
+
+class NumpyIVFIndex:
+    """
+    Pure-NumPy inverted-file index over a GalleryIndex.
+    - Coarse quantizer: spherical k-means centroids
+    - Inverted lists hold gallery row numbers, so vectors are not duplicated
+    - Searches only the `nprobe` closest lists
+    """
+    def __init__(self, path, nlist=1024, nprobe=16, min_train_size=20000, seed=0):
+        self.path = path
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.seed = seed
+        self.centroids = None
+        self._assign = np.empty(0, dtype=np.int32)   # row -> list number
+        self._lists = []
+        self._gallery = None
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    @property
+    def ntotal(self):
+        return len(self._assign)
+
+    def _build_lists(self):
+        order = np.argsort(self._assign, kind='stable')
+        bounds = np.searchsorted(self._assign[order], np.arange(len(self.centroids) + 1))
+        self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+
+    def train(self, gallery):
+        vecs = gallery.vectors
+        nlist = min(self.nlist, max(1, len(vecs) // 39))
+        sample = vecs
+        if len(vecs) > 64 * nlist:
+            rng = np.random.default_rng(self.seed)
+            sample = vecs[np.sort(rng.choice(len(vecs), size=64 * nlist, replace=False))]
+        self.centroids = _kmeans(sample, nlist, seed=self.seed)
+        self._assign = np.empty(0, dtype=np.int32)
+
+    def sync(self, gallery):
+        """Train when large enough and index gallery rows not yet indexed."""
+        self._gallery = gallery
+        if not self.trained:
+            if len(gallery) < self.min_train_size:
+                return
+            self.train(gallery)
+        start = self.ntotal
+        if start >= len(gallery):
+            return
+        new = np.argmax(gallery.vectors[start:] @ self.centroids.T, axis=1).astype(np.int32)
+        self._assign = np.concatenate([self._assign, new])
+        if len(new) > 64 or not self._lists:
+            self._build_lists()
+        else:
+            for i, lst in enumerate(new):
+                self._lists[lst] = np.append(self._lists[lst], start + i)
+
+    def search(self, queries, k=1):
+        vecs = self._gallery.vectors
+        ids = self._gallery.ids
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :nprobe]
+        out_sims = np.full((len(queries), k), -1.0, dtype=np.float32)
+        out_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for qi, q in enumerate(queries):
+            rows = np.concatenate([self._lists[p] for p in probes[qi]])
+            if len(rows) == 0:
+                continue
+            sims = vecs[rows] @ q
+            kk = min(k, len(rows))
+            top = np.argpartition(-sims, kk - 1)[:kk]
+            top = top[np.argsort(-sims[top])]
+            out_sims[qi, :kk] = sims[top]
+            out_ids[qi, :kk] = ids[rows[top]]
+        return out_sims, out_ids
+
+    def save(self):
+        if not self.trained:
+            return
+        ids = self._gallery.ids[:self.ntotal] if self._gallery is not None else np.empty(0)
+        np.savez(self.path, centroids=self.centroids, assign=self._assign, ids=ids)
+
+    def load(self, gallery):
+        """Load a persisted index if it is consistent with `gallery`."""
+        if not os.path.exists(self.path):
+            return False
+        data = np.load(self.path)
+        ids = data["ids"]
+        if len(ids) > len(gallery) or not np.array_equal(ids, gallery.ids[:len(ids)]):
+            return False  # gallery changed underneath (e.g. dedupe) -> retrain
+        self.centroids = data["centroids"]
+        self._assign = data["assign"]
+        self._gallery = gallery
+        self._build_lists()
+        return True
+
+class FaissIndex:
+    """faiss-backed IVF-Flat or HNSW index using inner product on normalized vectors."""
+    def __init__(self, path, kind="ivf", nlist=1024, nprobe=16, hnsw_m=32,
+                 ef_search=64, min_train_size=20000):
+        try:
+            import faiss
+        except Exception as e:
+            raise ImportError("faiss is required for the 'faiss' ANN backend. pip install faiss-cpu") from e
+        self.faiss = faiss
+        self.path = path
+        self.kind = kind
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.min_train_size = min_train_size
+        self.index = None
+        self._ids = np.empty(0, dtype=np.int64)
+
+    @property
+    def trained(self):
+        return self.index is not None and self.index.is_trained
+
+    @property
+    def ntotal(self):
+        return 0 if self.index is None else int(self.index.ntotal)
+
+    def _set_search_params(self):
+        if self.kind == "hnsw":
+            self.faiss.downcast_index(self.index.index).hnsw.efSearch = self.ef_search
+        else:
+            self.index.nprobe = self.nprobe
+
+    def train(self, gallery):
+        dim = gallery.dim
+        if self.kind == "hnsw":
+            hnsw = self.faiss.IndexHNSWFlat(dim, self.hnsw_m, self.faiss.METRIC_INNER_PRODUCT)
+            self.index = self.faiss.IndexIDMap2(hnsw)
+        else:
+            nlist = min(self.nlist, max(1, len(gallery) // 39))
+            quantizer = self.faiss.IndexFlatIP(dim)
+            self.index = self.faiss.IndexIVFFlat(quantizer, dim, nlist, self.faiss.METRIC_INNER_PRODUCT)
+            self.index.train(np.ascontiguousarray(gallery.vectors))
+        self._set_search_params()
+
+    def sync(self, gallery):
+        if self.index is None:
+            if len(gallery) < self.min_train_size:
+                return
+            self.train(gallery)
+        start = self.ntotal
+        if start < len(gallery):
+            self.index.add_with_ids(np.ascontiguousarray(gallery.vectors[start:]),
+                                    np.ascontiguousarray(gallery.ids[start:]))
+            self._ids = np.array(gallery.ids[:len(gallery)], dtype=np.int64)
+
+    def search(self, queries, k=1):
+        sims, ids = self.index.search(np.ascontiguousarray(queries, dtype=np.float32), k)
+        return sims, ids
+
+    @property
+    def ids_path(self):
+        # visitor ids in insertion order, to validate the index against the gallery on load
+        return self.path + ".ids.npy"
+
+    def save(self):
+        if self.index is not None:
+            self.faiss.write_index(self.index, self.path)
+            np.save(self.ids_path, self._ids[:self.ntotal])
+
+    def load(self, gallery):
+        """Load a persisted index if it is consistent with `gallery`."""
+        if not os.path.exists(self.path) or not os.path.exists(self.ids_path):
+            return False
+        index = self.faiss.read_index(self.path)
+        ids = np.load(self.ids_path)
+        if (len(ids) != index.ntotal or len(ids) > len(gallery)
+                or not np.array_equal(ids, gallery.ids[:len(ids)])):
+            return False  # gallery changed underneath (e.g. dedupe) -> retrain
+        self._ids = ids
+        self.index = index
+        self._set_search_params()
+        return True
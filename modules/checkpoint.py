@@ -0,0 +1,81 @@
+# modules/checkpoint.py
+import hashlib
+import json
+import os
+from .logger import flush_events, log_system
+from .utils import get_timestamp
+
+def video_key(path, mode="stat"):
+    """
+    Identity of an input video in the processing_state table:
+      - "stat": absolute path + size + mtime (cheap, changes when the file does)
+      - "hash": sha256 of the content (survives renames / moves, reads the whole file)
+    """
+    if mode == "hash":
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        return f"sha256:{h.hexdigest()}"
+    st = os.stat(path)
+    return f"stat:{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}"
+
+class VideoProgress:
+    """
+    Processing state of one video, persisted in the processing_state table.
+    - every `interval` source frames the FrameHandler state (tracker, face_id_map,
+      track cache) is checkpointed with the frame position, after flushing the
+      event sink so the checkpoint's event-id watermark covers every event
+      emitted up to that frame
+    - events are stored with the video's key and frame; resume() restores the
+      last checkpoint, and this video's events stored after its watermark were
+      emitted by frames that are now replayed, so the handler suppresses them
+      once each while replaying frames up to the last of them (other videos'
+      events are not affected). The sink writes events in order, so entries
+      still buffered at a crash come after every stored one and are re-emitted
+    - finish() marks the video done, so later runs skip it
+    """
+    def __init__(self, db, video_path, cfg):
+        self.db = db
+        self.path = video_path
+        self.interval = max(1, cfg.get("checkpoint_interval_frames", 300))
+        self.key = video_key(video_path, cfg.get("resume_key", "stat"))
+        self.row = db.get_processing_state(self.key)
+        self.last_frame = 0
+
+    @property
+    def done(self):
+        return self.row is not None and self.row["status"] == "done"
+
+    def resume(self, handler):
+        """Restore `handler` from the last checkpoint; returns the frame to continue after (0: from the start)."""
+        if self.row is None or not self.row["state"]:
+            return 0
+        handler.set_state(json.loads(self.row["state"]))
+        frame_idx = self.row["frame_idx"]
+        replayed = self.db.events_since(self.row["event_watermark"], self.key)
+        frames = [f for _, _, f in replayed if f is not None]
+        if len(frames) < len(replayed):
+            # events stored before events.frame_idx existed: they precede the next checkpoint
+            frames.append(frame_idx + 2 * self.interval)
+        handler.suppress_replayed([(fid, etype) for fid, etype, _ in replayed],
+                                  until_frame=max(frames, default=frame_idx))
+        self.last_frame = frame_idx
+        log_system(f"Resuming {self.path} after frame {frame_idx} "
+                   f"({len(replayed)} events after the checkpoint)", frame_idx=frame_idx)
+        return frame_idx
+
+    def step(self, frame_idx, handler):
+        """Called after each handled frame; checkpoints every `interval` frames."""
+        if frame_idx - self.last_frame >= self.interval:
+            self.save(frame_idx, handler)
+
+    def save(self, frame_idx, handler, status="running"):
+        flush_events()
+        state = json.dumps(handler.get_state()) if status == "running" else None
+        self.db.save_processing_state(self.key, self.path, status, frame_idx,
+                                      self.db.max_event_id(), state, get_timestamp())
+        self.last_frame = frame_idx
+
+    def finish(self, frame_idx=None):
+        self.save(self.last_frame if frame_idx is None else frame_idx, None, status="done")
@@ -0,0 +1,229 @@
+# modules/crop_store.py
+import os
+import sqlite3
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: appends are only serialized within the process
+    fcntl = None
+
+REF_PREFIX = "crop:"
+
+def dhash(img, size=8):
+    """64-bit difference hash of an image (gray, (size+1) x size, adjacent-pixel comparisons)."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view('>u8')[0])
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+class CropStore:
+    """
+    Packed storage for face crops instead of one JPEG file per event.
+      - crops are JPEG-encoded on a thread pool and appended to per-kind,
+        per-day pack files: <root>/<kind>/<YYYY-MM-DD>.pack
+      - (ref, pack, offset, length, ...) rows go to an SQLite index in <root>/crops.db
+      - put() returns a "crop:<kind>/<date>/<id>" reference right away; it is what
+        gets stored in events.image_path / visitors.image_path
+      - a crop whose dHash is within dedup_distance bits of the previous crop
+        stored for the same (face_id, kind) on the same day is skipped and the
+        previous ref reused; only the last `dedup_faces` (face_id, kind) pairs are
+        remembered, so a ref never points into an older day's pack
+      - a failed write is reported and counted in `failed`; its ref stays unindexed
+    Appends from several processes are serialized with an flock on the pack file.
+    """
+    def __init__(self, root="data/crops", workers=2, quality=90, dedup_distance=6, dedup_faces=4096):
+        self.root = root
+        self.quality = quality
+        self.dedup_distance = dedup_distance
+        self.dedup_faces = dedup_faces
+        os.makedirs(root, exist_ok=True)
+        self.index_path = os.path.join(root, "crops.db")
+        self.conn = sqlite3.connect(self.index_path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute('''
+          CREATE TABLE IF NOT EXISTS crops (
+            ref TEXT PRIMARY KEY,
+            pack TEXT,
+            offset INTEGER,
+            length INTEGER,
+            face_id INTEGER,
+            kind TEXT,
+            timestamp TEXT,
+            dhash INTEGER
+          )
+        ''')
+        self.conn.commit()
+        self._lock = threading.Lock()          # index connection + pack appends
+        self._last = OrderedDict()              # (face_id, kind) -> (dhash, ref, date), LRU
+        self._pending = {}                      # ref -> Future, until written
+        self.stored = 0
+        self.deduped = 0
+        self.failed = 0
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="crop-jpeg")
+
+    def submit(self, kind, face_id, img, timestamp):
+        """
+        Queue a crop; returns (ref, future). The future resolves to the ref once
+        the crop is in its pack file and indexed (immediately for a duplicate).
+        """
+        h = dhash(img) if img.size else 0
+        key = (face_id, kind)
+        date = timestamp.split('T')[0]
+        with self._lock:
+            last = self._last.get(key)
+            if last is not None and last[2] == date and hamming(last[0], h) <= self.dedup_distance:
+                self.deduped += 1
+                self._last.move_to_end(key)
+                prev = self._pending.get(last[1])
+                return last[1], prev if prev is not None else _done(last[1])
+            ref = f"{REF_PREFIX}{kind}/{date}/{uuid.uuid4().hex}"
+            self._last[key] = (h, ref, date)
+            self._last.move_to_end(key)
+            while len(self._last) > self.dedup_faces:
+                self._last.popitem(last=False)
+            # encoded later: the caller may reuse the buffer (e.g. a shared-memory ring slot)
+            future = self._pool.submit(self._write, ref, kind, date, face_id, timestamp, h, img.copy())
+            self._pending[ref] = future
+        return ref, future
+
+    def put(self, kind, face_id, img, timestamp):
+        """Queue a crop and return its ref without waiting for the write."""
+        return self.submit(kind, face_id, img, timestamp)[0]
+
+    def _write(self, ref, kind, date, face_id, timestamp, h, img):
+        try:
+            self._append(ref, kind, date, face_id, timestamp, h, img)
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+                # later duplicates must not reuse a ref that was never stored
+                for key in [k for k, v in self._last.items() if v[1] == ref]:
+                    del self._last[key]
+            print(f"⚠️ Failed to store crop {ref}: {e}")
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(ref, None)
+        return ref
+
+    def _append(self, ref, kind, date, face_id, timestamp, h, img):
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            raise IOError(f"JPEG encoding failed for {ref}")
+        data = buf.tobytes()
+        pack = os.path.join(kind, f"{date}.pack")
+        path = os.path.join(self.root, pack)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            with open(path, "ab") as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    offset = f.seek(0, os.SEEK_END)
+                    f.write(data)
+                    f.flush()
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+            self.conn.execute(
+                'INSERT INTO crops (ref, pack, offset, length, face_id, kind, timestamp, dhash) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (ref, pack, offset, len(data), face_id, kind, timestamp, h - (1 << 64) if h >= 1 << 63 else h))
+            self.conn.commit()
+            self.stored += 1
+
+    # ---------------- Reader API ---------------- #
+    def read_bytes(self, ref):
+        """Encoded JPEG bytes for a crop ref (waits if it is still being written)."""
+        future = self._pending.get(ref)
+        if future is not None:
+            future.result()
+        with self._lock:
+            row = self.conn.execute('SELECT pack, offset, length FROM crops WHERE ref = ?', (ref,)).fetchone()
+        if row is None:
+            raise KeyError(f"Unknown crop ref {ref}")
+        pack, offset, length = row
+        with open(os.path.join(self.root, pack), "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def read(self, ref):
+        """Decoded BGR image for a crop ref."""
+        return cv2.imdecode(np.frombuffer(self.read_bytes(ref), dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    def flush(self):
+        """Wait until every queued crop is written or has failed (failures are counted in `failed`)."""
+        with self._lock:
+            futures = list(self._pending.values())
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                pass  # already reported by _write
+
+    def delete_before(self, date, kinds=("entry", "exit")):
+        """Drop pack files (and index rows) of the given kinds dated before YYYY-MM-DD."""
+        removed = 0
+        with self._lock:
+            for kind in kinds:
+                kind_dir = os.path.join(self.root, kind)
+                if not os.path.isdir(kind_dir):
+                    continue
+                for name in sorted(os.listdir(kind_dir)):
+                    if name.endswith(".pack") and name[:-5] < date:
+                        os.remove(os.path.join(kind_dir, name))
+                        self.conn.execute('DELETE FROM crops WHERE pack = ?', (os.path.join(kind, name),))
+                        removed += 1
+            self.conn.commit()
+            for key in [k for k, v in self._last.items() if v[2] < date]:
+                del self._last[key]
+        return removed
+
+    def close(self):
+        self.flush()
+        self._pool.shutdown(wait=True)
+        self.conn.close()
+
+def _done(value):
+    from concurrent.futures import Future
+    f = Future()
+    f.set_result(value)
+    return f
+
+def make_crop_store(cfg):
+    """Build a CropStore from config, or None to keep writing one JPEG file per crop."""
+    if not cfg.get("crop_store", False):
+        return None
+    return CropStore(
+        root=cfg.get("crop_store_dir", "data/crops"),
+        workers=cfg.get("crop_encode_workers", 2),
+        quality=cfg.get("crop_jpeg_quality", 90),
+        dedup_distance=cfg.get("crop_dedup_distance", 6),
+    )
+
+def read_crop(ref, store=None, root="data/crops"):
+    """
+    Image for an image_path value from the DB: a crop-store ref or a plain file path.
+    Opens the store at `root` when a ref is given without a store.
+    """
+    if not ref:
+        return None
+    if not ref.startswith(REF_PREFIX):
+        return cv2.imread(ref)
+    if store is None:
+        store = CropStore(root, workers=1)
+        try:
+            return store.read(ref)
+        finally:
+            store.close()
+    return store.read(ref)
@@ -2,17 +2,99 @@
 import os
 import sqlite3
 import json
+import struct
+import threading
+from multiprocessing.managers import BaseManager
 import numpy as np
+from .gallery import GalleryIndex
+from .ann import make_ann_index
+from .analytics import create_event_indexes
 
-def init_db(db_path='db/visitors.db'):
-    """Create DB and tables if not exist."""
+# PRAGMA user_version of the current schema.
+#   0/1: visitors.embedding holds JSON text
+#   2:   visitors.embedding holds a binary BLOB (see encode_embedding)
+SCHEMA_VERSION = 2
+
+# BLOB layout: header (tag, dtype code, dim) followed by raw little-endian values
+_EMB_HEADER = struct.Struct('<BBH')
+_EMB_TAG = 0xEB
+_EMB_DTYPES = {0: np.dtype('<f4'), 1: np.dtype('<f2')}
+_EMB_CODES = {'float32': 0, 'float16': 1}
+
+def encode_embedding(embedding, dtype='float32'):
+    """Pack an embedding into a compact binary BLOB (float32 or float16)."""
+    code = _EMB_CODES[dtype]
+    arr = np.asarray(embedding, dtype=_EMB_DTYPES[code]).ravel()
+    return _EMB_HEADER.pack(_EMB_TAG, code, arr.size) + arr.tobytes()
+
+def decode_embedding(value):
+    """Decode a stored embedding (BLOB or legacy JSON text) to a float32 array."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = bytes(value)
+        tag, code, dim = _EMB_HEADER.unpack_from(value)
+        if tag != _EMB_TAG or code not in _EMB_DTYPES:
+            raise ValueError("unknown embedding blob format")
+        arr = np.frombuffer(value, dtype=_EMB_DTYPES[code], count=dim, offset=_EMB_HEADER.size)
+        return arr.astype(np.float32)
+    return np.array(json.loads(value), dtype=np.float32)
+
+def get_schema_version(conn):
+    return int(conn.execute('PRAGMA user_version').fetchone()[0])
+
+def migrate_embeddings(conn, dtype='float32', chunk_size=1000):
+    """
+    Convert JSON-text embeddings to BLOBs in place, `chunk_size` rows at a time.
+    Rows are paged by id and every chunk is committed on its own, so memory
+    stays bounded and an interrupted migration continues where it stopped
+    (the schema version is only bumped at the end).
+    Rows whose text cannot be parsed are left as they are (the gallery loader
+    skips them) and reported; the schema version is bumped regardless, so new
+    rows are written as BLOBs.
+    Returns the number of converted rows.
+    """
+    c = conn.cursor()
+    converted = 0
+    n_failed = 0
+    failed = []   # first ids, for the report
+    last_id = -1
+    while True:
+        rows = c.execute(
+            "SELECT id, embedding FROM visitors WHERE id > ? AND typeof(embedding) = 'text' "
+            "ORDER BY id LIMIT ?", (last_id, chunk_size)
+        ).fetchall()
+        if not rows:
+            break
+        batch = []
+        for rid, emb_text in rows:
+            try:
+                batch.append((encode_embedding(json.loads(emb_text), dtype), rid))
+            except Exception:
+                n_failed += 1
+                if len(failed) < 20:
+                    failed.append(rid)
+        c.executemany('UPDATE visitors SET embedding = ? WHERE id = ?', batch)
+        conn.commit()
+        converted += len(batch)
+        last_id = rows[-1][0]
+    if n_failed:
+        shown = ", ".join(str(rid) for rid in failed) + (", ..." if n_failed > len(failed) else "")
+        print(f"⚠️ {n_failed} embeddings could not be migrated and are ignored (visitor ids: {shown})")
+    c.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    conn.commit()
+    return converted
+
+def init_db(db_path='db/visitors.db', emb_dtype='float32'):
+    """
+    Create DB and tables if not exist, and migrate older schemas in place.
+    Returns the number of embeddings converted by the migration.
+    """
     os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
     conn = sqlite3.connect(db_path)
     c = conn.cursor()
     c.execute('''
       CREATE TABLE IF NOT EXISTS visitors (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        embedding TEXT,
+        embedding BLOB,
         first_seen TEXT,
         image_path TEXT
       )
@@ -23,61 +105,236 @@ def init_db(db_path='db/visitors.db'):
         face_id INTEGER,
         event_type TEXT,
         timestamp TEXT,
-        image_path TEXT
+        image_path TEXT,
+        video_key TEXT,
+        frame_idx INTEGER
+      )
+    ''')
+    # video_key: processing_state key of the video that emitted the event (NULL for live)
+    # frame_idx: source frame that emitted it (bounds the replay window on resume)
+    columns = [row[1] for row in c.execute('PRAGMA table_info(events)')]
+    for name, decl in (('video_key', 'TEXT'), ('frame_idx', 'INTEGER')):
+        if name not in columns:
+            c.execute(f'ALTER TABLE events ADD COLUMN {name} {decl}')
+    # one row per input video, for skipping / resuming (see modules/checkpoint.py)
+    c.execute('''
+      CREATE TABLE IF NOT EXISTS processing_state (
+        video_key TEXT PRIMARY KEY,
+        path TEXT,
+        status TEXT,
+        frame_idx INTEGER,
+        event_watermark INTEGER,
+        state TEXT,
+        updated TEXT
       )
     ''')
+    create_event_indexes(conn)
     conn.commit()
+    converted = 0
+    if get_schema_version(conn) < SCHEMA_VERSION:
+        converted = migrate_embeddings(conn, emb_dtype)
+        if converted:
+            # reclaim the space freed by the JSON text
+            conn.execute('VACUUM')
     conn.close()
+    return converted
 
 class Database:
-    def __init__(self, db_path='db/visitors.db'):
+    def __init__(self, db_path='db/visitors.db', emb_dtype='float32', ann_cfg=None):
         os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        # WAL lets readers (reports, viewers) run while this connection writes
+        self.conn.execute('PRAGMA journal_mode=WAL')
         self.cursor = self.conn.cursor()
+        # the connection and gallery are shared by threads (and, behind
+        # DatabaseManager, by worker processes): serialize access
+        self._lock = threading.RLock()
+        self.emb_dtype = emb_dtype
+        # write BLOBs only once init_db has migrated the file
+        self.schema_version = get_schema_version(self.conn)
+        # resident embedding index, loaded once and kept in sync by register_face
+        self.gallery = GalleryIndex()
+        self._load_gallery()
+        # optional approximate index for very large galleries (see modules/ann.py)
+        self.ann = make_ann_index(ann_cfg, db_path)
+        if self.ann is not None:
+            self.ann.load(self.gallery)
+            self.ann.sync(self.gallery)
+
+    def _load_gallery(self):
+        """Decode all stored embeddings once into the in-memory gallery."""
+        try:
+            self.cursor.execute('SELECT id, embedding FROM visitors')
+        except sqlite3.OperationalError:
+            return  # tables not created yet
+        ids, embs = [], []
+        for rid, value in self.cursor.fetchall():
+            try:
+                ref = decode_embedding(value)
+            except Exception:
+                continue
+            if embs and ref.shape != embs[0].shape:
+                continue
+            ids.append(rid)
+            embs.append(ref)
+        if ids:
+            self.gallery.add(ids, np.stack(embs))
 
     def register_face(self, embedding, image_path, timestamp):
         """Store new face embedding and return face_id."""
-        emb_text = json.dumps(np.array(embedding).tolist())
+        with self._lock:
+            return self._register_face(embedding, image_path, timestamp)
+
+    def _register_face(self, embedding, image_path, timestamp):
+        if self.schema_version >= SCHEMA_VERSION:
+            emb_value = encode_embedding(embedding, self.emb_dtype)
+        else:
+            emb_value = json.dumps(np.array(embedding).tolist())
         self.cursor.execute(
             'INSERT INTO visitors (embedding, first_seen, image_path) VALUES (?, ?, ?)',
-            (emb_text, timestamp, image_path)
+            (emb_value, timestamp, image_path)
         )
         self.conn.commit()
-        return self.cursor.lastrowid
+        face_id = self.cursor.lastrowid
+        self.gallery.add([face_id], [embedding])
+        if self.ann is not None:
+            self.ann.sync(self.gallery)
+        return face_id
+
+    def _search(self, embeddings, k):
+        queries = GalleryIndex.normalize(embeddings)
+        if self.ann is not None and self.ann.trained:
+            return self.ann.search(queries, k)
+        return self.gallery.search(queries, k)
+
+    def top_k(self, embedding, k=5):
+        """Return the k best [(face_id, similarity), ...] for one embedding."""
+        with self._lock:
+            sims, ids = self._search([embedding], k)
+        return [(int(i), float(s)) for i, s in zip(ids[0], sims[0]) if i >= 0]
+
+    def find_matches(self, embeddings, threshold=0.6):
+        """
+        Batch version of find_match: one matrix product for all embeddings.
+        Returns a list of (face_id, similarity) / (None, best_sim) tuples.
+        """
+        if len(embeddings) == 0:
+            return []
+        with self._lock:
+            if len(self.gallery) == 0:
+                return [(None, 0.0) for _ in range(len(embeddings))]
+            sims, ids = self._search(embeddings, 1)
+        results = []
+        for sim, fid in zip(sims[:, 0], ids[:, 0]):
+            sim = float(sim)
+            results.append((int(fid), sim) if fid >= 0 and sim >= threshold else (None, sim))
+        return results
 
     def find_match(self, embedding, threshold=0.6):
         """Return (face_id, similarity) if a match >= threshold else (None, best_sim)."""
-        self.cursor.execute('SELECT id, embedding FROM visitors')
-        rows = self.cursor.fetchall()
-        if not rows:
-            return (None, 0.0)
-        emb = np.array(embedding, dtype=float)
-        best_sim = -1.0
-        best_id = None
-        for rid, emb_text in rows:
-            try:
-                ref = np.array(json.loads(emb_text), dtype=float)
-            except Exception:
-                continue
-            denom = (np.linalg.norm(emb) * np.linalg.norm(ref) + 1e-10)
-            sim = float(np.dot(emb, ref) / denom)
-            if sim > best_sim:
-                best_sim = sim
-                best_id = rid
-        if best_sim >= threshold:
-            return (best_id, best_sim)
-        return (None, best_sim)
-
-    def insert_event(self, face_id, event_type, timestamp, image_path):
-        self.cursor.execute(
-            'INSERT INTO events (face_id, event_type, timestamp, image_path) VALUES (?, ?, ?, ?)',
-            (face_id, event_type, timestamp, image_path)
-        )
-        self.conn.commit()
+        return self.find_matches([embedding], threshold=threshold)[0]
+
+    def match_or_register(self, embeddings, timestamp, threshold=0.6):
+        """
+        Atomically match a batch of embeddings and register the unmatched ones.
+        An unmatched embedding is also compared with faces registered earlier in
+        the same call, so one person is never registered twice.
+        Returns a list of (face_id, similarity, is_new) tuples.
+        """
+        with self._lock:
+            results = []
+            new_ids, new_embs = [], []
+            for emb, (fid, sim) in zip(embeddings, self.find_matches(embeddings, threshold)):
+                if fid is None and new_embs:
+                    sims = GalleryIndex.normalize(new_embs) @ GalleryIndex.normalize(emb)[0]
+                    j = int(np.argmax(sims))
+                    if sims[j] >= threshold:
+                        fid, sim = new_ids[j], float(sims[j])
+                if fid is not None:
+                    results.append((fid, sim, False))
+                    continue
+                fid = self._register_face(emb, None, timestamp)
+                new_ids.append(fid)
+                new_embs.append(emb)
+                results.append((fid, sim, True))
+            return results
+
+    def set_image_path(self, face_id, image_path):
+        with self._lock:
+            self.cursor.execute('UPDATE visitors SET image_path = ? WHERE id = ?', (image_path, face_id))
+            self.conn.commit()
+
+    def insert_event(self, face_id, event_type, timestamp, image_path, video_key=None, frame_idx=None):
+        with self._lock:
+            self.cursor.execute(
+                'INSERT INTO events (face_id, event_type, timestamp, image_path, video_key, frame_idx) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (face_id, event_type, timestamp, image_path, video_key, frame_idx)
+            )
+            self.conn.commit()
+
+    def insert_events(self, rows):
+        """Insert many (face_id, event_type, timestamp, image_path, video_key, frame_idx) rows in one transaction."""
+        with self._lock:
+            self.cursor.executemany(
+                'INSERT INTO events (face_id, event_type, timestamp, image_path, video_key, frame_idx) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            self.conn.commit()
+
+    def max_event_id(self):
+        with self._lock:
+            self.cursor.execute('SELECT COALESCE(MAX(id), 0) FROM events')
+            return int(self.cursor.fetchone()[0])
+
+    def events_since(self, event_id, video_key):
+        """(face_id, event_type, frame_idx) of every event of `video_key` with id > event_id, in id order."""
+        with self._lock:
+            self.cursor.execute('SELECT face_id, event_type, frame_idx FROM events '
+                                'WHERE id > ? AND video_key = ? ORDER BY id', (event_id, video_key))
+            return self.cursor.fetchall()
+
+    def get_processing_state(self, video_key):
+        """The processing_state row of a video as a dict, or None."""
+        with self._lock:
+            self.cursor.execute(
+                'SELECT path, status, frame_idx, event_watermark, state, updated '
+                'FROM processing_state WHERE video_key = ?', (video_key,))
+            row = self.cursor.fetchone()
+        if row is None:
+            return None
+        keys = ('path', 'status', 'frame_idx', 'event_watermark', 'state', 'updated')
+        return dict(zip(keys, row))
+
+    def save_processing_state(self, video_key, path, status, frame_idx, event_watermark, state, timestamp):
+        with self._lock:
+            self.cursor.execute('''
+                INSERT INTO processing_state (video_key, path, status, frame_idx, event_watermark, state, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(video_key) DO UPDATE SET
+                  path = excluded.path, status = excluded.status, frame_idx = excluded.frame_idx,
+                  event_watermark = excluded.event_watermark, state = excluded.state,
+                  updated = excluded.updated
+            ''', (video_key, path, status, frame_idx, event_watermark, state, timestamp))
+            self.conn.commit()
 
     def get_unique_count(self):
-        self.cursor.execute('SELECT COUNT(*) FROM visitors')
-        return int(self.cursor.fetchone()[0])
+        with self._lock:
+            self.cursor.execute('SELECT COUNT(*) FROM visitors')
+            return int(self.cursor.fetchone()[0])
 
     def close(self):
-        self.conn.close()
+        with self._lock:
+            if self.ann is not None:
+                self.ann.save()
+            self.conn.close()
+
+class DatabaseManager(BaseManager):
+    """
+    Serves a single Database from a dedicated process.
+    Worker processes get a proxy, so every write goes through one connection
+    (the single writer) and visitor ids stay unique across workers.
+    """
+
+DatabaseManager.register('Database', Database)
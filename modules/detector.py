@@ -1,41 +1,229 @@
 # modules/detector.py
-from ultralytics import YOLO
+import ast
+import os
+import shutil
 from .utils import load_config
 import numpy as np
+import cv2
 
 class Detector:
     """Simple YOLO wrapper for face detection.
        Model path can be changed in config or passed when constructing.
+       ultralytics (and torch) are only imported when a Detector is created.
     """
-    def __init__(self, model_path=None, device='cpu'):
-        cfg = load_config()
+    def __init__(self, model_path=None, device='cpu', cfg=None):
+        cfg = cfg if cfg is not None else load_config()
+        from ultralytics import YOLO
         self.conf = cfg.get('confidence_threshold', 0.45)
-        model_path = model_path or f"{cfg.get('models_dir','models')}/yolov8-face.pt"
+        models_dir = cfg.get('models_dir', 'models')
+        model_path = model_path or f"{models_dir}/yolov8-face.pt"
         # create model object (will load weights)
         try:
     # Try to load local face model
             self.model = YOLO(model_path)
         except Exception:
-    # Fall back to general YOLOv8n if face model not found
-            print(f"⚠️ Face model {model_path} not found. Falling back to yolov8n.pt")
-            self.model = YOLO("yolov8n.pt")  # auto-downloads if missing
+    # Fall back to general YOLOv8n if face model not found; the download is
+    # kept in models_dir so later launches load it from disk
+            fallback = os.path.join(models_dir, "yolov8n.pt")
+            print(f"⚠️ Face model {model_path} not found. Falling back to {fallback}")
+            os.makedirs(models_dir, exist_ok=True)
+            self.model = YOLO(fallback)  # auto-downloads if missing
 
+    def warmup(self, size=(640, 480)):
+        """One dummy inference so the first real frame doesn't pay for lazy init."""
+        self.detect_batch([np.zeros((size[1], size[0], 3), dtype=np.uint8)])
 
     def detect(self, frame):
         """
         Run a detection pass on `frame` (BGR numpy image).
-        Returns a list of dicts: {'bbox':[x1,y1,x2,y2], 'conf':float}
+        Returns a list of dicts: {'bbox':[x1,y1,x2,y2], 'conf':float, 'kps':[[x,y]]*5 or None}
         """
-        # ultralytics returns a Results object; we take first result
-        results = self.model(frame, conf=self.conf)
-        detections = []
-        if len(results) == 0:
-            return detections
-        res = results[0]
-        if hasattr(res, 'boxes') and len(res.boxes) > 0:
-            xyxy = res.boxes.xyxy.cpu().numpy()  # Nx4
-            confs = res.boxes.conf.cpu().numpy()  # N
-            for b, c in zip(xyxy, confs):
-                detections.append({'bbox': [float(b[0]), float(b[1]), float(b[2]), float(b[3])],
-                                   'conf': float(c)})
-        return detections
+        boxes, confs, kps = self.detect_batch([frame], keypoints=True)[0]
+        return [{'bbox': [float(b[0]), float(b[1]), float(b[2]), float(b[3])], 'conf': float(c),
+                 'kps': None if kps is None else kps[i].tolist()}
+                for i, (b, c) in enumerate(zip(boxes, confs))]
+
+    def detect_batch(self, frames, keypoints=False):
+        """
+        Run one inference call over a list of frames.
+        Returns one (boxes, confs) tuple per frame:
+          boxes: float32 (N, 4) array of [x1,y1,x2,y2], confs: float32 (N,) array
+        With keypoints=True, one (boxes, confs, kps) tuple per frame: kps is a
+        float32 (N, 5, 2) array of the 5 face landmarks (eyes, nose, mouth
+        corners) from a yolov8-face pose model, or None when the model has none.
+        """
+        if len(frames) == 0:
+            return []
+        # ultralytics returns one Results object per input image
+        results = self.model(list(frames), conf=self.conf, verbose=False)
+        out = []
+        for res in results:
+            kps = None
+            if hasattr(res, 'boxes') and len(res.boxes) > 0:
+                boxes = res.boxes.xyxy.cpu().numpy().astype(np.float32)  # Nx4
+                confs = res.boxes.conf.cpu().numpy().astype(np.float32)  # N
+                points = getattr(res, 'keypoints', None)
+                if keypoints and points is not None and tuple(points.xy.shape[1:]) == (5, 2):
+                    kps = points.xy.cpu().numpy().astype(np.float32)  # Nx5x2
+            else:
+                boxes = np.empty((0, 4), dtype=np.float32)
+                confs = np.empty(0, dtype=np.float32)
+            out.append((boxes, confs, kps) if keypoints else (boxes, confs))
+        return out
+
+def letterbox(frame, size):
+    """Resize keeping aspect ratio and pad to size x size (gray 114, like ultralytics).
+    Returns (img, gain, (pad_x, pad_y))."""
+    h, w = frame.shape[:2]
+    gain = min(size / h, size / w)
+    nw, nh = int(round(w * gain)), int(round(h * gain))
+    pad_x, pad_y = (size - nw) / 2, (size - nh) / 2
+    img = cv2.resize(frame, (nw, nh), interpolation=cv2.INTER_LINEAR) if (nw, nh) != (w, h) else frame
+    top, left = int(round(pad_y - 0.1)), int(round(pad_x - 0.1))
+    img = cv2.copyMakeBorder(img, top, size - nh - top, left, size - nw - left,
+                             cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return img, gain, (left, top)
+
+def decode_yolov8(pred, n_classes, conf, iou=0.7, max_det=300):
+    """
+    Decode one image of raw YOLOv8 output, shape (4 + n_classes [+ extras], anchors),
+    into (boxes xyxy float32 (N, 4), confs float32 (N,), kps) in letterboxed coordinates.
+    Class-aware NMS, like ultralytics' default. kps is a float32 (N, 5, 2) array
+    when the extras are the 5 (x, y, visibility) face landmarks of a yolov8-face
+    pose model, else None.
+    """
+    pred = pred.T
+    cls_scores = pred[:, 4:4 + n_classes]
+    cls = cls_scores.argmax(1)
+    scores = cls_scores[np.arange(len(cls)), cls]
+    keep = scores > conf
+    xywh, scores, cls = pred[keep, :4], scores[keep], cls[keep]
+    extras = pred[keep, 4 + n_classes:]
+    if len(scores) == 0:
+        return np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.float32), None
+    boxes = np.empty_like(xywh)
+    boxes[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+    boxes[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+    # offset boxes per class so one NMS call never suppresses across classes
+    offset = cls[:, None] * 7680.0
+    nms_boxes = np.concatenate([boxes[:, :2] + offset, xywh[:, 2:]], axis=1)
+    idx = cv2.dnn.NMSBoxes(nms_boxes.tolist(), scores.tolist(), conf, iou)
+    idx = np.array(idx, dtype=np.int64).reshape(-1)[:max_det]
+    kps = extras[idx].reshape(-1, 5, 3)[:, :, :2].astype(np.float32) if extras.shape[1] == 15 else None
+    return boxes[idx].astype(np.float32), scores[idx].astype(np.float32), kps
+
+class OnnxDetector:
+    """
+    Same API as Detector, running an ONNX export of the YOLO model through onnxruntime.
+    - the .pt weights are exported once to models_dir/<name>.onnx (and, with
+      int8, dynamically quantized to models_dir/<name>.int8.onnx); later
+      launches load the cached file without importing ultralytics/torch
+    - intra/inter-op thread counts come from config (0 = onnxruntime default)
+    """
+    def __init__(self, model_path=None, cfg=None, int8=None):
+        cfg = cfg if cfg is not None else load_config()
+        import onnxruntime as ort
+        self.conf = cfg.get('confidence_threshold', 0.45)
+        self.iou = cfg.get('nms_iou_threshold', 0.7)
+        self.imgsz = cfg.get('detector_imgsz', 640)
+        int8 = cfg.get('onnx_int8', False) if int8 is None else int8
+        self.model_path = self._prepare(model_path, cfg, int8)
+
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = cfg.get('onnx_intra_threads', 0)
+        opts.inter_op_num_threads = cfg.get('onnx_inter_threads', 1)
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(self.model_path, sess_options=opts,
+                                            providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        # fixed batch dimension unless the model was exported with dynamic axes
+        batch = self.session.get_inputs()[0].shape[0]
+        self.max_batch = batch if isinstance(batch, int) else None
+        self.n_classes = self._n_classes()
+
+    def _prepare(self, model_path, cfg, int8):
+        models_dir = cfg.get('models_dir', 'models')
+        pt_path = model_path or f"{models_dir}/yolov8-face.pt"
+
+        def cached(path, suffix):
+            stem = os.path.splitext(os.path.basename(path))[0]
+            return os.path.join(models_dir, f"{stem}{suffix}")
+
+        onnx_path = cached(pt_path, ".onnx")
+        if not os.path.exists(onnx_path) and not os.path.exists(pt_path):
+            print(f"⚠️ Face model {pt_path} not found. Falling back to yolov8n")
+            pt_path = os.path.join(models_dir, "yolov8n.pt")
+            onnx_path = cached(pt_path, ".onnx")
+        if not os.path.exists(onnx_path):
+            from ultralytics import YOLO
+            os.makedirs(models_dir, exist_ok=True)
+            print(f"📦 Exporting {pt_path} to ONNX (one-time) ...")
+            exported = YOLO(pt_path).export(format="onnx", imgsz=self.imgsz, dynamic=True)
+            if os.path.abspath(exported) != os.path.abspath(onnx_path):
+                shutil.move(exported, onnx_path)
+        if not int8:
+            return onnx_path
+        int8_path = cached(pt_path, ".int8.onnx")
+        if not os.path.exists(int8_path):
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            print(f"📦 Quantizing {onnx_path} to INT8 (one-time) ...")
+            quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QUInt8)
+        return int8_path
+
+    def _n_classes(self):
+        # ultralytics stores the class names dict in the ONNX metadata
+        names = self.session.get_modelmeta().custom_metadata_map.get('names')
+        if names:
+            return len(ast.literal_eval(names))
+        return self.session.get_outputs()[0].shape[1] - 4
+
+    def warmup(self, size=(640, 480)):
+        self.detect_batch([np.zeros((size[1], size[0], 3), dtype=np.uint8)])
+
+    def detect(self, frame):
+        boxes, confs, kps = self.detect_batch([frame], keypoints=True)[0]
+        return [{'bbox': [float(b[0]), float(b[1]), float(b[2]), float(b[3])], 'conf': float(c),
+                 'kps': None if kps is None else kps[i].tolist()}
+                for i, (b, c) in enumerate(zip(boxes, confs))]
+
+    def detect_batch(self, frames, keypoints=False):
+        """Same contract as Detector.detect_batch."""
+        if len(frames) == 0:
+            return []
+        step = self.max_batch or len(frames)
+        out = []
+        for start in range(0, len(frames), step):
+            chunk = frames[start:start + step]
+            boxed = [letterbox(f, self.imgsz) for f in chunk]
+            blob = np.stack([img[:, :, ::-1].transpose(2, 0, 1) for img, _, _ in boxed])
+            blob = np.ascontiguousarray(blob, dtype=np.float32) / 255.0
+            preds = self.session.run(None, {self.input_name: blob})[0]
+            for frame, (_, gain, (px, py)), pred in zip(chunk, boxed, preds):
+                boxes, confs, kps = decode_yolov8(pred, self.n_classes, self.conf, self.iou)
+                boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - px) / gain).clip(0, frame.shape[1])
+                boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - py) / gain).clip(0, frame.shape[0])
+                if not keypoints:
+                    out.append((boxes, confs))
+                    continue
+                if kps is not None:
+                    kps = (kps - np.array([px, py], dtype=np.float32)) / gain
+                out.append((boxes, confs, kps))
+        return out
+
+def make_detector(cfg):
+    """
+    Build the detector backend selected by config ("torch" or "onnx"), wrapped
+    in an AdaptiveDetector when a ROI, working resolution or tiling is configured.
+    """
+    backend = cfg.get('detector_backend', 'torch')
+    if backend == 'onnx':
+        detector = OnnxDetector(cfg=cfg)
+    elif backend == 'torch':
+        detector = Detector(cfg=cfg)
+    else:
+        raise ValueError(f"Unknown detector_backend: {backend}")
+    if cfg.get('detect_roi') or cfg.get('detect_width') or cfg.get('detect_tiles'):
+        from .tiling import AdaptiveDetector
+        detector = AdaptiveDetector(detector, cfg)
+    return detector
@@ -0,0 +1,342 @@
+# modules/event_log.py
+import bisect
+import datetime
+import glob
+import gzip
+import json
+import logging
+import os
+import threading
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: writes are only serialized within the process
+    fcntl = None
+
+# Layout for a log at logs/events.jsonl:
+#   logs/events.jsonl                       active segment, one JSON object per line
+#   logs/events.jsonl.idx                   its sparse index: "<ts> <byte offset>" lines
+#   logs/events.<first ts>.jsonl.gz         rotated segments; every index block is a
+#   logs/events.<first ts>.jsonl.gz.idx     separate gzip member, so the index holds
+#                                           compressed offsets a reader can seek to
+# Timestamps are ISO-8601 with milliseconds, so they sort as strings.
+
+def _stamp(ts):
+    return ts.replace("-", "").replace(":", "").replace(".", "")
+
+def _read_index(idx_path):
+    """([ts, ...], [offset, ...]) from an index file."""
+    tss, offsets = [], []
+    if os.path.exists(idx_path):
+        with open(idx_path) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2:
+                    tss.append(parts[0])
+                    offsets.append(int(parts[1]))
+    return tss, offsets
+
+def tail_lines(path, n=20, block=8192):
+    """Last n lines of a plain text file, read backwards from the end in blocks."""
+    if n <= 0 or not os.path.exists(path):
+        return []
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        data = b""
+        while end > 0 and data.count(b"\n") <= n:
+            start = max(0, end - block)
+            f.seek(start)
+            data = f.read(end - start) + data
+            end = start
+    lines = data.decode("utf-8", errors="replace").splitlines()
+    return lines[-n:]
+
+def compress_segment(plain_path):
+    """
+    gzip a rotated plain segment, one gzip member per index block, and rewrite
+    its index with compressed offsets. The plain file is removed afterwards.
+    """
+    tss, offsets = _read_index(plain_path + ".idx")
+    size = os.path.getsize(plain_path)
+    if not offsets or offsets[0] != 0:
+        tss, offsets = [tss[0] if tss else "0"], [0]
+    gz_path, tmp = plain_path + ".gz", plain_path + ".gz.tmp"
+    gz_index = []
+    with open(plain_path, "rb") as src, open(tmp, "wb") as dst:
+        bounds = offsets + [size]
+        for ts, start, end in zip(tss, bounds, bounds[1:]):
+            src.seek(start)
+            gz_index.append((ts, dst.tell()))
+            dst.write(gzip.compress(src.read(end - start)))
+        dst.flush()
+        os.fsync(dst.fileno())
+    with open(gz_path + ".idx.tmp", "w") as f:
+        f.writelines(f"{ts} {off}\n" for ts, off in gz_index)
+    os.replace(gz_path + ".idx.tmp", gz_path + ".idx")
+    os.replace(tmp, gz_path)
+    os.remove(plain_path)
+    if os.path.exists(plain_path + ".idx"):
+        os.remove(plain_path + ".idx")
+    return gz_path
+
+class JsonLinesHandler(logging.Handler):
+    """
+    logging handler writing one JSON object per record:
+      {"ts": "...", "level": "INFO", "msg": "...", <extra fields>}
+    - the segment rotates once it exceeds max_bytes or is older than
+      rotate_seconds; rotated segments are gzip-compressed on a background thread
+      and only the newest backup_count are kept (0 keeps all)
+    - every index_interval bytes a "<ts> <offset>" entry goes to the sparse index
+    Writes and rotation are serialized across processes with an flock on <path>.lock.
+    """
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, rotate_seconds=86400,
+                 backup_count=0, index_interval=64 * 1024):
+        super().__init__()
+        self.path = path
+        self.idx_path = path + ".idx"
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backup_count = backup_count
+        self.index_interval = index_interval
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lockfile = open(path + ".lock", "a")
+        self._f = None
+        self._inode = None
+        self._segment_start = None   # ts of the first record in the active segment
+        self._last_indexed = None    # offset of the last index entry
+        with self._flock():
+            # rotated segments left uncompressed by a crash
+            for plain in self._rotated_plain():
+                try:
+                    compress_segment(plain)
+                except OSError:
+                    pass  # being compressed by another process right now
+
+    def _flock(self):
+        handler = self
+
+        class _Guard:
+            def __enter__(self):
+                if fcntl is not None:
+                    fcntl.flock(handler._lockfile, fcntl.LOCK_EX)
+
+            def __exit__(self, *exc):
+                if fcntl is not None:
+                    fcntl.flock(handler._lockfile, fcntl.LOCK_UN)
+                return False
+        return _Guard()
+
+    def _rotated_plain(self):
+        base, ext = os.path.splitext(self.path)
+        return sorted(glob.glob(f"{glob.escape(base)}.*{ext}"))
+
+    def _open(self):
+        """(Re)open the active segment, e.g. after another process rotated it."""
+        if self._f is not None:
+            self._f.close()
+        self._f = open(self.path, "ab")
+        self._inode = os.fstat(self._f.fileno()).st_ino
+        tss, offsets = _read_index(self.idx_path)
+        self._segment_start = tss[0] if tss else None
+        self._last_indexed = offsets[-1] if offsets else None
+
+    def _stale(self):
+        try:
+            return os.stat(self.path).st_ino != self._inode
+        except FileNotFoundError:
+            return True
+
+    def _should_rotate(self, size, ts):
+        if size == 0 or self._segment_start is None:
+            return False
+        if self.max_bytes and size >= self.max_bytes:
+            return True
+        if self.rotate_seconds:
+            age = (datetime.datetime.fromisoformat(ts)
+                   - datetime.datetime.fromisoformat(self._segment_start)).total_seconds()
+            return age >= self.rotate_seconds
+        return False
+
+    def _rotate(self):
+        base, ext = os.path.splitext(self.path)
+        target = f"{base}.{_stamp(self._segment_start)}{ext}"
+        n = 1
+        while os.path.exists(target) or os.path.exists(target + ".gz"):
+            target = f"{base}.{_stamp(self._segment_start)}-{n}{ext}"
+            n += 1
+        self._f.close()
+        self._f = None
+        os.replace(self.path, target)
+        if os.path.exists(self.idx_path):
+            os.replace(self.idx_path, target + ".idx")
+        threading.Thread(target=self._compress, args=(target,), name="log-gzip", daemon=True).start()
+        self._open()
+
+    def _compress(self, plain):
+        try:
+            compress_segment(plain)
+        except Exception as e:
+            # the plain segment stays readable and is compressed on the next start;
+            # reported with print: logging it here would re-enter this handler
+            print(f"⚠️ Could not compress log segment {plain}: {e}")
+            return
+        if not self.backup_count:
+            return
+        try:
+            # under the same locks as emit/_rotate, so no other thread or process
+            # rotates or prunes while the backup list is being trimmed
+            with self.lock, self._flock():
+                for old in EventLog(self.path).rotated()[:-self.backup_count]:
+                    os.remove(old)
+                    if os.path.exists(old + ".idx"):
+                        os.remove(old + ".idx")
+        except Exception as e:
+            print(f"⚠️ Could not prune old log segments of {self.path}: {e}")
+
+    def format_record(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        return entry
+
+    def emit(self, record):
+        try:
+            entry = self.format_record(record)
+            line = (json.dumps(entry, default=str) + "\n").encode("utf-8")
+            ts = entry["ts"]
+            with self._flock():
+                if self._f is None or self._stale():
+                    self._open()
+                size = os.fstat(self._f.fileno()).st_size
+                if self._should_rotate(size, ts):
+                    self._rotate()
+                    size = 0
+                if size == 0 or self._last_indexed is None or size - self._last_indexed >= self.index_interval:
+                    with open(self.idx_path, "a") as idx:
+                        idx.write(f"{ts} {size}\n")
+                    self._last_indexed = size
+                    if size == 0:
+                        self._segment_start = ts
+                self._f.write(line)
+                self._f.flush()
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        with self.lock:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+            self._lockfile.close()
+        super().close()
+
+class EventLog:
+    """
+    Reader for a JsonLinesHandler log: tail() seeks from the end, search() uses
+    the segment names and sparse indexes to start reading near `start`.
+    """
+    def __init__(self, path="logs/events.jsonl"):
+        self.path = path
+
+    def rotated(self):
+        """Compressed segments, oldest first."""
+        base, ext = os.path.splitext(self.path)
+        return sorted(glob.glob(f"{glob.escape(base)}.*{ext}.gz"))
+
+    def segments(self):
+        """[(path, compressed)] oldest first; uncompressed leftovers and the active segment included."""
+        base, ext = os.path.splitext(self.path)
+        segs = [(p, True) for p in self.rotated()]
+        segs += [(p, False) for p in glob.glob(f"{glob.escape(base)}.*{ext}")]
+        segs.sort()
+        if os.path.exists(self.path):
+            segs.append((self.path, False))
+        return segs
+
+    @staticmethod
+    def _parse(line):
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None   # torn last line of a crashed writer
+
+    def _blocks_backwards(self, path, compressed):
+        """Lines of a segment, index block by index block from the end."""
+        if not compressed:
+            yield tail_lines(path, n=1 << 62)
+            return
+        _, offsets = _read_index(path + ".idx")
+        size = os.path.getsize(path)
+        bounds = offsets + [size]
+        with open(path, "rb") as f:
+            for start, end in reversed(list(zip(bounds, bounds[1:]))):
+                f.seek(start)
+                yield zlib.decompress(f.read(end - start), wbits=31).decode("utf-8").splitlines()
+
+    def tail(self, n=20):
+        """Last n records, oldest first."""
+        out = [r for r in map(self._parse, tail_lines(self.path, n)) if r is not None]
+        if len(out) >= n:
+            return out[-n:]
+        older = [seg for seg in self.segments() if seg[0] != self.path]
+        for path, compressed in reversed(older):
+            for lines in self._blocks_backwards(path, compressed):
+                out = [r for r in map(self._parse, lines) if r is not None] + out
+                if len(out) >= n:
+                    return out[-n:]
+        return out
+
+    def _segment_starts(self, segs):
+        starts = []
+        for path, _ in segs:
+            tss, _ = _read_index(path + ".idx")
+            starts.append(tss[0] if tss else "")
+        return starts
+
+    def _lines_from(self, path, compressed, offset):
+        with open(path, "rb") as f:
+            f.seek(offset)
+            stream = gzip.GzipFile(fileobj=f) if compressed else f
+            for raw in stream:
+                yield raw.decode("utf-8", errors="replace")
+
+    def search(self, start=None, end=None, level=None, contains=None, **fields):
+        """
+        Records with start <= ts <= end (ISO strings, any prefix such as
+        "2026-10-18" or "2026-10-18T14:00"), optionally filtered by level, a
+        message substring and exact field values (e.g. face_id=3).
+        """
+        end_key = end + "\uffff" if end else None   # "2026-10-18" includes the whole day
+        segs = self.segments()
+        starts = self._segment_starts(segs)
+        for i, (path, compressed) in enumerate(segs):
+            next_start = starts[i + 1] if i + 1 < len(segs) else None
+            if start and next_start and next_start < start:
+                continue
+            if end_key and starts[i] and starts[i] > end_key:
+                break
+            tss, offsets = _read_index(path + ".idx")
+            offset = 0
+            if start and tss:
+                # one block earlier: records from several processes can be a few ms out of order
+                offset = offsets[max(0, bisect.bisect_left(tss, start) - 2)]
+            for line in self._lines_from(path, compressed, offset):
+                rec = self._parse(line)
+                if rec is None:
+                    continue
+                ts = rec.get("ts", "")
+                if start and ts < start:
+                    continue
+                if end_key and ts > end_key:
+                    break
+                if level and rec.get("level") != level:
+                    continue
+                if contains and contains not in rec.get("msg", ""):
+                    continue
+                if any(rec.get(k) != v for k, v in fields.items()):
+                    continue
+                yield rec
@@ -0,0 +1,118 @@
+# modules/event_sink.py
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from .utils import ensure_dir, get_timestamp, crop_face
+
+_STOP = object()
+_FLUSH = object()
+
+class EventSink:
+    """
+    Asynchronous, batched writer for entry/exit events.
+    - face crops are JPEG-encoded and written on a small thread pool, or handed
+      to a CropStore (packed, deduplicated) when one is given
+    - events are inserted with Database.insert_events in one transaction per
+      batch, flushed every `batch_size` events or `flush_interval` seconds
+    - flush() waits until everything queued so far is stored; close() drains and stops
+    """
+    def __init__(self, db, logs_dir='logs', batch_size=64, flush_interval=1.0,
+                 encode_workers=2, max_queue=1024, on_stored=None, crop_store=None):
+        self.db = db
+        self.crop_store = crop_store
+        self.logs_dir = logs_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_stored = on_stored  # callback(face_id, event_type, path, crop_error, db_error) per event
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pool = ThreadPoolExecutor(max_workers=encode_workers, thread_name_prefix="event-jpeg")
+        self._thread = threading.Thread(target=self._run, name="event-sink", daemon=True)
+        self._thread.start()
+
+    def event_path(self, face_id, event_type, timestamp):
+        date = timestamp.split('T')[0]
+        filename = f"{event_type}_{face_id}_{timestamp.replace(':','-')}.jpg"
+        return os.path.join(self.logs_dir, f"{event_type}s", date, filename)
+
+    @staticmethod
+    def _write_crop(path, face_img):
+        ensure_dir(os.path.dirname(path))
+        # OpenCV uses BGR; ensure saving works (imwrite reports failure, it doesn't raise)
+        if not cv2.imwrite(path, face_img):
+            raise IOError(f"cv2.imwrite failed for {path}")
+
+    def submit(self, face_id, event_type, bbox, frame, video_key=None, frame_idx=None):
+        """Queue an event; the crop is taken now, everything else happens later. Returns the image path / crop ref."""
+        timestamp = get_timestamp()
+        if self.crop_store is not None:
+            path, written = self.crop_store.submit(event_type, face_id, crop_face(frame, bbox), timestamp)
+        else:
+            path = self.event_path(face_id, event_type, timestamp)
+            written = self._pool.submit(self._write_crop, path, crop_face(frame, bbox))
+        self._queue.put((face_id, event_type, timestamp, path, video_key, frame_idx, written))
+        return path
+
+    def _run(self):
+        pending = []
+        deadline = None
+        stopping = False
+        while not stopping:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                stopping = True
+            elif item is not None and item is not _FLUSH:
+                pending.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            due = deadline is not None and time.monotonic() >= deadline
+            if pending and (stopping or due or item is _FLUSH or len(pending) >= self.batch_size):
+                try:
+                    self._store(pending)
+                except Exception as e:
+                    # keep the sink alive: a dead thread would block flush() forever
+                    print(f"⚠️ Event sink failed to store {len(pending)} events: {e}")
+                finally:
+                    for _ in pending:
+                        self._queue.task_done()
+                pending = []
+                deadline = None
+            if item is _STOP or item is _FLUSH:
+                self._queue.task_done()
+
+    def _store(self, items):
+        crop_errors = []
+        for *_, written in items:
+            try:
+                written.result()
+                crop_errors.append(None)
+            except Exception as e:
+                crop_errors.append(e)
+        rows = [item[:6] for item in items]
+        db_error = None
+        try:
+            self.db.insert_events(rows)
+        except Exception as e:
+            db_error = e
+        if self.on_stored:
+            for (face_id, event_type, _, path, _, _), crop_error in zip(rows, crop_errors):
+                try:
+                    self.on_stored(face_id, event_type, path, crop_error, db_error)
+                except Exception as e:
+                    print(f"⚠️ Event sink callback failed for face {face_id} {event_type}: {e}")
+
+    def flush(self):
+        """Block until every event submitted so far is written and committed."""
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,179 @@
+# modules/frame_ring.py
+import multiprocessing as mp
+import queue
+from multiprocessing import shared_memory
+import numpy as np
+import cv2
+from .frame_source import FrameSampler, make_motion_gate
+
+class FrameRing:
+    """
+    Fixed-size ring of frame slots in shared memory.
+    - Only (slot, metadata) tuples travel through queues; pixels stay in place
+    - Each slot carries a reference count; it is reused once every holder released it
+    - acquire() blocks while all slots are in use (back-pressure on the producer)
+    The ring can be passed to a multiprocessing.Process at creation time.
+    """
+    def __init__(self, n_slots, shape, dtype=np.uint8):
+        self.n_slots = n_slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slot_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self._frames = shared_memory.SharedMemory(create=True, size=n_slots * self.slot_bytes)
+        self._refs = shared_memory.SharedMemory(create=True, size=n_slots * 4)
+        self._lock = mp.Lock()
+        self._free = mp.Semaphore(n_slots)
+        self._refcounts()[:] = 0
+        self._owner = True
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_owner'] = False
+        return state
+
+    def _refcounts(self):
+        return np.ndarray((self.n_slots,), dtype=np.int32, buffer=self._refs.buf)
+
+    def view(self, slot):
+        """Writable ndarray view of a slot (no copy)."""
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=self._frames.buf,
+                          offset=slot * self.slot_bytes)
+
+    def acquire(self, refs=1, timeout=None):
+        """Reserve a free slot with `refs` initial holders; None on timeout."""
+        if not self._free.acquire(timeout=timeout):
+            return None
+        with self._lock:
+            counts = self._refcounts()
+            slot = int(np.flatnonzero(counts == 0)[0])
+            counts[slot] = refs
+        return slot
+
+    def retain(self, slot, n=1):
+        with self._lock:
+            self._refcounts()[slot] += n
+
+    def release(self, slot):
+        """Drop one reference; the slot becomes free when the count reaches zero."""
+        with self._lock:
+            counts = self._refcounts()
+            counts[slot] -= 1
+            freed = counts[slot] == 0
+        if freed:
+            self._free.release()
+
+    def close(self):
+        if self._owner:
+            self._frames.unlink()
+            self._refs.unlink()
+        for shm in (self._frames, self._refs):
+            try:
+                shm.close()
+            except BufferError:
+                pass  # views still referenced; memory is freed once they are gone
+
+_EOF = "eof"   # last queue item when the whole video was decoded (None: stopped early)
+
+class GateCounters:
+    """checked / skipped of the decoder process's MotionGate, readable from the parent."""
+    def __init__(self):
+        self._checked = mp.RawValue('q', 0)
+        self._skipped = mp.RawValue('q', 0)
+
+    @property
+    def checked(self):
+        return self._checked.value
+
+    @property
+    def skipped(self):
+        return self._skipped.value
+
+    def update(self, gate):
+        self._checked.value = gate.checked
+        self._skipped.value = gate.skipped
+
+def _decode_worker(video_path, ring, out_q, cfg, stop, start_frame=0, counters=None):
+    """Child process: sample/gate frames and decode them straight into ring slots."""
+    cap = cv2.VideoCapture(video_path)
+    sampler = FrameSampler(cap, frame_skip=cfg.get("frame_skip", 5),
+                           target_fps=cfg.get("target_detect_fps"))
+    sampler.seek(start_frame)
+    gate = make_motion_gate(cfg)
+    try:
+        while not stop.is_set():
+            slot = ring.acquire(timeout=0.1)
+            if slot is None:
+                continue
+            view = ring.view(slot)
+            item = sampler.read(out=view)
+            if item is None:
+                ring.release(slot)
+                break
+            idx, frame = item
+            if frame is not view:
+                # OpenCV reallocated (unexpected size/type): copy into the slot
+                view[...] = frame.reshape(view.shape)
+            run_detector = gate is None or gate.should_detect(view)
+            if gate is not None:
+                counters.update(gate)
+            out_q.put((idx, slot, run_detector))
+    finally:
+        cap.release()
+        out_q.put(_EOF if sampler.eof else None)
+
+class ProcessDecoder:
+    """
+    Decodes a video in a separate process into a shared-memory FrameRing.
+    read() returns (frame_idx, frame_view, run_detector, slot); the consumer
+    calls release(slot) when it no longer needs the frame.
+    Decoding starts after `start_frame` (see FrameSampler.seek).
+    The motion gate runs in the child too; `gate` exposes its checked / skipped
+    counts (None when the gate is disabled).
+    """
+    def __init__(self, video_path, frame_shape, cfg, n_slots=32, start_frame=0):
+        self.ring = FrameRing(n_slots, frame_shape)
+        self.gate = GateCounters() if cfg.get("motion_gate", False) else None
+        self._queue = mp.Queue()
+        self._stop = mp.Event()
+        self._proc = mp.Process(target=_decode_worker, name="frame-decoder",
+                                args=(video_path, self.ring, self._queue, cfg, self._stop, start_frame,
+                                      self.gate),
+                                daemon=True)
+        self._proc.start()
+        self._done = False
+        self.eof = False
+
+    def read(self):
+        while not self._done:
+            try:
+                item = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if not self._proc.is_alive():
+                    self._done = True
+                continue
+            if item is None or item == _EOF:
+                self._done = True
+                self.eof = item == _EOF
+                break
+            idx, slot, run_detector = item
+            return idx, self.ring.view(slot), run_detector, slot
+        return None
+
+    def release(self, slot):
+        if slot is not None:
+            self.ring.release(slot)
+
+    def close(self):
+        self._stop.set()
+        # drain so the child can finish its final put
+        try:
+            while self._proc.is_alive():
+                item = self._queue.get(timeout=0.5)
+                if item is not None:
+                    self.ring.release(item[1])
+        except queue.Empty:
+            pass
+        self._proc.join(timeout=5)
+        if self._proc.is_alive():
+            self._proc.terminate()
+        self.ring.close()
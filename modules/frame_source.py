@@ -0,0 +1,138 @@
+# modules/frame_source.py
+import cv2
+import numpy as np
+
+class FrameSampler:
+    """
+    Reads only the frames that will be processed from a cv2.VideoCapture.
+    - Frames that are skipped are grab()-ed but never retrieve()-d (no decode copy)
+    - Samples every `frame_skip`-th frame, or, when `target_fps` is set,
+      a fixed number of frames per second of video regardless of source FPS
+    """
+    def __init__(self, cap, frame_skip=5, target_fps=None):
+        self.cap = cap
+        self.frame_skip = max(1, int(frame_skip))
+        self.src_fps = cap.get(cv2.CAP_PROP_FPS) or 20
+        self.target_fps = target_fps
+        self.frame_idx = 0        # 1-based index of the last grabbed frame
+        self._next_t = 0.0        # next sample time in video seconds (time-based mode)
+        self.eof = False          # set once the end of the stream was reached
+
+    def _wanted(self, idx):
+        if not self.target_fps:
+            return idx % self.frame_skip == 0
+        t = (idx - 1) / self.src_fps
+        if t + 1e-9 >= self._next_t:
+            self._next_t += 1.0 / self.target_fps
+            if self._next_t <= t:
+                # source slower than target: don't accumulate a backlog
+                self._next_t = t + 1.0 / self.target_fps
+            return True
+        return False
+
+    def seek(self, frame_idx):
+        """Continue after (1-based) frame `frame_idx`, e.g. when resuming from a checkpoint."""
+        if frame_idx <= 0:
+            return
+        if not self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx):
+            # not seekable: skip ahead by grabbing
+            while self.frame_idx < frame_idx and self.cap.grab():
+                self.frame_idx += 1
+        self.frame_idx = frame_idx
+        self._next_t = frame_idx / self.src_fps
+
+    def read(self, out=None):
+        """
+        Return (frame_idx, frame) for the next sampled frame, or None at end of stream.
+        `out` optionally is a preallocated array to decode into (e.g. a shared-memory slot).
+        """
+        while True:
+            if not self.cap.grab():
+                self.eof = True
+                return None
+            self.frame_idx += 1
+            if not self._wanted(self.frame_idx):
+                continue
+            ret, frame = self.cap.retrieve(out) if out is not None else self.cap.retrieve()
+            if not ret:
+                self.eof = True
+                return None
+            return self.frame_idx, frame
+
+class SampledSource:
+    """
+    In-process frame source for the pipeline: sampler + optional motion gate.
+    read() returns (frame_idx, frame, run_detector, token) like ProcessDecoder;
+    release(token) is a no-op because frames are ordinary arrays.
+    """
+    def __init__(self, sampler, gate=None):
+        self.sampler = sampler
+        self.gate = gate
+
+    def read(self):
+        item = self.sampler.read()
+        if item is None:
+            return None
+        idx, frame = item
+        return idx, frame, self.gate is None or self.gate.should_detect(frame), None
+
+    @property
+    def eof(self):
+        return self.sampler.eof
+
+    def release(self, token):
+        pass
+
+    def close(self):
+        pass
+
+class MotionGate:
+    """
+    Cheap frame-difference test deciding whether a frame needs the detector.
+    - Compares a blurred, downscaled grayscale copy with the previous sampled frame
+    - Reports motion when the fraction of changed pixels >= min_area
+    - Forces a detection every `refresh_frames` gated frames so tracks of people
+      standing still are re-confirmed before the tracker drops them
+    """
+    def __init__(self, width=160, pixel_threshold=25, min_area=0.002, refresh_frames=10):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.min_area = min_area
+        self.refresh_frames = refresh_frames
+        self.prev = None
+        self.since_detect = 0
+        self.checked = 0
+        self.skipped = 0
+
+    def _small(self, frame):
+        h, w = frame.shape[:2]
+        scale = self.width / float(w)
+        small = cv2.resize(frame, (self.width, max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def should_detect(self, frame):
+        small = self._small(frame)
+        prev, self.prev = self.prev, small
+        self.checked += 1
+        moving = True
+        if prev is not None and prev.shape == small.shape:
+            changed = cv2.absdiff(small, prev) > self.pixel_threshold
+            moving = float(np.count_nonzero(changed)) / changed.size >= self.min_area
+        if moving or self.since_detect + 1 >= self.refresh_frames:
+            self.since_detect = 0
+            return True
+        self.since_detect += 1
+        self.skipped += 1
+        return False
+
+def make_motion_gate(cfg):
+    """Build a MotionGate from config, or None when motion gating is off."""
+    if not cfg.get("motion_gate", False):
+        return None
+    return MotionGate(
+        width=cfg.get("motion_width", 160),
+        pixel_threshold=cfg.get("motion_pixel_threshold", 25),
+        min_area=cfg.get("motion_min_area", 0.002),
+        refresh_frames=cfg.get("motion_refresh_frames", 10),
+    )
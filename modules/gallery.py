@@ -0,0 +1,89 @@
+# modules/gallery.py
+import numpy as np
+
+class GalleryIndex:
+    """
+    Resident, vectorized index of registered face embeddings.
+    - Keeps a contiguous float32 matrix of L2-normalized embeddings
+    - Keeps a parallel int64 array of visitor ids
+    - Matching is one matrix product instead of a Python loop over rows
+    """
+    def __init__(self, dim=None, capacity=1024):
+        self.dim = dim
+        self._size = 0
+        self._capacity = max(1, int(capacity))
+        self._ids = np.empty(self._capacity, dtype=np.int64)
+        self._vecs = None if dim is None else np.empty((self._capacity, dim), dtype=np.float32)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def ids(self):
+        """Visitor ids, row-aligned with `vectors` (view, do not modify)."""
+        return self._ids[:self._size]
+
+    @property
+    def vectors(self):
+        """(N, D) float32 matrix of normalized embeddings (view, do not modify)."""
+        if self._vecs is None:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return self._vecs[:self._size]
+
+    @staticmethod
+    def normalize(embs):
+        """Return a (N, D) float32 copy of `embs` with unit-length rows."""
+        embs = np.atleast_2d(np.asarray(embs, dtype=np.float32))
+        norms = np.linalg.norm(embs, axis=1, keepdims=True) + 1e-10
+        return embs / norms
+
+    def _reserve(self, n):
+        if n <= self._capacity:
+            return
+        cap = self._capacity
+        while cap < n:
+            cap *= 2
+        ids = np.empty(cap, dtype=np.int64)
+        ids[:self._size] = self._ids[:self._size]
+        vecs = np.empty((cap, self.dim), dtype=np.float32)
+        vecs[:self._size] = self._vecs[:self._size]
+        self._ids, self._vecs, self._capacity = ids, vecs, cap
+
+    def add(self, ids, embs):
+        """Append embeddings (normalized here) for the given visitor ids."""
+        ids = np.atleast_1d(np.asarray(ids, dtype=np.int64))
+        embs = self.normalize(embs)
+        if len(ids) != len(embs):
+            raise ValueError("ids and embeddings must have the same length")
+        if len(ids) == 0:
+            return
+        if self.dim is None:
+            self.dim = embs.shape[1]
+            self._vecs = np.empty((self._capacity, self.dim), dtype=np.float32)
+        if embs.shape[1] != self.dim:
+            raise ValueError(f"embedding dim {embs.shape[1]} != gallery dim {self.dim}")
+        self._reserve(self._size + len(ids))
+        self._ids[self._size:self._size + len(ids)] = ids
+        self._vecs[self._size:self._size + len(ids)] = embs
+        self._size += len(ids)
+
+    def search(self, queries, k=1):
+        """
+        Exact cosine search.
+        Returns (sims, ids), both shaped (Q, k') with k' = min(k, len(self)),
+        sorted by decreasing similarity.
+        """
+        queries = self.normalize(queries)
+        k = min(int(k), self._size)
+        if k <= 0:
+            return (np.empty((len(queries), 0), dtype=np.float32),
+                    np.empty((len(queries), 0), dtype=np.int64))
+        sims = queries @ self.vectors.T  # (Q, N)
+        if k < self._size:
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(self._size), (len(queries), self._size))
+        top_sims = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_sims, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        return np.take_along_axis(top_sims, order, axis=1), self.ids[top]
@@ -0,0 +1,197 @@
+# modules/live.py
+import math
+import threading
+import time
+from collections import deque
+import cv2
+import numpy as np
+from .frame_source import make_motion_gate
+from .logger import log_system, flush_events
+from .processing import FrameHandler, detect_frames, draw_tracks
+from .tracker import make_tracker
+
+class LatestFrameGrabber:
+    """
+    Background reader that keeps only the newest frame (latest-frame-wins).
+    - cameras / stream URLs are read as fast as they deliver
+    - replay=True paces a local file at its native FPS, as a stand-in for a camera
+    - frames overwritten before the consumer picked them up are counted as dropped
+    """
+    def __init__(self, source, replay=False):
+        self.source = int(source) if str(source).isdigit() else source
+        self.replay = replay
+        self.cap = cv2.VideoCapture(self.source)
+        if not self.cap.isOpened():
+            raise IOError(f"Cannot open stream {source}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 25
+        self.captured = 0
+        self.dropped = 0
+        self.finished = False
+        self._latest = None          # (seq, frame, capture_time)
+        self._consumed_seq = 0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="live-grabber", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        start = time.monotonic()
+        while not self._stop.is_set():
+            if self.replay:
+                # wall-clock pacing: frame n is due at start + n / fps
+                delay = start + self.captured / self.fps - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            now = time.monotonic()
+            with self._cond:
+                self.captured += 1
+                if self._latest is not None and self._latest[0] > self._consumed_seq:
+                    self.dropped += 1
+                self._latest = (self.captured, frame, now)
+                self._cond.notify()
+        with self._cond:
+            self.finished = True
+            self._cond.notify()
+
+    def read(self, timeout=1.0):
+        """Newest frame not returned before, as (seq, frame, capture_time); None if none arrived."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.finished or
+                                (self._latest is not None and self._latest[0] > self._consumed_seq),
+                                timeout=timeout)
+            if self._latest is None or self._latest[0] <= self._consumed_seq:
+                return None
+            self._consumed_seq = self._latest[0]
+            return self._latest
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=2)
+        self.cap.release()
+
+class AdaptiveSkip:
+    """
+    Chooses how many source frames to skip from the measured processing time,
+    so the loop only takes frames it can finish within the latency budget.
+    - keeps an EMA of per-frame processing seconds
+    - skip = ceil(ema * fps / headroom), clamped to [1, max_skip]
+    """
+    def __init__(self, fps, initial_skip=1, max_skip=30, headroom=0.8, alpha=0.2):
+        self.fps = fps
+        self.skip = max(1, initial_skip)
+        self.max_skip = max_skip
+        self.headroom = headroom
+        self.alpha = alpha
+        self.ema = None
+
+    def update(self, seconds):
+        self.ema = seconds if self.ema is None else self.alpha * seconds + (1 - self.alpha) * self.ema
+        self.skip = int(min(self.max_skip, max(1, math.ceil(self.ema * self.fps / self.headroom))))
+        return self.skip
+
+class LatencyStats:
+    """
+    Capture-to-event latency (seconds): percentiles over the last `window`
+    samples, frame / over-budget counts and max over the whole run.
+    """
+    def __init__(self, budget, window=1024):
+        self.budget = budget
+        self.samples = deque(maxlen=window)
+        self.frames = 0
+        self.max = 0.0
+        self.over_budget = 0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.frames += 1
+        self.max = max(self.max, seconds)
+        if seconds > self.budget:
+            self.over_budget += 1
+
+    def summary(self):
+        if not self.samples:
+            return {"frames": 0}
+        arr = np.array(self.samples) * 1000.0
+        return {"frames": self.frames, "p50_ms": float(np.percentile(arr, 50)),
+                "p95_ms": float(np.percentile(arr, 95)), "max_ms": self.max * 1000.0,
+                "over_budget": self.over_budget}
+
+def run_live(source, detector, recognizer, db, dm, cfg, replay=False):
+    """
+    Process a camera / stream URL (or a file replayed at wall-clock rate) with
+    bounded end-to-end latency. Stale frames are dropped instead of queued, frames
+    already older than the latency budget when picked up are skipped, and
+    frame_skip adapts to the measured processing time.
+    Returns the final stats dict.
+    """
+    budget = cfg.get("live_latency_budget_ms", 500) / 1000.0
+    report_every = cfg.get("live_report_interval", 10.0)
+    show = cfg.get("show_video", True)
+
+    grabber = LatestFrameGrabber(source, replay=replay).start()
+    skipper = AdaptiveSkip(grabber.fps, initial_skip=cfg.get("frame_skip", 5),
+                           max_skip=cfg.get("live_max_skip", 30))
+    latency = LatencyStats(budget)
+    handler = FrameHandler(recognizer, make_tracker(cfg), db, dm, cfg)
+    gate = make_motion_gate(cfg)
+
+    print(f"🔴 Live processing {source} (latency budget {budget * 1000:.0f} ms) ...")
+    log_system(f"Started live processing {source}")
+    last_seq = 0
+    skipped = 0
+    stale = 0
+    last_report = time.monotonic()
+    try:
+        while True:
+            item = grabber.read(timeout=1.0)
+            if item is None:
+                if grabber.finished:
+                    break
+                continue
+            seq, frame, captured_at = item
+            if seq - last_seq < skipper.skip:
+                skipped += 1
+                continue
+            last_seq = seq
+
+            started = time.monotonic()
+            if started - captured_at > budget:
+                # its events would be late anyway; wait for a fresher frame
+                stale += 1
+                continue
+            run = [gate is None or gate.should_detect(frame)]
+            all_bboxes, all_kps = detect_frames(detector, [frame], 1, run=run)
+            tracks = handler.handle(frame, seq, all_bboxes[0], det_kps=all_kps[0])
+            done = time.monotonic()
+            # events for this frame have been emitted (queued) by now
+            latency.add(done - captured_at)
+            skipper.update(done - started)
+
+            if show:
+                cv2.imshow("Face Tracker", draw_tracks(frame, tracks))
+                if cv2.waitKey(1) & 0xFF == ord("q"):
+                    break
+
+            if done - last_report >= report_every:
+                last_report = done
+                s = latency.summary()
+                log_system(f"Live {source}: captured={grabber.captured} dropped={grabber.dropped} "
+                           f"skipped={skipped} stale={stale} frame_skip={skipper.skip} "
+                           f"latency p50={s['p50_ms']:.0f}ms p95={s['p95_ms']:.0f}ms "
+                           f"over_budget={s['over_budget']}")
+    finally:
+        grabber.stop()
+        handler.finish(source)
+        flush_events()
+
+    stats = dict(latency.summary(), captured=grabber.captured, dropped=grabber.dropped,
+                 skipped=skipped, stale=stale, frame_skip=skipper.skip)
+    log_system(f"Finished live processing {source}: {stats}")
+    print(f"✅ Live stream ended: {stats}")
+    return stats
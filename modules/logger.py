@@ -4,56 +4,169 @@ import os
 import cv2
 from .utils import load_config, ensure_dir, get_timestamp, crop_face
 from .database import Database
+from .event_sink import EventSink
+from .event_log import JsonLinesHandler
 
-cfg = load_config()
-ensure_dir(cfg.get('logs_dir', 'logs'))
-
-# Setup a simple file logger
 logger = logging.getLogger('face_tracker')
-logger.setLevel(logging.INFO)
-if not logger.handlers:
-    fh = logging.FileHandler(cfg.get('log_path', 'events.log'))
-    fmt = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    fh.setFormatter(fmt)
-    logger.addHandler(fh)
 
-# DB instance (shared)
-db = Database(cfg.get('db_path', 'db/visitors.db'))
+# Config used for paths; set by configure() (main passes its already loaded
+# config), else read from config.json on first use. Importing this module has
+# no side effects on disk.
+cfg = None
+
+def configure(config=None):
+    """
+    Set the config, create the logs dir and attach the file handler: plain text
+    events.log, or with log_format "jsonl" a rotating, indexed JSON-lines log
+    (see modules/event_log.py).
+    """
+    global cfg
+    cfg = config if config is not None else load_config()
+    ensure_dir(cfg.get('logs_dir', 'logs'))
+    logger.setLevel(logging.INFO)
+    if not logger.handlers:
+        if cfg.get('log_format', 'text') == 'jsonl':
+            fh = JsonLinesHandler(
+                cfg.get('json_log_path', 'logs/events.jsonl'),
+                max_bytes=cfg.get('log_max_bytes', 10 * 1024 * 1024),
+                rotate_seconds=cfg.get('log_rotate_seconds', 86400),
+                backup_count=cfg.get('log_backup_count', 0),
+                index_interval=cfg.get('log_index_interval', 64 * 1024),
+            )
+        else:
+            # Setup a simple file logger
+            fh = logging.FileHandler(cfg.get('log_path', 'events.log'))
+            fmt = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+            fh.setFormatter(fmt)
+        logger.addHandler(fh)
+    return cfg
+
+def _cfg():
+    return cfg if cfg is not None else configure()
+
+# DB used for events: the caller's Database (or DatabaseManager proxy) handed
+# over with set_database, else a private connection opened on first use
+db = None
+_own_db = False
+# optional asynchronous EventSink (see start_event_sink)
+_sink = None
+# optional CropStore for event crops (see set_crop_store)
+_crop_store = None
+
+def set_database(database):
+    global db
+    db = database
+
+def set_crop_store(store):
+    """Store event crops in `store` (a CropStore) instead of one JPEG file each."""
+    global _crop_store
+    _crop_store = store
+
+def _get_db():
+    global db, _own_db
+    if db is None:
+        db = Database(_cfg().get('db_path', 'db/visitors.db'))
+        _own_db = True
+    return db
+
+def log_system(message, **fields):
+    """Write a line to the event log; `fields` become keys of the JSON record in jsonl mode."""
+    if cfg is None:
+        configure()
+    logger.info(message, extra={"fields": fields})
+
+def _on_event_stored(face_id, event_type, path, crop_error, db_error):
+    if crop_error is not None:
+        log_system(f"Crop write failed for face {face_id} {event_type} ({path}): {crop_error}",
+                   face_id=face_id, event=event_type, path=path, error=str(crop_error))
+    if db_error is not None:
+        log_system(f"DB insert_event failed for face {face_id}: {db_error}",
+                   face_id=face_id, event=event_type, error=str(db_error))
+    # log to events.log too
+    log_system(f"{event_type.upper()} - face_id={face_id} path={path}",
+               face_id=face_id, event=event_type, path=path)
+
+def start_event_sink(database, config=None):
+    """
+    Route log_face_event through an asynchronous EventSink writing to `database`.
+    Crops are encoded on a thread pool and events inserted in batches.
+    """
+    global _sink
+    config = config or _cfg()
+    set_database(database)
+    _sink = EventSink(
+        database,
+        logs_dir=config.get('logs_dir', 'logs'),
+        batch_size=config.get('event_batch_size', 64),
+        flush_interval=config.get('event_flush_interval', 1.0),
+        encode_workers=config.get('event_encode_workers', 2),
+        on_stored=_on_event_stored,
+        crop_store=_crop_store,
+    )
+    return _sink
 
-def log_system(message):
-    """Write a line to events.log via logging module."""
-    logger.info(message)
+def flush_events():
+    """Wait until all queued events and crops are stored."""
+    if _sink is not None:
+        _sink.flush()
+    if _crop_store is not None:
+        _crop_store.flush()
 
-def log_face_event(face_id, event_type, bbox, frame):
+def log_face_event(face_id, event_type, bbox, frame, video_key=None, frame_idx=None):
     """
     Save cropped face image, insert event into DB, and log summary.
       - event_type: 'entry' or 'exit'
       - bbox: [x1,y1,x2,y2]
       - frame: full BGR image
+      - video_key: processing_state key of the source video, if any
+      - frame_idx: source frame that emitted the event, if any
+    With an event sink running, this only queues the event.
     """
-    timestamp = get_timestamp()
-    date = timestamp.split('T')[0]
-    base_dir = os.path.join(cfg.get('logs_dir', 'logs'), f"{event_type}s", date)
-    ensure_dir(base_dir)
-    filename = f"{event_type}_{face_id}_{timestamp.replace(':','-')}.jpg"
-    path = os.path.join(base_dir, filename)
+    if _sink is not None:
+        _sink.submit(face_id, event_type, bbox, frame, video_key, frame_idx)
+        return
 
-    # crop and save face image
+    timestamp = get_timestamp()
     face_img = crop_face(frame, bbox)
-    # OpenCV uses BGR; ensure saving works
-    cv2.imwrite(path, face_img)
+    crop_error = None
+    try:
+        if _crop_store is not None:
+            path = _crop_store.put(event_type, face_id, face_img, timestamp)
+        else:
+            path = _write_event_crop(face_id, event_type, timestamp, face_img)
+    except Exception as e:
+        # the event itself is still recorded, without its crop
+        crop_error, path = e, None
 
     # insert into DB
+    db_error = None
     try:
-        db.insert_event(face_id, event_type, timestamp, path)
+        _get_db().insert_event(face_id, event_type, timestamp, path, video_key, frame_idx)
     except Exception as e:
-        log_system(f"DB insert_event failed for face {face_id}: {e}")
+        db_error = e
+    _on_event_stored(face_id, event_type, path, crop_error, db_error)
 
-    # log to events.log too
-    log_system(f"{event_type.upper()} - face_id={face_id} path={path}")
+def _write_event_crop(face_id, event_type, timestamp, face_img):
+    date = timestamp.split('T')[0]
+    base_dir = os.path.join(_cfg().get('logs_dir', 'logs'), f"{event_type}s", date)
+    ensure_dir(base_dir)
+    filename = f"{event_type}_{face_id}_{timestamp.replace(':','-')}.jpg"
+    path = os.path.join(base_dir, filename)
+    # OpenCV uses BGR; ensure saving works (imwrite reports failure, it doesn't raise)
+    if not cv2.imwrite(path, face_img):
+        raise IOError(f"cv2.imwrite failed for {path}")
+    return path
 
 def close():
-    try:
-        db.close()
-    except Exception:
-        pass
+    """Drain the event sink and close the private DB connection, if any."""
+    global _sink, db, _own_db
+    if _sink is not None:
+        _sink.close()
+        _sink = None
+    if _own_db:
+        try:
+            db.close()
+        except Exception:
+            pass
+        db = None
+        _own_db = False
@@ -0,0 +1,231 @@
+# modules/metrics.py
+import bisect
+import io
+import json
+import os
+import pstats
+import threading
+import time
+
+# Upper bounds (ms) of the latency histogram buckets, Prometheus-style (cumulative on export)
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+class Histogram:
+    """Fixed-bucket histogram with count / sum / min / max; percentiles are bucket estimates."""
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None or value < self.min else self.min
+        self.max = value if self.max is None or value > self.max else self.max
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = q / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0}
+        return {"count": self.count, "sum": self.sum, "mean": self.sum / self.count,
+                "min": self.min, "max": self.max,
+                "p50": self.percentile(50), "p95": self.percentile(95), "p99": self.percentile(99)}
+
+class _Timer:
+    __slots__ = ("metrics", "name", "started")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, (time.perf_counter() - self.started) * 1000.0)
+        return False
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL = _NullTimer()
+
+class Metrics:
+    """
+    Per-run instrumentation:
+      - stage latency histograms in ms (stage("detect") as a context manager)
+      - value histograms (e.g. faces per frame), counters and gauges
+    Thread-safe, so pipeline stages can record from their own threads.
+    """
+    def __init__(self, name="run"):
+        self.name = name
+        self.started = time.time()
+        self.latency = {}
+        self.values = {}
+        self.counters = {}
+        self.gauges = {}
+        self._marks = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name):
+        return _Timer(self, name)
+
+    def observe(self, name, ms):
+        with self._lock:
+            h = self.latency.get(name)
+            if h is None:
+                h = self.latency[name] = Histogram(LATENCY_BUCKETS_MS)
+            h.observe(ms)
+
+    def mark(self, key):
+        """Remember a start time under `key` (e.g. a frame index) for observe_since()."""
+        self._marks[key] = time.perf_counter()
+
+    def observe_since(self, name, key):
+        started = self._marks.pop(key, None)
+        if started is not None:
+            self.observe(name, (time.perf_counter() - started) * 1000.0)
+
+    def observe_value(self, name, value, buckets=COUNT_BUCKETS):
+        with self._lock:
+            h = self.values.get(name)
+            if h is None:
+                h = self.values[name] = Histogram(buckets)
+            h.observe(value)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def summary(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "wall_seconds": time.time() - self.started,
+                "stages_ms": {k: h.summary() for k, h in sorted(self.latency.items())},
+                "values": {k: h.summary() for k, h in sorted(self.values.items())},
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+            }
+
+    def prometheus(self, prefix="face_tracker"):
+        """Prometheus text exposition of the current metrics."""
+        lines = []
+        label = f'run="{self.name}"'
+        with self._lock:
+            for metric, hists, unit in ((f"{prefix}_stage_latency_ms", self.latency, "stage"),
+                                        (f"{prefix}_value", self.values, "name")):
+                if not hists:
+                    continue
+                lines.append(f"# TYPE {metric} histogram")
+                for key, h in sorted(hists.items()):
+                    labels = f'{label},{unit}="{key}"'
+                    cumulative = 0
+                    for bound, n in zip(h.buckets + ("+Inf",), h.counts):
+                        cumulative += n
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f"{metric}_sum{{{labels}}} {h.sum}")
+                    lines.append(f"{metric}_count{{{labels}}} {h.count}")
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                lines.append(f"{prefix}_{name}_total{{{label}}} {value}")
+            for name, value in sorted(self.gauges.items()):
+                lines.append(f"# TYPE {prefix}_{name} gauge")
+                lines.append(f"{prefix}_{name}{{{label}}} {value}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, out_dir):
+        """Write <name>.json and <name>.prom to out_dir; returns the JSON path."""
+        os.makedirs(out_dir, exist_ok=True)
+        base = os.path.join(out_dir, self.name)
+        with open(base + ".json", "w") as f:
+            json.dump(self.summary(), f, indent=2)
+        with open(base + ".prom", "w") as f:
+            f.write(self.prometheus())
+        return base + ".json"
+
+# ---------------- Module-level recorder ---------------- #
+# None when instrumentation is off: stage() then returns a shared no-op context
+# and the other helpers return immediately.
+_current = None
+
+def start_run(name):
+    """Start recording into a fresh Metrics object (one per video / stream)."""
+    global _current
+    _current = Metrics(name)
+    return _current
+
+def end_run():
+    """Stop recording; returns the finished Metrics (or None if none was active)."""
+    global _current
+    m, _current = _current, None
+    return m
+
+def enabled():
+    return _current is not None
+
+def stage(name):
+    m = _current
+    return _NULL if m is None else m.stage(name)
+
+def mark(key):
+    m = _current
+    if m is not None:
+        m.mark(key)
+
+def observe_since(name, key):
+    m = _current
+    if m is not None:
+        m.observe_since(name, key)
+
+def observe_value(name, value):
+    m = _current
+    if m is not None:
+        m.observe_value(name, value)
+
+def count(name, n=1):
+    m = _current
+    if m is not None:
+        m.count(name, n)
+
+def gauge(name, value):
+    m = _current
+    if m is not None:
+        m.gauge(name, value)
+
+def dump_profile(profiler, out_dir, name, top=40):
+    """Save a cProfile run as <name>.prof plus a cumulative-time text report."""
+    os.makedirs(out_dir, exist_ok=True)
+    base = os.path.join(out_dir, name)
+    profiler.dump_stats(base + ".prof")
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(top)
+    with open(base + ".profile.txt", "w") as f:
+        f.write(text.getvalue())
+    return base + ".prof"
@@ -0,0 +1,254 @@
+# modules/pipeline.py
+import queue
+import threading
+import time
+import cv2
+from . import metrics
+from .logger import log_system
+from .processing import detect_frames, draw_tracks, embed_faces
+from .utils import crop_face, crop_landmarks, iou
+
+_END = object()  # end-of-stream marker passed down the stages
+
+class StagePipeline:
+    """
+    Minimal plumbing for a chain of worker threads joined by bounded queues.
+    - put()/get() block on full/empty queues (back-pressure) but give up once stop is set
+    - an exception in any stage sets stop and is re-raised by join()
+    - queue depths are sampled for observability
+    """
+    def __init__(self, queue_size=8):
+        self.queue_size = queue_size
+        self.stop = threading.Event()
+        self.queues = {}
+        self.threads = []
+        self.errors = []
+        self._depth_max = {}
+        self._depth_sum = {}
+        self._samples = 0
+
+    def queue(self, name):
+        q = queue.Queue(maxsize=self.queue_size)
+        self.queues[name] = q
+        self._depth_max[name] = 0
+        self._depth_sum[name] = 0
+        return q
+
+    def put(self, q, item):
+        """Blocking put; returns False if the pipeline was stopped meanwhile."""
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, q, timeout=None):
+        """Blocking get; returns None if stopped (or on timeout)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.stop.is_set():
+            wait = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+            if wait <= 0:
+                return None
+            try:
+                return q.get(timeout=wait)
+            except queue.Empty:
+                continue
+        return None
+
+    def spawn(self, name, fn):
+        def run():
+            try:
+                fn()
+            except Exception as e:
+                self.errors.append(e)
+                log_system(f"Pipeline stage {name} failed: {e}")
+                self.stop.set()
+        t = threading.Thread(target=run, name=f"pipeline-{name}", daemon=True)
+        t.start()
+        self.threads.append(t)
+
+    def depths(self):
+        """Current depth of every stage queue."""
+        return {name: q.qsize() for name, q in self.queues.items()}
+
+    def sample_depths(self):
+        self._samples += 1
+        for name, depth in self.depths().items():
+            self._depth_max[name] = max(self._depth_max[name], depth)
+            self._depth_sum[name] += depth
+
+    def stats(self):
+        n = max(1, self._samples)
+        return {name: {'max': self._depth_max[name], 'mean': self._depth_sum[name] / n,
+                       'capacity': self.queue_size}
+                for name in self.queues}
+
+    def join(self):
+        self.stop.set()
+        for t in self.threads:
+            t.join()
+        if self.errors:
+            raise self.errors[0]
+
+def run_sequential(sampler, gate, handler, detector, writer, cfg, show=True):
+    """
+    Single-threaded frame loop: sample -> (gate) -> detect -> track/identify -> draw/write.
+    Sampled frames are detected in batches of detect_batch_size; a batch is
+    flushed early once its oldest frame has waited detect_batch_latency_ms.
+    """
+    batch_size = max(1, cfg.get("detect_batch_size", 1))
+    max_wait = cfg.get("detect_batch_latency_ms", 200) / 1000.0
+    batch = []  # (frame_idx, frame, run_detector)
+    batch_started = 0.0
+
+    while True:
+        with metrics.stage("decode"):
+            item = sampler.read()
+        if item is not None:
+            idx, frame = item
+            metrics.mark(idx)
+            if not batch:
+                batch_started = time.monotonic()
+            batch.append((idx, frame, gate is None or gate.should_detect(frame)))
+            if len(batch) < batch_size and time.monotonic() - batch_started < max_wait:
+                continue
+        elif not batch:
+            break
+
+        # Detect faces on the whole batch, then track/identify frame by frame
+        all_bboxes, all_kps = detect_frames(detector, [b[1] for b in batch], batch_size,
+                                            run=[b[2] for b in batch])
+        for (idx, frame, _), bboxes, kps in zip(batch, all_bboxes, all_kps):
+            tracks = handler.handle(frame, idx, bboxes, det_kps=kps)
+
+            # Draw and save to processed video
+            with metrics.stage("encode"):
+                display = draw_tracks(frame, tracks)
+                writer.write(display)
+            metrics.observe_since("frame_total", idx)
+
+            # Optional live view (press q to quit)
+            if show:
+                cv2.imshow("Face Tracker", display)
+                if cv2.waitKey(1) & 0xFF == ord("q"):
+                    return
+        batch = []
+        if item is None:
+            break
+
+def run_pipeline(source, handler, detector, recognizer, writer, cfg, show=True):
+    """
+    Pipelined version of the process_video frame loop:
+        decode -> inference (detect + pre-embed) -> bookkeeping (track/match/log) -> encode
+    Each stage has a single worker so frame order and tracker updates stay
+    deterministic. Encoding (draw, write, imshow) runs on the calling thread,
+    which keeps OpenCV's GUI on the main thread.
+    `source` is a SampledSource (decode on a thread) or a ProcessDecoder
+    (decode in a child process into a shared-memory ring); frames are
+    released back to it once encoded.
+    Returns the per-queue depth stats.
+    """
+    batch_size = max(1, cfg.get("detect_batch_size", 1))
+    max_wait = cfg.get("detect_batch_latency_ms", 200) / 1000.0
+    reembed_iou = cfg.get("reembed_iou", 0.5)
+
+    p = StagePipeline(queue_size=cfg.get("pipeline_queue_size", 8))
+    q_decoded = p.queue("decoded")
+    q_inferred = p.queue("inferred")
+    q_tracked = p.queue("tracked")
+
+    def decode():
+        while not p.stop.is_set():
+            with metrics.stage("decode"):
+                item = source.read()
+            if item is None:
+                break
+            metrics.mark(item[0])
+            if not p.put(q_decoded, item):
+                source.release(item[3])
+                return
+        p.put(q_decoded, _END)
+
+    def infer():
+        done = False
+        while not done:
+            item = p.get(q_decoded)
+            if item is None:
+                return
+            if item is _END:
+                break
+            batch = [item]
+            started = time.monotonic()
+            while len(batch) < batch_size:
+                item = p.get(q_decoded, timeout=max(0.0, max_wait - (time.monotonic() - started)))
+                if item is None:
+                    break
+                if item is _END:
+                    done = True
+                    break
+                batch.append(item)
+
+            all_bboxes, all_kps = detect_frames(detector, [b[1] for b in batch], batch_size,
+                                                run=[b[2] for b in batch])
+
+            # Pre-embed detections that do not overlap an already bound track
+            # (bookkeeping embeds anything still missing, so a stale view only
+            # costs work, never correctness)
+            bound = handler.bound_boxes
+            wanted = [(fi, bi) for fi, bboxes in enumerate(all_bboxes)
+                      for bi, b in enumerate(bboxes)
+                      if all(iou(b, bb) < reembed_iou for bb in bound)]
+            crops = [crop_face(batch[fi][1], all_bboxes[fi][bi], copy=False) for fi, bi in wanted]
+            landmarks = [None if all_kps[fi][bi] is None
+                         else crop_landmarks(batch[fi][1], all_bboxes[fi][bi], all_kps[fi][bi])
+                         for fi, bi in wanted]
+            det_embs = [[None] * len(bboxes) for bboxes in all_bboxes]
+            for (fi, bi), emb in zip(wanted, embed_faces(recognizer, crops, cfg, landmarks)):
+                det_embs[fi][bi] = emb
+
+            for (idx, frame, _, token), bboxes, embs, kps in zip(batch, all_bboxes, det_embs, all_kps):
+                if not p.put(q_inferred, (idx, frame, bboxes, embs, kps, token)):
+                    return
+        p.put(q_inferred, _END)
+
+    def bookkeep():
+        while True:
+            item = p.get(q_inferred)
+            if item is None:
+                return
+            if item is _END:
+                break
+            idx, frame, bboxes, embs, kps, token = item
+            tracks = handler.handle(frame, idx, bboxes, embs, kps)
+            if not p.put(q_tracked, (idx, frame, tracks, token)):
+                return
+        p.put(q_tracked, _END)
+
+    p.spawn("decode", decode)
+    p.spawn("infer", infer)
+    p.spawn("bookkeep", bookkeep)
+
+    try:
+        while True:
+            item = p.get(q_tracked)
+            if item is None or item is _END:
+                break
+            p.sample_depths()
+            idx, frame, tracks, token = item
+            # Draw and save to processed video
+            with metrics.stage("encode"):
+                display = draw_tracks(frame, tracks)
+                source.release(token)
+                writer.write(display)
+            metrics.observe_since("frame_total", idx)
+
+            # Optional live view (press q to quit)
+            if show:
+                cv2.imshow("Face Tracker", display)
+                if cv2.waitKey(1) & 0xFF == ord("q"):
+                    break
+    finally:
+        p.join()
+    return p.stats()
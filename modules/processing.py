@@ -0,0 +1,223 @@
+# modules/processing.py
+from collections import Counter
+import cv2
+import numpy as np
+from . import metrics
+from .track_cache import TrackCache
+from .logger import log_face_event, log_system
+from .utils import crop_face, crop_landmarks, get_timestamp
+
+def embed_faces(recognizer, crops, cfg, landmarks=None):
+    """
+    Embed a list of face crops; returns one embedding (or None) per crop.
+    Uses the batched aligned path (Recognizer.get_embeddings) unless batch_recognition is off.
+    landmarks optionally holds the detector's 5 keypoints per crop (crop
+    coordinates, None where the detector gave none) to align on.
+    """
+    if not crops:
+        return []
+    with metrics.stage("recognize"):
+        if not cfg.get("batch_recognition", True):
+            metrics.count("faces_embedded", len(crops))
+            return [recognizer.get_embedding(c) for c in crops]
+        min_size = cfg.get("min_face_size", 20)
+        keep = [i for i, c in enumerate(crops) if min(c.shape[:2]) >= min_size]
+        metrics.count("faces_embedded", len(keep))
+        embs = [None] * len(crops)
+        kps = None if landmarks is None else [landmarks[i] for i in keep]
+        for i, emb in zip(keep, recognizer.get_embeddings([crops[i] for i in keep], landmarks=kps)):
+            embs[i] = emb
+        return embs
+
+def _bbox_key(bbox):
+    return tuple(float(v) for v in bbox)
+
+def draw_tracks(frame, tracks):
+    """Return a copy of `frame` with boxes and face ids for {tid: (bbox, face_id)}."""
+    display = frame.copy()
+    for tid, (bbox, fid) in tracks.items():
+        x1, y1, x2, y2 = map(int, bbox)
+        cv2.rectangle(display, (x1,y1), (x2,y2), (0,255,0), 2)
+        cv2.putText(display, f"ID:{fid}", (x1, y1-10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,255,0), 2)
+    return display
+
+def detect_frames(detector, frames, batch_size, run=None):
+    """
+    Run detection on sampled frames; returns (all_bboxes, all_kps): one list of
+    bboxes per frame, and per frame one entry of 5 face keypoints ((5, 2) array,
+    frame coordinates) per bbox, None when the detector has no landmark head.
+    `run` optionally flags which frames need the detector (e.g. from the
+    motion gate); the others get no detections.
+    """
+    idxs = [i for i in range(len(frames)) if run is None or run[i]]
+    metrics.count("detector_frames", len(idxs))
+    with metrics.stage("detect"):
+        if batch_size <= 1:
+            dets = [detector.detect(frames[i]) for i in idxs]
+            found = [([d["bbox"] for d in ds],
+                      [None if d.get("kps") is None else np.asarray(d["kps"], dtype=np.float32) for d in ds])
+                     for ds in dets]
+        else:
+            found = [(boxes.tolist(), [None] * len(boxes) if kps is None else list(kps))
+                     for boxes, _, kps in detector.detect_batch([frames[i] for i in idxs], keypoints=True)]
+    all_bboxes = [[] for _ in frames]
+    all_kps = [[] for _ in frames]
+    for i, (bboxes, kps) in zip(idxs, found):
+        all_bboxes[i] = bboxes
+        all_kps[i] = kps
+    return all_bboxes, all_kps
+
+class FrameHandler:
+    """
+    Per-video bookkeeping that runs after detection, one frame at a time:
+      - updates the tracker and logs exits
+      - embeds / matches / registers tracks (with the per-track cache)
+    Holds the tracker_id -> db_face_id map for the video; with a VideoProgress
+    it is checkpointed periodically and can be restored (get_state / set_state).
+    """
+    def __init__(self, recognizer, tracker, db, dm, cfg, progress=None):
+        self.recognizer = recognizer
+        self.tracker = tracker
+        self.db = db
+        self.dm = dm
+        self.cfg = cfg
+        self.face_id_map = {}  # tracker_id -> db_face_id
+        self.match_threshold = cfg.get("match_threshold", 0.6)
+        self.track_cache = TrackCache(
+            reembed_interval=cfg.get("reembed_interval", 50),
+            reembed_iou=cfg.get("reembed_iou", 0.5),
+        )
+        # bboxes of tracks bound to a face id after the last frame; read by the
+        # pipelined inference stage to decide which detections to pre-embed
+        self.bound_boxes = []
+        self.progress = progress
+        self.frame_idx = 0  # last handled frame
+        # (face_id, event_type) already stored by frames replayed after a resume
+        self._replayed = Counter()
+        self._replay_until = 0
+
+    def get_state(self):
+        return {
+            "tracker": self.tracker.get_state(),
+            "face_id_map": [[tid, fid] for tid, fid in self.face_id_map.items()],
+            "track_cache": self.track_cache.get_state(),
+        }
+
+    def set_state(self, state):
+        self.tracker.set_state(state["tracker"])
+        self.face_id_map = {tid: fid for tid, fid in state["face_id_map"]}
+        self.track_cache.set_state(state["track_cache"])
+
+    def suppress_replayed(self, events, until_frame):
+        """Skip each of `events` ((face_id, event_type) pairs) once, up to frame until_frame."""
+        self._replayed = Counter((fid, etype) for fid, etype in events)
+        self._replay_until = until_frame
+
+    def _log_event(self, face_id, event_type, bbox, frame, frame_idx):
+        key = (face_id, event_type)
+        if frame_idx <= self._replay_until and self._replayed[key] > 0:
+            self._replayed[key] -= 1
+            log_system(f"Skipped replayed {event_type} of face {face_id} at frame {frame_idx}",
+                       face_id=face_id, event=event_type)
+            return
+        with metrics.stage("log_event"):
+            log_face_event(face_id, event_type, bbox, frame,
+                           self.progress.key if self.progress is not None else None, frame_idx)
+
+    def handle(self, frame, frame_idx, bboxes, det_embs=None, det_kps=None):
+        """
+        Process one frame's detections; returns {tid: (bbox, face_id)} for drawing.
+        det_embs optionally holds embeddings already computed for `bboxes`
+        (None where not computed); other tracks are embedded here.
+        det_kps optionally holds the detector's keypoints for `bboxes`, used to
+        align the crops of tracks that sit on a detection.
+        """
+        with metrics.stage("bookkeep"):
+            tracks = self._handle(frame, frame_idx, bboxes, det_embs, det_kps)
+        self.frame_idx = frame_idx
+        if self.progress is not None:
+            self.progress.step(frame_idx, self)
+        return tracks
+
+    def _handle(self, frame, frame_idx, bboxes, det_embs, det_kps=None):
+        face_id_map = self.face_id_map
+        track_cache = self.track_cache
+        metrics.count("frames")
+        metrics.observe_value("faces_per_frame", len(bboxes))
+
+        # Update tracker
+        with metrics.stage("track"):
+            tracked_objects, exited_ids = self.tracker.update(bboxes)
+
+        # Handle exited objects
+        for tid in exited_ids:
+            track_cache.evict(tid)
+            if tid in face_id_map:
+                fid = face_id_map[tid]
+                self._log_event(fid, "exit", tracked_objects.get(tid, [0,0,1,1]), frame, frame_idx)
+                del face_id_map[tid]
+
+        # Handle active tracked objects
+        to_embed = []  # (tid, bbox, face_img) of tracks that need the recognizer
+        for tid, bbox in tracked_objects.items():
+            # bound tracks are only re-embedded on the cache schedule
+            if track_cache.needs_embedding(tid, bbox, frame_idx):
+                to_embed.append((tid, bbox, crop_face(frame, bbox, copy=False)))
+        pre = {}
+        if det_embs is not None:
+            pre = {_bbox_key(b): e for b, e in zip(bboxes, det_embs) if e is not None}
+        embs = [pre.get(_bbox_key(t[1])) for t in to_embed]
+        missing = [i for i, e in enumerate(embs) if e is None]
+        landmarks = None
+        if det_kps is not None:
+            kps = {_bbox_key(b): k for b, k in zip(bboxes, det_kps) if k is not None}
+            landmarks = [kps.get(_bbox_key(to_embed[i][1])) for i in missing]
+            landmarks = [None if k is None else crop_landmarks(frame, to_embed[i][1], k)
+                         for i, k in zip(missing, landmarks)]
+        computed = embed_faces(self.recognizer, [to_embed[i][2] for i in missing], self.cfg, landmarks)
+        for i, emb in zip(missing, computed):
+            embs[i] = emb
+
+        pending = []  # (tid, bbox, face_img, emb) of tracks not yet bound to a face id
+        for (tid, bbox, face_img), emb in zip(to_embed, embs):
+            if emb is None:
+                continue
+            if tid in face_id_map:
+                if track_cache.verify(tid, emb, bbox, frame_idx, self.match_threshold):
+                    continue
+                log_system(f"Track {tid} no longer matches face {face_id_map[tid]}, re-identifying")
+                # close the old face's visit before the track is bound to another id
+                self._log_event(face_id_map[tid], "exit", bbox, frame, frame_idx)
+                del face_id_map[tid]
+            pending.append((tid, bbox, face_img, emb))
+
+        # match all new tracks of this frame against the gallery in one call;
+        # unmatched ones are registered atomically (safe with several workers)
+        db, dm = self.db, self.dm
+        if pending:
+            with metrics.stage("match"):
+                results = db.match_or_register([p[3] for p in pending], get_timestamp(),
+                                               threshold=self.match_threshold)
+        else:
+            results = []
+        for (tid, bbox, face_img, emb), (face_id, sim, is_new) in zip(pending, results):
+            track_cache.bind(tid, emb, bbox, frame_idx)
+            face_id_map[tid] = face_id
+            if not is_new:
+                log_system(f"Recognized existing face {face_id} (sim={sim:.2f})", face_id=face_id, sim=round(float(sim), 4))
+                continue
+            with metrics.stage("register"):
+                db.set_image_path(face_id, dm.save_face(face_id, face_img))
+                dm.save_embedding(face_id, emb)
+            self._log_event(face_id, "entry", bbox, frame, frame_idx)
+            log_system(f"Registered new face {face_id}", face_id=face_id)
+
+        self.bound_boxes = [bbox for tid, bbox in tracked_objects.items() if tid in face_id_map]
+        return {tid: (bbox, face_id_map.get(tid, -1)) for tid, bbox in tracked_objects.items()}
+
+    def finish(self, video_path):
+        stats = self.track_cache.stats()
+        metrics.gauge("track_cache_hit_rate", stats['hit_rate'])
+        log_system(f"Track cache for {video_path}: hits={stats['hits']} misses={stats['misses']} "
+                   f"hit_rate={stats['hit_rate']:.2f}")
@@ -1,22 +1,40 @@
 # modules/recognizer.py
+import os
 from .utils import load_config
 import numpy as np
 
-try:
-    # InsightFace recommended API
-    from insightface import app
-except Exception as e:
-    raise ImportError("insightface is required. pip install insightface") from e
-
 class Recognizer:
-    """Wrapper around InsightFace FaceAnalysis to produce normalized embeddings."""
-    def __init__(self):
-        self.cfg = load_config()
+    """Wrapper around InsightFace FaceAnalysis to produce normalized embeddings.
+       insightface (and onnxruntime) are only imported when a Recognizer is created.
+    """
+    def __init__(self, cfg=None):
+        try:
+            # InsightFace recommended API
+            from insightface import app
+            from insightface.utils import face_align
+        except Exception as e:
+            raise ImportError("insightface is required. pip install insightface") from e
+        self.cfg = cfg if cfg is not None else load_config()
         self.threshold = self.cfg.get('match_threshold', 0.75)
-        # FaceAnalysis will download and prepare models on first run (may take time)
-        self.fa = app.FaceAnalysis()
+        self.batch_size = self.cfg.get('recognition_batch_size', 32)
+        # FaceAnalysis will download and prepare models on first run (may take time);
+        # they are kept under models_dir/insightface instead of ~/.insightface.
+        # Only detection (for get_embedding) and recognition are loaded; the
+        # landmark / gender-age models are never used here.
+        self.fa = app.FaceAnalysis(allowed_modules=['detection', 'recognition'],
+                                   providers=['CPUExecutionProvider'],
+                                   root=os.path.join(self.cfg.get('models_dir', 'models'), 'insightface'))
         # use CPU by default (ctx_id=-1). If you have GPU, change to ctx_id=0
         self.fa.prepare(ctx_id=-1)
+        self.rec_model = self.fa.models['recognition']
+        self.det_model = self.fa.models['detection']
+        self._norm_crop = face_align.norm_crop
+
+    def warmup(self):
+        """Dummy passes through both models so the first real face doesn't pay for lazy init."""
+        w, h = tuple(self.rec_model.input_size)
+        self.rec_model.get_feat([np.zeros((h, w, 3), dtype=np.uint8)])
+        self.fa.get(np.zeros((h, w, 3), dtype=np.uint8))
 
     def get_embedding(self, face_img):
         """
@@ -29,6 +47,45 @@ class Recognizer:
         norm = np.linalg.norm(emb) + 1e-10
         return (emb / norm).astype(float)
 
+    def align(self, face_img):
+        """
+        5-point aligned recognition input for a crop, the same alignment FaceAnalysis.get
+        applies, or None when InsightFace's detector finds no face in it.
+        """
+        bboxes, kpss = self.det_model.detect(face_img, max_num=1, metric='default')
+        if bboxes.shape[0] == 0 or kpss is None:
+            return None
+        return self._norm_crop(face_img, landmark=kpss[0], image_size=self.rec_model.input_size[0])
+
+    def get_embeddings(self, crops, batch_size=None, landmarks=None):
+        """
+        Batched version of get_embedding for crops already localized by the detector.
+        landmarks optionally holds the 5 keypoints the detector found for each crop
+        (crop coordinates); crops are aligned on them with norm_crop, the same
+        alignment get_embedding applies, so embeddings match those of get_embedding.
+        Crops without keypoints (detector has no landmark head, or a track whose box
+        is not a detection of this frame) fall back to InsightFace's detector via
+        align(), and those without a face are rejected like get_embedding does.
+        The recognition model then runs on the aligned faces in batches.
+        Returns one L2-normalized float32 embedding, or None, per crop.
+        """
+        if len(crops) == 0:
+            return []
+        batch_size = batch_size or self.batch_size
+        size = self.rec_model.input_size[0]
+        landmarks = landmarks if landmarks is not None else [None] * len(crops)
+        aligned = [self.align(c) if k is None else self._norm_crop(c, landmark=np.asarray(k), image_size=size)
+                   for c, k in zip(crops, landmarks)]
+        keep = [i for i, a in enumerate(aligned) if a is not None]
+        out = [None] * len(crops)
+        for s in range(0, len(keep), batch_size):
+            idx = keep[s:s + batch_size]
+            feats = np.asarray(self.rec_model.get_feat([aligned[i] for i in idx]), dtype=np.float32)
+            feats /= np.linalg.norm(feats, axis=1, keepdims=True) + 1e-10
+            for i, f in zip(idx, feats):
+                out[i] = f
+        return out
+
     @staticmethod
     def cosine_similarity(a, b):
         a = np.array(a, dtype=float)
@@ -0,0 +1,164 @@
+# modules/tiling.py
+import numpy as np
+import cv2
+
+def parse_roi(roi, width, height):
+    """
+    Region of interest from config, in pixels of a width x height frame:
+      - [x1, y1, x2, y2]            rectangle
+      - [[x, y], [x, y], ...]       polygon
+    Values that are all <= 1 are fractions of the frame size.
+    Returns an int32 (N, 2) polygon, or None when roi is empty.
+    """
+    if not roi:
+        return None
+    pts = np.array(roi, dtype=np.float64)
+    if pts.ndim == 1:
+        x1, y1, x2, y2 = pts
+        pts = np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]])
+    if pts.max() <= 1.0:
+        pts = pts * [width, height]
+    pts[:, 0] = pts[:, 0].clip(0, width)
+    pts[:, 1] = pts[:, 1].clip(0, height)
+    return np.round(pts).astype(np.int32)
+
+def tile_grid(width, height, cols, rows, overlap=0.2):
+    """(x0, y0, x1, y1) tiles covering width x height, neighbours overlapping by `overlap`."""
+    tw = int(np.ceil(width / (cols - (cols - 1) * overlap)))
+    th = int(np.ceil(height / (rows - (rows - 1) * overlap)))
+    xs = np.linspace(0, width - tw, cols).round().astype(int) if cols > 1 else [0]
+    ys = np.linspace(0, height - th, rows).round().astype(int) if rows > 1 else [0]
+    return [(int(x), int(y), int(x) + min(tw, width), int(y) + min(th, height)) for y in ys for x in xs]
+
+def merge_boxes(boxes, confs, iou_threshold=0.5, iom_threshold=0.8):
+    """
+    Greedy NMS across views/tiles. A box is suppressed by a higher-scoring one when
+    their IoU exceeds iou_threshold, or when most of the smaller box lies inside the
+    other (intersection over min area > iom_threshold), which removes the partial
+    boxes of faces cut by a tile border.
+    """
+    keep = merge_keep(boxes, confs, iou_threshold, iom_threshold)
+    return boxes[keep], confs[keep]
+
+def merge_keep(boxes, confs, iou_threshold=0.5, iom_threshold=0.8):
+    """Indices of the boxes merge_boxes keeps, best first."""
+    if len(boxes) <= 1:
+        return np.arange(len(boxes))
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1).clip(0) * (y2 - y1).clip(0)
+    order = np.argsort(-confs)
+    keep = []
+    while len(order):
+        i, rest = order[0], order[1:]
+        keep.append(i)
+        iw = (np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest])).clip(0)
+        ih = (np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest])).clip(0)
+        inter = iw * ih
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        iom = inter / (np.minimum(areas[i], areas[rest]) + 1e-9)
+        order = rest[(iou <= iou_threshold) & (iom <= iom_threshold)]
+    return np.array(keep)
+
+class _Plan:
+    """Per-frame-size layout: ROI crop + mask, working scale and tiles (ROI coordinates)."""
+    def __init__(self, width, height, roi, work_width, tiles, overlap):
+        poly = parse_roi(roi, width, height)
+        if poly is None:
+            self.x0, self.y0, self.x1, self.y1 = 0, 0, width, height
+            self.mask = None
+        else:
+            self.x0, self.y0 = poly.min(0)
+            self.x1, self.y1 = poly.max(0)
+            w, h = self.x1 - self.x0, self.y1 - self.y0
+            mask = np.zeros((h, w), dtype=np.uint8)
+            cv2.fillPoly(mask, [poly - [self.x0, self.y0]], 255)
+            # an axis-aligned rectangle needs no masking, the crop is enough
+            self.mask = None if mask.all() else mask
+        w, h = self.x1 - self.x0, self.y1 - self.y0
+        self.scale = min(1.0, work_width / float(w)) if work_width else 1.0
+        self.size = (max(1, int(round(w * self.scale))), max(1, int(round(h * self.scale))))
+        self.tiles = tile_grid(w, h, tiles[0], tiles[1], overlap) if tiles else []
+
+class AdaptiveDetector:
+    """
+    Wraps any detector backend (same detect/detect_batch API) to control what the
+    model actually sees:
+      - ROI: only the region from config is cropped out; pixels outside a polygon
+        ROI are blacked out, so nothing outside the doorway reaches the model
+      - working resolution: the (ROI) view is downscaled to detect_width pixels wide
+      - tiling: additionally runs native-resolution tiles (cols x rows, with
+        overlap) for small distant faces; all views of all frames go through one
+        detect_batch call and are merged with cross-tile NMS
+    Boxes are returned in source-frame coordinates.
+    """
+    def __init__(self, base, cfg):
+        self.base = base
+        self.conf = base.conf
+        self.roi = cfg.get("detect_roi")
+        self.work_width = cfg.get("detect_width")
+        self.tiles = cfg.get("detect_tiles")
+        self.overlap = cfg.get("detect_tile_overlap", 0.2)
+        self.nms_iou = cfg.get("tile_nms_iou", 0.5)
+        self._plans = {}
+
+    def _plan(self, frame):
+        h, w = frame.shape[:2]
+        plan = self._plans.get((w, h))
+        if plan is None:
+            plan = self._plans[(w, h)] = _Plan(w, h, self.roi, self.work_width, self.tiles, self.overlap)
+        return plan
+
+    def _views(self, frame):
+        """[(image, scale, offset_x, offset_y)] fed to the model for one frame."""
+        p = self._plan(frame)
+        region = frame[p.y0:p.y1, p.x0:p.x1]
+        if p.mask is not None:
+            region = cv2.bitwise_and(region, region, mask=p.mask)
+        if p.scale < 1.0:
+            full = cv2.resize(region, p.size, interpolation=cv2.INTER_AREA)
+        else:
+            full = np.ascontiguousarray(region)
+        views = [(full, p.scale, p.x0, p.y0)]
+        for tx0, ty0, tx1, ty1 in p.tiles:
+            views.append((np.ascontiguousarray(region[ty0:ty1, tx0:tx1]), 1.0, p.x0 + tx0, p.y0 + ty0))
+        return views
+
+    def warmup(self, size=(640, 480)):
+        self.detect_batch([np.zeros((size[1], size[0], 3), dtype=np.uint8)])
+
+    def detect(self, frame):
+        boxes, confs, kps = self.detect_batch([frame], keypoints=True)[0]
+        return [{'bbox': [float(b[0]), float(b[1]), float(b[2]), float(b[3])], 'conf': float(c),
+                 'kps': None if kps is None else kps[i].tolist()}
+                for i, (b, c) in enumerate(zip(boxes, confs))]
+
+    def detect_batch(self, frames, keypoints=False):
+        """Same contract as Detector.detect_batch, in source-frame coordinates."""
+        if len(frames) == 0:
+            return []
+        per_frame = [self._views(f) for f in frames]
+        flat = [v for views in per_frame for v in views]
+        results = iter(self.base.detect_batch([v[0] for v in flat], keypoints=True))
+        out = []
+        for views in per_frame:
+            boxes, confs, kps = [], [], []
+            for _, scale, ox, oy in views:
+                b, c, k = next(results)
+                if len(b):
+                    b = b / scale + np.array([ox, oy, ox, oy], dtype=np.float32)
+                    boxes.append(b.astype(np.float32))
+                    confs.append(c)
+                    kps.append(None if k is None else (k / scale + np.array([ox, oy], dtype=np.float32)))
+            if not boxes:
+                empty = (np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.float32))
+                out.append(empty + (None,) if keypoints else empty)
+                continue
+            boxes, confs = np.concatenate(boxes), np.concatenate(confs)
+            # the base model either has a landmark head for every view or for none
+            kps = None if any(k is None for k in kps) else np.concatenate(kps).astype(np.float32)
+            if len(views) > 1:
+                keep = merge_keep(boxes, confs, self.nms_iou)
+                boxes, confs = boxes[keep], confs[keep]
+                kps = None if kps is None else kps[keep]
+            out.append((boxes, confs, kps) if keypoints else (boxes, confs))
+        return out
@@ -0,0 +1,71 @@
+# modules/track_cache.py
+import numpy as np
+from .utils import iou
+
+class TrackCache:
+    """
+    Per-track identity cache keyed by tracker id.
+    - Remembers the embedding, bbox and frame of the last recognition of a bound track
+    - Bound tracks are only re-embedded every `reembed_interval` frames,
+      or when their bbox moved/resized so that IoU with the cached bbox < `reembed_iou`
+    - Entries are evicted when the tracker reports the track as exited
+    """
+    def __init__(self, reembed_interval=50, reembed_iou=0.5):
+        self.reembed_interval = reembed_interval
+        self.reembed_iou = reembed_iou
+        self.entries = {}   # tid -> {'embedding', 'bbox', 'frame'}
+        self.hits = 0
+        self.misses = 0
+
+    def needs_embedding(self, tid, bbox, frame_idx):
+        """True if the track must go through the recognizer on this frame."""
+        entry = self.entries.get(tid)
+        if (entry is None
+                or frame_idx - entry['frame'] >= self.reembed_interval
+                or iou(bbox, entry['bbox']) < self.reembed_iou):
+            self.misses += 1
+            return True
+        self.hits += 1
+        return False
+
+    def bind(self, tid, embedding, bbox, frame_idx):
+        """Cache the embedding a track was identified with."""
+        self.entries[tid] = {'embedding': np.asarray(embedding, dtype=np.float32),
+                             'bbox': list(bbox), 'frame': frame_idx}
+
+    def verify(self, tid, embedding, bbox, frame_idx, threshold):
+        """
+        Check a fresh embedding against the cached one.
+        Refreshes the entry and returns True if it still matches, else evicts it.
+        """
+        entry = self.entries.get(tid)
+        if entry is None:
+            return False
+        emb = np.asarray(embedding, dtype=np.float32)
+        sim = float(np.dot(entry['embedding'], emb) /
+                    (np.linalg.norm(entry['embedding']) * np.linalg.norm(emb) + 1e-10))
+        if sim < threshold:
+            self.evict(tid)
+            return False
+        entry['bbox'] = list(bbox)
+        entry['frame'] = frame_idx
+        return True
+
+    def get_state(self):
+        """JSON-serializable snapshot of the cached entries (for checkpoints)."""
+        return [[tid, e['embedding'].tolist(), [float(v) for v in e['bbox']], e['frame']]
+                for tid, e in self.entries.items()]
+
+    def set_state(self, state):
+        self.entries = {}
+        for tid, emb, bbox, frame in state:
+            self.bind(tid, emb, bbox, frame)
+
+    def evict(self, tid):
+        self.entries.pop(tid, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'size': len(self.entries)}
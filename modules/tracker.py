@@ -1,6 +1,7 @@
 # modules/tracker.py
 from .utils import centroid
 import math
+import numpy as np
 
 class SimpleTracker:
     """
@@ -31,6 +32,23 @@ class SimpleTracker:
             del self.centroids[oid]
             del self.disappeared[oid]
 
+    def get_state(self):
+        """JSON-serializable snapshot of the tracks (for checkpoints)."""
+        return {
+            "next_id": self.next_id,
+            "objects": [[oid, [float(v) for v in bbox], self.disappeared[oid]]
+                        for oid, bbox in self.objects.items()],
+        }
+
+    def set_state(self, state):
+        """Restore a snapshot taken with get_state."""
+        self.next_id = state["next_id"]
+        self.objects, self.centroids, self.disappeared = {}, {}, {}
+        for oid, bbox, disappeared in state["objects"]:
+            self.objects[oid] = bbox
+            self.centroids[oid] = centroid(bbox)
+            self.disappeared[oid] = disappeared
+
     def update(self, detections):
         """
         detections: list of bboxes [[x1,y1,x2,y2], ...]
@@ -88,3 +106,205 @@ class SimpleTracker:
                 self.register(b)
 
         return dict(self.objects), exited
+
+class AssignmentTracker:
+    """
+    Tracker with globally optimal (Hungarian) assignment.
+    - State lives in NumPy arrays (ids, boxes, disappeared counts, Kalman state)
+    - Centroid-distance or IoU cost matrix is built vectorized and solved
+      with scipy.optimize.linear_sum_assignment, so results do not depend
+      on dict iteration order
+    - Optional constant-velocity Kalman prediction of each box (filterpy noise model)
+    - Same contract as SimpleTracker.update(bboxes) -> (objects, exited)
+    """
+    _INF = 1e6
+
+    def __init__(self, max_disappeared=30, distance_threshold=80, metric='centroid',
+                 iou_threshold=0.3, kalman=False):
+        try:
+            # imported here so that importing this module stays cheap
+            from scipy.optimize import linear_sum_assignment
+        except Exception as e:
+            raise ImportError("scipy is required for AssignmentTracker. pip install scipy") from e
+        self._linear_sum_assignment = linear_sum_assignment
+        if metric not in ('centroid', 'iou'):
+            raise ValueError(f"Unknown tracker metric: {metric}")
+        self.next_id = 1
+        self.max_disappeared = max_disappeared
+        self.distance_threshold = distance_threshold
+        self.metric = metric
+        self.iou_threshold = iou_threshold
+        self.kalman = kalman
+        self.ids = np.empty(0, dtype=np.int64)
+        self.boxes = np.empty((0, 4), dtype=np.float64)      # last observed bbox
+        self.disappeared = np.empty(0, dtype=np.int64)
+        if kalman:
+            self._init_kalman()
+
+    # ---- constant-velocity Kalman filter over (cx, cy, w, h), batched over tracks ----
+    def _init_kalman(self):
+        from filterpy.common import Q_discrete_white_noise
+        from scipy.linalg import block_diag
+        self._F = np.eye(8)
+        self._F[:4, 4:] = np.eye(4)
+        self._H = np.eye(4, 8)
+        q = Q_discrete_white_noise(dim=2, dt=1.0, var=1.0)
+        # state order is (cx, cy, w, h, vx, vy, vw, vh): interleave the 2x2 blocks
+        Q = block_diag(q, q, 0.1 * q, 0.1 * q)
+        order = [0, 2, 4, 6, 1, 3, 5, 7]
+        self._Q = Q[np.ix_(order, order)]
+        self._R = np.diag([4.0, 4.0, 16.0, 16.0])
+        self.x = np.empty((0, 8))
+        self.P = np.empty((0, 8, 8))
+
+    @staticmethod
+    def _to_cxcywh(boxes):
+        return np.column_stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2,
+                                boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]])
+
+    @staticmethod
+    def _to_xyxy(z):
+        return np.column_stack([z[:, 0] - z[:, 2] / 2, z[:, 1] - z[:, 3] / 2,
+                                z[:, 0] + z[:, 2] / 2, z[:, 1] + z[:, 3] / 2])
+
+    def _kalman_predict(self):
+        self.x = self.x @ self._F.T
+        self.P = self._F @ self.P @ self._F.T + self._Q
+        return self._to_xyxy(self.x[:, :4])
+
+    def _kalman_update(self, rows, boxes):
+        if len(rows) == 0:
+            return
+        x, P, H = self.x[rows], self.P[rows], self._H
+        z = self._to_cxcywh(boxes)
+        S = H @ P @ H.T + self._R
+        K = np.linalg.solve(S, H @ P).transpose(0, 2, 1)       # P H^T S^-1 (S symmetric)
+        y = z - x[:, :4]
+        self.x[rows] = x + np.einsum('nij,nj->ni', K, y)
+        self.P[rows] = (np.eye(8) - K @ H) @ P
+
+    def _kalman_add(self, boxes):
+        x = np.zeros((len(boxes), 8))
+        x[:, :4] = self._to_cxcywh(boxes)
+        P = np.tile(np.diag([10.0, 10.0, 10.0, 10.0, 100.0, 100.0, 100.0, 100.0]), (len(boxes), 1, 1))
+        self.x = np.concatenate([self.x, x])
+        self.P = np.concatenate([self.P, P])
+
+    # ---- assignment ----
+    def _cost(self, tracks, dets):
+        """(T, D) cost matrix; pairs outside the gate cost _INF."""
+        if self.metric == 'iou':
+            ix1 = np.maximum(tracks[:, None, 0], dets[None, :, 0])
+            iy1 = np.maximum(tracks[:, None, 1], dets[None, :, 1])
+            ix2 = np.minimum(tracks[:, None, 2], dets[None, :, 2])
+            iy2 = np.minimum(tracks[:, None, 3], dets[None, :, 3])
+            inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+            area_t = np.clip(tracks[:, 2] - tracks[:, 0], 0, None) * np.clip(tracks[:, 3] - tracks[:, 1], 0, None)
+            area_d = np.clip(dets[:, 2] - dets[:, 0], 0, None) * np.clip(dets[:, 3] - dets[:, 1], 0, None)
+            union = area_t[:, None] + area_d[None, :] - inter
+            iou = np.where(union > 0, inter / np.where(union > 0, union, 1), 0.0)
+            cost = 1.0 - iou
+            cost[iou < self.iou_threshold] = self._INF
+            return cost
+        ct = (tracks[:, :2] + tracks[:, 2:]) / 2
+        cd = (dets[:, :2] + dets[:, 2:]) / 2
+        cost = np.linalg.norm(ct[:, None, :] - cd[None, :, :], axis=2)
+        cost[cost > self.distance_threshold] = self._INF
+        return cost
+
+    def _remove(self, keep):
+        self.ids = self.ids[keep]
+        self.boxes = self.boxes[keep]
+        self.disappeared = self.disappeared[keep]
+        if self.kalman:
+            self.x = self.x[keep]
+            self.P = self.P[keep]
+
+    def get_state(self):
+        """JSON-serializable snapshot of the tracks (for checkpoints)."""
+        state = {
+            "next_id": self.next_id,
+            "ids": self.ids.tolist(),
+            "boxes": self.boxes.tolist(),
+            "disappeared": self.disappeared.tolist(),
+        }
+        if self.kalman:
+            state["x"] = self.x.tolist()
+            state["P"] = self.P.tolist()
+        return state
+
+    def set_state(self, state):
+        """Restore a snapshot taken with get_state."""
+        self.next_id = state["next_id"]
+        self.ids = np.array(state["ids"], dtype=np.int64)
+        self.boxes = np.array(state["boxes"], dtype=np.float64).reshape(-1, 4)
+        self.disappeared = np.array(state["disappeared"], dtype=np.int64)
+        if self.kalman:
+            if "x" in state:
+                self.x = np.array(state["x"], dtype=np.float64).reshape(-1, 8)
+                self.P = np.array(state["P"], dtype=np.float64).reshape(-1, 8, 8)
+            else:
+                # snapshot taken without Kalman: start the filters from the boxes
+                self.x, self.P = np.empty((0, 8)), np.empty((0, 8, 8))
+                self._kalman_add(self.boxes)
+
+    def update(self, detections):
+        """
+        detections: list of bboxes [[x1,y1,x2,y2], ...]
+        Returns: dict of current objects {id: bbox}, and list of exited ids
+        """
+        dets = np.asarray(detections, dtype=np.float64).reshape(-1, 4)
+        n = len(self.ids)
+        predicted = self._kalman_predict() if self.kalman and n else self.boxes
+
+        rows = cols = np.empty(0, dtype=np.int64)
+        if n and len(dets):
+            cost = self._cost(predicted, dets)
+            rows, cols = self._linear_sum_assignment(cost)
+            ok = cost[rows, cols] < self._INF
+            rows, cols = rows[ok], cols[ok]
+
+        # matched tracks take the detection
+        self.boxes[rows] = dets[cols]
+        self.disappeared[rows] = 0
+        if self.kalman:
+            self._kalman_update(rows, dets[cols])
+
+        # unmatched tracks age and exit after max_disappeared
+        unmatched = np.ones(n, dtype=bool)
+        unmatched[rows] = False
+        self.disappeared[unmatched] += 1
+        gone = self.disappeared > self.max_disappeared
+        exited = [int(i) for i in self.ids[gone]]
+        if gone.any():
+            self._remove(~gone)
+
+        # unmatched detections become new tracks
+        new = np.ones(len(dets), dtype=bool)
+        new[cols] = False
+        if new.any():
+            k = int(new.sum())
+            self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + k)])
+            self.next_id += k
+            self.boxes = np.concatenate([self.boxes, dets[new]])
+            self.disappeared = np.concatenate([self.disappeared, np.zeros(k, dtype=np.int64)])
+            if self.kalman:
+                self._kalman_add(dets[new])
+
+        objects = {int(i): b for i, b in zip(self.ids, self.boxes.tolist())}
+        return objects, exited
+
+def make_tracker(cfg):
+    """Build a fresh tracker from config (one per video)."""
+    if cfg.get("tracker", "simple") == "assignment":
+        return AssignmentTracker(
+            max_disappeared=cfg.get("track_disappeared_frames", 30),
+            distance_threshold=cfg.get("distance_threshold", 80),
+            metric=cfg.get("tracker_metric", "centroid"),
+            iou_threshold=cfg.get("tracker_iou_threshold", 0.3),
+            kalman=cfg.get("tracker_kalman", False),
+        )
+    return SimpleTracker(
+        max_disappeared=cfg.get("track_disappeared_frames", 30),
+        distance_threshold=cfg.get("distance_threshold", 80),
+    )
@@ -12,14 +12,76 @@ def load_config(path='config.json'):
     # defaults
     return {
         "frame_skip": 5,
+        "target_detect_fps": None,
+        "motion_gate": False,
+        "motion_width": 160,
+        "motion_pixel_threshold": 25,
+        "motion_min_area": 0.002,
+        "motion_refresh_frames": 10,
         "confidence_threshold": 0.45,
+        "detector_backend": "torch",
+        "detector_imgsz": 640,
+        "nms_iou_threshold": 0.7,
+        "onnx_int8": False,
+        "onnx_intra_threads": 0,
+        "onnx_inter_threads": 1,
+        "detect_width": None,
+        "detect_tiles": None,
+        "detect_tile_overlap": 0.2,
+        "tile_nms_iou": 0.5,
+        "detect_roi": None,
         "match_threshold": 0.60,
+        "dedupe_threshold": 0.75,
         "db_path": "db/visitors.db",
         "logs_dir": "logs",
         "models_dir": "models",
         "log_path": "events.log",
+        "log_format": "text",
+        "json_log_path": "logs/events.jsonl",
+        "log_max_bytes": 10485760,
+        "log_rotate_seconds": 86400,
+        "log_backup_count": 0,
+        "log_index_interval": 65536,
         "track_disappeared_frames": 30,
-        "distance_threshold": 80
+        "distance_threshold": 80,
+        "tracker": "simple",
+        "tracker_metric": "centroid",
+        "tracker_iou_threshold": 0.3,
+        "tracker_kalman": False,
+        "embedding_dtype": "float32",
+        "reembed_interval": 50,
+        "reembed_iou": 0.5,
+        "batch_recognition": True,
+        "recognition_batch_size": 32,
+        "min_face_size": 20,
+        "detect_batch_size": 1,
+        "detect_batch_latency_ms": 200,
+        "pipeline": False,
+        "pipeline_queue_size": 8,
+        "decode_process": False,
+        "frame_ring_slots": 32,
+        "live_latency_budget_ms": 500,
+        "live_max_skip": 30,
+        "live_report_interval": 10.0,
+        "show_video": True,
+        "event_sink": True,
+        "event_batch_size": 64,
+        "event_flush_interval": 1.0,
+        "event_encode_workers": 2,
+        "crop_store": True,
+        "crop_store_dir": "data/crops",
+        "crop_dedup_distance": 6,
+        "crop_encode_workers": 2,
+        "crop_jpeg_quality": 90,
+        "resume": True,
+        "resume_key": "stat",
+        "checkpoint_interval_frames": 300,
+        "report_format": "csv",
+        "report_incremental": False,
+        "metrics": False,
+        "metrics_dir": "outputs/metrics",
+        "model_warmup": True,
+        "ann": {"backend": "exact"}
     }
 
 def ensure_dir(path):
@@ -33,8 +95,11 @@ def bbox_to_int(bbox):
     """Convert bbox [x1,y1,x2,y2] to ints."""
     return [int(round(float(x))) for x in bbox]
 
-def crop_face(frame, bbox):
-    """Crop bounding box from frame (safe clamping)."""
+def crop_face(frame, bbox, copy=True):
+    """
+    Crop bounding box from frame (safe clamping).
+    copy=False returns a view into `frame`, valid only while the frame is.
+    """
     x1, y1, x2, y2 = bbox_to_int(bbox)
     h, w = frame.shape[:2]
     x1 = max(0, min(x1, w-1))
@@ -44,7 +109,15 @@ def crop_face(frame, bbox):
     if y2 <= y1 or x2 <= x1:
         # if bbox invalid, return a tiny crop to avoid errors
         return frame[0:1, 0:1].copy()
-    return frame[y1:y2, x1:x2].copy()
+    crop = frame[y1:y2, x1:x2]
+    return crop.copy() if copy else crop
+
+def crop_landmarks(frame, bbox, kps):
+    """Frame-coordinate landmarks (N, 2) moved into the coordinates of crop_face(frame, bbox)."""
+    x1, y1 = bbox_to_int(bbox)[:2]
+    h, w = frame.shape[:2]
+    origin = np.array([max(0, min(x1, w-1)), max(0, min(y1, h-1))], dtype=np.float32)
+    return np.asarray(kps, dtype=np.float32) - origin
 
 def iou(boxA, boxB):
     """Compute IoU between two boxes [x1,y1,x2,y2]."""
@@ -2,38 +2,226 @@
 import sqlite3
 import os
 import csv
+import gzip
 import json
+import argparse
+import numpy as np
 
-def export_reports(db_path="db/visitors.db", out_dir="outputs/reports"):
+from modules.database import decode_embedding
+
+STATE_FILE = "export_state.json"
+FORMATS = ("csv", "csv.gz", "parquet")
+# SQLite declared column type -> pyarrow type name; anything else is written as string
+ARROW_TYPES = {"INTEGER": "int64", "REAL": "float64", "TEXT": "string", "BLOB": "binary"}
+
+def _column_types(conn, table):
+    """{column: declared SQLite type} of `table`."""
+    return {row[1]: row[2].upper() for row in conn.execute(f"PRAGMA table_info({table})")}
+
+class _CsvWriter:
+    def __init__(self, path, columns, types=None, compress=False):
+        self.f = gzip.open(path, "wt", newline="") if compress else open(path, "w", newline="")
+        self.writer = csv.writer(self.f)
+        self.writer.writerow(columns)
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.f.close()
+
+class _ParquetWriter:
+    def __init__(self, path, columns, types=None):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("pyarrow is required for parquet reports. pip install pyarrow") from e
+        self.pa, self.pq = pa, pq
+        self.path = path
+        self.columns = columns
+        # explicit schema: inferring it from the first chunk fails on all-NULL columns
+        types = types or {}
+        self.schema = pa.schema([(c, getattr(pa, ARROW_TYPES.get(types.get(c), "string"))())
+                                 for c in columns])
+        self.writer = None
+
+    def write_rows(self, rows):
+        table = self.pa.table({c: [r[i] for r in rows] for i, c in enumerate(self.columns)},
+                              schema=self.schema)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, self.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+def _open_writer(base_path, fmt, columns, types=None):
+    if fmt == "parquet":
+        return f"{base_path}.parquet", _ParquetWriter(f"{base_path}.parquet", columns, types)
+    path = f"{base_path}.{fmt}"
+    return path, _CsvWriter(path, columns, types, compress=fmt == "csv.gz")
+
+def _stream_table(conn, table, query, params, base_path, fmt, chunk_size, write_empty=True):
+    """Write a query result over `table` to `base_path` chunk by chunk; returns (rows, last_id)."""
+    types = _column_types(conn, table)
+    c = conn.cursor()
+    c.execute(query, params)
+    columns = [desc[0] for desc in c.description]
+    writer = _open_writer(base_path, fmt, columns, types)[1] if write_empty else None
+    count, last_id = 0, None
+    try:
+        while True:
+            rows = c.fetchmany(chunk_size)
+            if not rows:
+                break
+            if writer is None:
+                _, writer = _open_writer(base_path, fmt, columns, types)
+            writer.write_rows(rows)
+            count += len(rows)
+            last_id = rows[-1][0]
+    finally:
+        if writer is not None:
+            writer.close()
+    return count, last_id
+
+def _export_embeddings(conn, path, since_id, chunk_size):
+    """
+    Decode visitor embeddings into an (N, D) float32 .npy plus a matching id .npy.
+    NULL, undecodable and wrong-dimension embeddings are skipped and reported.
+    Returns the number of embeddings written.
+    """
+    c = conn.cursor()
+    n = c.execute("SELECT COUNT(*) FROM visitors WHERE id > ?", (since_id,)).fetchone()[0]
+    if n == 0:
+        return 0
+    c.execute("SELECT id, embedding FROM visitors WHERE id > ? ORDER BY id", (since_id,))
+    ids = np.empty(n, dtype=np.int64)
+    out = None
+    i = 0
+    skipped = []
+    while True:
+        rows = c.fetchmany(chunk_size)
+        if not rows:
+            break
+        for rid, value in rows:
+            try:
+                emb = decode_embedding(value)
+            except Exception:
+                skipped.append(rid)
+                continue
+            if out is not None and emb.size != out.shape[1]:
+                skipped.append(rid)
+                continue
+            if out is None:
+                out = np.lib.format.open_memmap(f"{path}.npy", mode="w+", dtype=np.float32,
+                                                shape=(n, emb.size))
+            out[i] = emb
+            ids[i] = rid
+            i += 1
+    if skipped:
+        shown = ", ".join(map(str, skipped[:10])) + (" ..." if len(skipped) > 10 else "")
+        print(f"⚠️ Skipped {len(skipped)} visitors without a usable embedding (ids: {shown})")
+    if out is None:
+        return 0
+    np.save(f"{path}_ids.npy", ids[:i])
+    out.flush()
+    if i < n:
+        # drop the rows reserved for skipped visitors
+        trimmed = np.lib.format.open_memmap(f"{path}.tmp.npy", mode="w+", dtype=np.float32,
+                                            shape=(i, out.shape[1]))
+        for s in range(0, i, chunk_size):
+            e = min(i, s + chunk_size)
+            trimmed[s:e] = out[s:e]
+        trimmed.flush()
+        del out, trimmed
+        os.replace(f"{path}.tmp.npy", f"{path}.npy")
+    return i
+
+def _load_state(out_dir):
+    path = os.path.join(out_dir, STATE_FILE)
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {"last_event_id": 0, "last_visitor_id": 0}
+
+def _save_state(out_dir, state):
+    path = os.path.join(out_dir, STATE_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+def export_reports(db_path="db/visitors.db", out_dir="outputs/reports", fmt="csv",
+                   incremental=False, include_embeddings=False, chunk_size=10000):
+    """
+    Export visitors, events and a summary without loading whole tables in memory.
+      - rows are streamed through the cursor in chunks of `chunk_size`
+      - visitors.* never contains the embedding column; include_embeddings
+        writes them separately as visitor_embeddings.npy (+ _ids.npy)
+      - fmt: "csv", "csv.gz" or "parquet" (needs pyarrow)
+      - incremental=True only exports rows newer than the watermark stored in
+        out_dir/export_state.json, as part files named <table>_from_<first id>;
+        nothing is written for a table without new rows
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown report format {fmt}; expected one of {FORMATS}")
     os.makedirs(out_dir, exist_ok=True)
     conn = sqlite3.connect(db_path)
-    c = conn.cursor()
+    state = _load_state(out_dir) if incremental else {"last_event_id": 0, "last_visitor_id": 0}
+    since_visitor, since_event = state["last_visitor_id"], state["last_event_id"]
+
+    def base(name, since):
+        if not incremental:
+            return os.path.join(out_dir, name)
+        return os.path.join(out_dir, f"{name}_from_{since + 1}")
 
-    # Export visitors
-    c.execute("SELECT * FROM visitors")
-    visitors = c.fetchall()
-    visitor_cols = [desc[0] for desc in c.description]
-    with open(os.path.join(out_dir, "visitors.csv"), "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(visitor_cols)
-        writer.writerows(visitors)
+    # Export visitors (without embeddings)
+    n_visitors, last_visitor = _stream_table(
+        conn, "visitors", "SELECT id, first_seen, image_path FROM visitors WHERE id > ? ORDER BY id",
+        (since_visitor,), base("visitors", since_visitor), fmt, chunk_size, not incremental)
+    if include_embeddings:
+        _export_embeddings(conn, base("visitor_embeddings", since_visitor), since_visitor, chunk_size)
 
     # Export events
-    c.execute("SELECT * FROM events")
-    events = c.fetchall()
-    event_cols = [desc[0] for desc in c.description]
-    with open(os.path.join(out_dir, "events.csv"), "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(event_cols)
-        writer.writerows(events)
+    n_events, last_event = _stream_table(
+        conn, "events", "SELECT * FROM events WHERE id > ? ORDER BY id",
+        (since_event,), base("events", since_event), fmt, chunk_size, not incremental)
 
     # Export summary JSON
+    c = conn.cursor()
+    unique_visitors = c.execute("SELECT COUNT(*) FROM visitors").fetchone()[0]
+    total_events = c.execute("SELECT COUNT(*) FROM events").fetchone()[0]
     summary = {
-        "unique_visitors": len(visitors),
-        "total_events": len(events),
+        "unique_visitors": unique_visitors,
+        "total_events": total_events,
+        "exported_visitors": n_visitors,
+        "exported_events": n_events,
     }
     with open(os.path.join(out_dir, "summary.json"), "w") as f:
         json.dump(summary, f, indent=2)
 
+    if incremental:
+        _save_state(out_dir, {
+            "last_visitor_id": last_visitor if last_visitor is not None else since_visitor,
+            "last_event_id": last_event if last_event is not None else since_event,
+        })
+
     conn.close()
     print(f"✅ Reports exported to {out_dir}")
+    print(f"📊 Unique visitors: {unique_visitors}, Total events: {total_events}")
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export visitor/event reports")
+    parser.add_argument("--db", default="db/visitors.db")
+    parser.add_argument("--out", default="outputs/reports")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only export rows added since the last incremental export")
+    parser.add_argument("--embeddings", action="store_true",
+                        help="also write visitor embeddings to a separate .npy file")
+    args = parser.parse_args()
+    export_reports(args.db, args.out, fmt=args.format, incremental=args.incremental,
+                   include_embeddings=args.embeddings)
@@ -0,0 +1,125 @@
+# tests/test_recognizer.py
+import sys
+import types
+
+import cv2
+import numpy as np
+import pytest
+
+from modules import logger
+from modules.processing import FrameHandler, embed_faces
+from modules.recognizer import Recognizer
+from modules.tracker import make_tracker
+from modules.utils import crop_face, crop_landmarks, load_config
+
+# 5 landmark markers (eyes, nose, mouth corners), one colour each
+COLOURS = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (0, 255, 255)]
+TEMPLATE = np.array([[38.2946, 51.6963], [73.5318, 51.5014], [56.0252, 71.7366],
+                     [41.5493, 92.3655], [70.7299, 92.2041]], dtype=np.float32)
+
+def _norm_crop(img, landmark, image_size=112):
+    m, _ = cv2.estimateAffinePartial2D(np.asarray(landmark, dtype=np.float32), TEMPLATE * image_size / 112.0)
+    return cv2.warpAffine(img, m, (image_size, image_size), borderValue=0)
+
+class _Detection:
+    """Stands in for SCRFD: the landmarks are the centroids of the marker colours."""
+    def detect(self, img, max_num=0, metric='default'):
+        kps = []
+        for colour in COLOURS:
+            ys, xs = np.nonzero((img == colour).all(axis=2))
+            if len(xs) == 0:
+                return np.empty((0, 5), dtype=np.float32), None
+            kps.append([xs.mean(), ys.mean()])
+        kps = np.array([kps], dtype=np.float32)
+        x1, y1 = kps[0].min(0) - 10
+        x2, y2 = kps[0].max(0) + 10
+        return np.array([[x1, y1, x2, y2, 0.9]], dtype=np.float32), kps
+
+class _Recognition:
+    input_size = (112, 112)
+
+    def get_feat(self, imgs):
+        return np.stack([cv2.resize(img, (8, 8), interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+                         for img in imgs])
+
+class _FaceAnalysis:
+    def __init__(self, **kwargs):
+        self.models = {'detection': _Detection(), 'recognition': _Recognition()}
+
+    def prepare(self, ctx_id=0):
+        pass
+
+    def get(self, img):
+        _, kpss = self.models['detection'].detect(img, max_num=1)
+        if kpss is None:
+            return []
+        feat = self.models['recognition'].get_feat([_norm_crop(img, kpss[0])])[0]
+        return [types.SimpleNamespace(embedding=feat)]
+
+@pytest.fixture
+def recognizer(monkeypatch, tmp_path):
+    insightface = types.ModuleType("insightface")
+    insightface.app = types.ModuleType("insightface.app")
+    insightface.app.FaceAnalysis = _FaceAnalysis
+    insightface.utils = types.ModuleType("insightface.utils")
+    insightface.utils.face_align = types.ModuleType("insightface.utils.face_align")
+    insightface.utils.face_align.norm_crop = _norm_crop
+    for name, module in [("insightface", insightface), ("insightface.app", insightface.app),
+                         ("insightface.utils", insightface.utils),
+                         ("insightface.utils.face_align", insightface.utils.face_align)]:
+        monkeypatch.setitem(sys.modules, name, module)
+    return Recognizer(cfg=dict(load_config(), models_dir=str(tmp_path), recognition_batch_size=2))
+
+def _frame(faces):
+    """Frame with one textured face per (x, y) top-left corner; returns (frame, bboxes, keypoints)."""
+    rng = np.random.default_rng(0)
+    frame = np.zeros((240, 480, 3), dtype=np.uint8)
+    bboxes, kps = [], []
+    for x, y in faces:
+        frame[y:y + 100, x:x + 90] = rng.integers(20, 200, size=(100, 90, 3))
+        points = np.array([[22, 35], [66, 34], [45, 55], [28, 76], [62, 77]]) + [x, y]
+        for (px, py), colour in zip(points, COLOURS):
+            cv2.circle(frame, (int(px), int(py)), 2, colour, -1)
+        bboxes.append([x, y, x + 90, y + 100])
+        kps.append(points.astype(np.float32))
+    return frame, bboxes, kps
+
+def test_batched_embeddings_match_single_crop(recognizer):
+    frame, bboxes, kps = _frame([(10, 20), (150, 60), (300, 110)])
+    crops = [crop_face(frame, b) for b in bboxes]
+    single = [recognizer.get_embedding(c) for c in crops]
+
+    # aligned on the detector's keypoints, and on InsightFace's own detector as fallback
+    landmarks = [crop_landmarks(frame, b, k) for b, k in zip(bboxes, kps)]
+    for batched in (recognizer.get_embeddings(crops, landmarks=landmarks),
+                    recognizer.get_embeddings(crops),
+                    recognizer.get_embeddings(crops, landmarks=[landmarks[0], None, landmarks[2]])):
+        assert len(batched) == len(crops)
+        for a, b in zip(batched, single):
+            np.testing.assert_allclose(a, b, atol=1e-5)
+
+def test_crop_without_face_has_no_embedding(recognizer):
+    frame, bboxes, kps = _frame([(10, 20)])
+    empty = np.full((100, 90, 3), 60, dtype=np.uint8)
+    out = recognizer.get_embeddings([empty, crop_face(frame, bboxes[0])])
+    assert recognizer.get_embedding(empty) is None
+    assert out[0] is None and out[1] is not None
+
+def test_frame_handler_aligns_on_detector_keypoints(recognizer, monkeypatch, tmp_path):
+    frame, bboxes, kps = _frame([(10, 20), (150, 60)])
+    cfg = dict(load_config(), min_face_size=20, log_format="text",
+               logs_dir=str(tmp_path / "logs"), log_path=str(tmp_path / "events.log"))
+    logger.configure(cfg)
+    expected = [recognizer.get_embedding(crop_face(frame, b)) for b in bboxes]
+    # with keypoints for every detection InsightFace's detector is never needed
+    monkeypatch.setattr(recognizer.det_model, "detect", lambda *a, **k: pytest.fail("re-detected a crop"))
+
+    seen = []
+    db = types.SimpleNamespace(
+        match_or_register=lambda embs, ts, threshold: seen.extend(embs) or [(1, 1.0, False)] * len(embs))
+    handler = FrameHandler(recognizer, make_tracker(cfg), db, None, cfg)
+    handler.handle(frame, 1, bboxes, det_kps=kps)
+    assert len(seen) == 2
+    for a, b in zip(seen, expected):
+        np.testing.assert_allclose(a, b, atol=1e-5)
+    assert embed_faces(recognizer, [], cfg) == []
@@ -0,0 +1,188 @@
+# tests/test_resume.py
+import json
+import sqlite3
+
+import cv2
+import numpy as np
+import pytest
+
+import main
+from benchmarks.synthetic import make_video, StubDetector, StubRecognizer
+from data.manager import DataManager
+from modules import logger, processing
+from modules.database import Database, init_db
+from modules.frame_source import FrameSampler
+from modules.processing import FrameHandler
+from modules.track_cache import TrackCache
+from modules.tracker import SimpleTracker, AssignmentTracker, make_tracker
+from modules.utils import load_config
+
+N_FRAMES = 200
+INTERVAL = 50
+
+@pytest.fixture(scope="module")
+def video(tmp_path_factory):
+    return make_video(str(tmp_path_factory.mktemp("videos") / "syn.mp4"), n_frames=N_FRAMES, n_faces=4)
+
+@pytest.fixture
+def cfg(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cfg = dict(load_config(), show_video=False, frame_skip=1, crop_store=False, log_format="text",
+               logs_dir=str(tmp_path / "logs"), log_path=str(tmp_path / "events.log"),
+               checkpoint_interval_frames=INTERVAL)
+    logger.configure(cfg)
+    return cfg
+
+def _run(video, db_path, cfg, crash_at=None):
+    """process_video on a fresh connection; returns (events, visitors, processing_state rows)."""
+    init_db(db_path)
+    db = Database(db_path)
+    logger.set_database(db)
+    logger.start_event_sink(db, cfg)
+    handle = FrameHandler._handle
+
+    def crash(self, frame, frame_idx, *args):
+        if frame_idx == crash_at:
+            raise RuntimeError("simulated crash")
+        return handle(self, frame, frame_idx, *args)
+    try:
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr(FrameHandler, "_handle", crash)
+            main.process_video(video, StubDetector(), StubRecognizer(), make_tracker(cfg), db,
+                               DataManager(base_dir=f"{db_path}.data"), cfg)
+    finally:
+        logger.close()
+        logger.set_database(None)
+        db.close()
+    conn = sqlite3.connect(db_path)
+    try:
+        return (conn.execute("SELECT face_id, event_type FROM events ORDER BY id").fetchall(),
+                conn.execute("SELECT COUNT(*) FROM visitors").fetchone()[0],
+                conn.execute("SELECT status, frame_idx FROM processing_state").fetchall())
+    finally:
+        conn.close()
+
+@pytest.mark.parametrize("mode", [{}, {"pipeline": True}, {"tracker": "assignment"}])
+def test_crash_and_resume_matches_uninterrupted_run(video, cfg, mode):
+    cfg = dict(cfg, **mode)
+    ref_events, ref_visitors, _ = _run(video, "ref.db", dict(cfg, resume=False))
+    assert ref_events
+
+    with pytest.raises(RuntimeError):
+        _run(video, "run.db", cfg, crash_at=137)
+    events, visitors, state = _run(video, "run.db", cfg)
+
+    # replayed frames re-emit nothing that was already stored: no duplicate entries / exits
+    assert events == ref_events
+    assert visitors == ref_visitors
+    assert state == [("done", N_FRAMES)]
+
+    # a finished video is skipped on the next run
+    assert _run(video, "run.db", cfg) == (events, visitors, state)
+
+def test_events_lost_in_the_sink_at_a_crash_are_re_emitted(video, cfg, monkeypatch):
+    ref_events, _, _ = _run(video, "ref.db", dict(cfg, resume=False))
+    with pytest.raises(RuntimeError):
+        _run(video, "run.db", cfg, crash_at=137)
+    # a hard crash loses what the sink had not written yet: drop the newest events
+    conn = sqlite3.connect("run.db")
+    with conn:
+        watermark = conn.execute("SELECT event_watermark FROM processing_state").fetchone()[0]
+        stored = conn.execute("SELECT id, frame_idx FROM events WHERE id > ? ORDER BY id", (watermark,)).fetchall()
+        assert len(stored) >= 2
+        conn.execute("DELETE FROM events WHERE id >= ?", (stored[-1][0],))
+    conn.close()
+
+    windows = []
+    suppress = FrameHandler.suppress_replayed
+    monkeypatch.setattr(FrameHandler, "suppress_replayed",
+                        lambda self, events, until_frame: windows.append(until_frame) or
+                        suppress(self, events, until_frame))
+    events, _, _ = _run(video, "run.db", cfg)
+    # suppression stops at the last stored event, so the lost one is emitted again
+    assert windows == [stored[-2][1]]
+    assert events == ref_events
+
+def _assert_same_tracking(a, b, frames):
+    for dets in frames:
+        assert a.update(dets) == b.update(dets)
+
+@pytest.mark.parametrize("make", [
+    lambda: SimpleTracker(max_disappeared=3),
+    lambda: AssignmentTracker(max_disappeared=3, kalman=False),
+    lambda: AssignmentTracker(max_disappeared=3, kalman=True),
+])
+def test_tracker_state_round_trip(make):
+    rng = np.random.default_rng(0)
+    start = rng.uniform(0, 400, size=(3, 2))
+    frames = [[[x + 5 * t, y + 3 * t, x + 5 * t + 60, y + 3 * t + 60] for x, y in start[: 1 + t % 3]]
+              for t in range(30)]
+    tracker = make()
+    for dets in frames[:12]:
+        tracker.update(dets)
+    restored = make()
+    restored.set_state(json.loads(json.dumps(tracker.get_state())))
+    assert restored.get_state() == tracker.get_state()
+    _assert_same_tracking(tracker, restored, frames[12:])
+
+def test_track_cache_state_round_trip():
+    cache = TrackCache(reembed_interval=10)
+    emb = np.arange(4, dtype=np.float32)
+    cache.bind(7, emb, [0, 0, 50, 50], 3)
+    restored = TrackCache(reembed_interval=10)
+    restored.set_state(json.loads(json.dumps(cache.get_state())))
+    assert restored.get_state() == cache.get_state()
+    assert not restored.needs_embedding(7, [0, 0, 50, 50], 5)
+    assert restored.verify(7, emb, [1, 1, 51, 51], 6, threshold=0.9)
+
+def test_frame_handler_state_round_trip(cfg):
+    handler = FrameHandler(StubRecognizer(), make_tracker(cfg), None, None, cfg)
+    handler.tracker.update([[10, 10, 90, 90], [200, 200, 280, 280]])
+    handler.face_id_map = {1: 11, 2: 12}
+    handler.track_cache.bind(1, np.ones(8, dtype=np.float32), [10, 10, 90, 90], 4)
+    state = json.loads(json.dumps(handler.get_state()))
+
+    restored = FrameHandler(StubRecognizer(), make_tracker(cfg), None, None, cfg)
+    restored.set_state(state)
+    assert restored.face_id_map == {1: 11, 2: 12}
+    assert restored.get_state() == state
+
+def test_frame_sampler_seek(video):
+    full = FrameSampler(cv2.VideoCapture(video), frame_skip=3)
+    expected = []
+    while (item := full.read()) is not None:
+        expected.append(item)
+    assert full.eof
+
+    sampler = FrameSampler(cv2.VideoCapture(video), frame_skip=3)
+    sampler.seek(100)
+    resumed = []
+    while (item := sampler.read()) is not None:
+        resumed.append(item)
+    tail = [(idx, frame) for idx, frame in expected if idx > 100]
+    assert [idx for idx, _ in resumed] == [idx for idx, _ in tail]
+    assert all(np.array_equal(a, b) for (_, a), (_, b) in zip(resumed, tail))
+
+def test_replayed_events_are_suppressed_once(cfg, monkeypatch):
+    logged = []
+    monkeypatch.setattr(processing, "log_face_event", lambda fid, etype, *args: logged.append((fid, etype)))
+    handler = FrameHandler(StubRecognizer(), make_tracker(cfg), None, None, cfg)
+    handler.suppress_replayed([(1, "entry"), (1, "entry"), (2, "exit")], until_frame=10)
+    for fid, etype, frame_idx in [(1, "entry", 3), (1, "entry", 4), (1, "entry", 5),
+                                  (2, "exit", 6), (3, "entry", 7), (2, "exit", 11)]:
+        handler._log_event(fid, etype, [0, 0, 1, 1], None, frame_idx)
+    # only the events stored before the crash are skipped, and only inside the replay window
+    assert logged == [(1, "entry"), (3, "entry"), (2, "exit")]
+
+def test_replay_watermark_is_per_video(cfg):
+    init_db("w.db")
+    db = Database("w.db")
+    try:
+        db.insert_events([(1, "entry", "t", None, "video-a", 5), (2, "entry", "t", None, "video-b", 5)])
+        watermark = db.max_event_id()
+        db.insert_events([(1, "exit", "t", None, "video-a", 9), (2, "exit", "t", None, "video-b", 9),
+                          (3, "entry", "t", None, None, 9)])
+        assert db.events_since(watermark, "video-a") == [(1, "exit", 9)]
+        assert db.events_since(0, "video-b") == [(2, "entry", 5), (2, "exit", 9)]
+    finally:
+        db.close()